@@ -5,18 +5,21 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-from PIL import Image
-import os, io, base64, zipfile
+import os, io, base64, time
 from cryptography.fernet import Fernet
+import data_export, data_sources, page_assets, perf_tracker, production_analytics, rerun_profiler, shared_datasets, upload_ingest
+from cache_manager import cache
+
+# ========== PROFILER ==========
+# Execução marcada no painel de administração: a página inteira roda sob cProfile + tracemalloc
+if (_marcacao := rerun_profiler.claim("produção")): rerun_profiler.run_script("produção", __file__, globals(), _marcacao); st.stop()
+
+_t0 = time.perf_counter()
 
 # ========== CONFIG ==========
 st.set_page_config(layout="wide", page_title="Dashboard de Produção Tupacery")
 st.markdown("<style>.kpi-card{background:#262626;padding:1rem;border-radius:.5rem;border:1px solid #444}</style>", unsafe_allow_html=True)
 
-def is_valid_xlsx(b): 
-    try: return zipfile.is_zipfile(io.BytesIO(b))
-    except: return False
-
 # ========== CRYPTO ==========
 HEX_KEY_STRING = st.secrets.get("HEX_KEY_STRING")
 fernet = None
@@ -28,111 +31,90 @@ else: st.error("❌ HEX_KEY_STRING ausente")
 # ========== CONSTANTS ==========
 ARQUIVO_CRYPT = "Informativo_Operacional.encrypted"
 LOGO_PATH = "Lhg-02.png"
-ABA = "BD_Real"
-COL_MAP = {
-    '2025_Data': 'data',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 01_Lump': 'pm01_lump',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 01_Hemat': 'pm01_hematita',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 01_Sinter Feed\nNP': 'pm01_sinter',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 04_Lump': 'pm04_lump',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 04_Hemat': 'pm04_hematita',
-    'PENEIRAMENTO MSC_Santa Cruz - Tupacery PM 04_Sinter Feed\nNP': 'pm04_sinter',
-}
-META_PM, META_LUMP_PM = 5000, 3240
+PENEIRAS = production_analytics.PENEIRAS
+META_PM, META_LUMP_PM = production_analytics.META_DIA, production_analytics.META_LUMP_DIA
 META_SINTER_PM = META_PM - META_LUMP_PM
-META_TOTAL, META_LUMP_TOTAL, META_SINTER_TOTAL = META_PM*2, META_LUMP_PM*2, META_SINTER_PM*2
-ESTOQUE_INI, DATA_EST_INI = 189544, datetime(2025, 9, 16).date()
+META_TOTAL, META_LUMP_TOTAL, META_SINTER_TOTAL = META_PM*len(PENEIRAS), META_LUMP_PM*len(PENEIRAS), META_SINTER_PM*len(PENEIRAS)
+ESTOQUE_INI, DATA_EST_INI = production_analytics.ESTOQUE_INICIAL, production_analytics.DATA_ESTOQUE_INICIAL
+DIAS_BOOTSTRAP, CENARIOS_ESTOQUE = production_analytics.DIAS_BOOTSTRAP, production_analytics.CENARIOS_ESTOQUE  # Previsão de esgotamento: dias de histórico sorteados e nº de cenários
 
 # ========== UTILS ==========
 def fmt_br(n, dec=0): return f"{n:,.{dec}f}".replace(',', '.') if pd.notna(n) and n != 0 else "0"
+def fmt_pct(n): return f"{n:.1f}%".replace('.', ',')
 def fmt_br_dec(n, dec=2): return f"{n:,.{dec}f}".replace(',', '|').replace('.', ',').replace('|', '.') if pd.notna(n) and n != 0 else "0"
 
 # ========== I/O ==========
-def ler_arquivo_local(path):
-    if not os.path.exists(path): return None
-    try:
-        stat = os.stat(path)
-        cache_key = f"{path}_{stat.st_size}_{stat.st_mtime}"
-        if 'file_cache' not in st.session_state: st.session_state['file_cache'] = {}
-        if cache_key in st.session_state['file_cache']: return st.session_state['file_cache'][cache_key]
-        with open(path, "rb") as f: data = f.read()
-        st.session_state['file_cache'] = {cache_key: data}
-        return data
-    except Exception as e: st.error(f"Erro {path}: {e}"); return None
-
 def decrypt_data(cipher_bytes): 
     try: return fernet.decrypt(cipher_bytes)
     except Exception as e: st.error(f"Erro decrypt: {e}"); return None
 
-@st.cache_data(ttl=300)
-def load_excel(excel_bytes):
-    try:
-        df = pd.read_excel(io.BytesIO(excel_bytes), sheet_name=ABA, header=[0,1,2])
-        df.columns = ['_'.join([str(c) for c in col if 'Unnamed' not in str(c)]).strip() for col in df.columns]
-        df = df.rename(columns={k: v for k, v in COL_MAP.items() if k in df.columns})
-        
-        cols_keep = [col for col in COL_MAP.values() if col in df.columns]
-        if 'data' not in cols_keep: st.error("Coluna 'data' não encontrada"); return None
-        
-        df = df[cols_keep].dropna(subset=['data'], how='all')
-        df['data'] = pd.to_datetime(df['data'], errors='coerce')
-        df = df.dropna(subset=['data'])
-        
-        for col in df.columns:
-            if col != 'data': df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        df['total_dia'] = sum(df.get(col, 0) for col in ['pm01_lump', 'pm01_hematita', 'pm01_sinter', 'pm04_lump', 'pm04_hematita', 'pm04_sinter'])
-        return df
+def processar_excel(excel_bytes):
+    try: return data_sources.parse_production(excel_bytes)
     except Exception as e: st.error(f"Erro Excel: {e}"); return None
 
+def ler_planilha_local(path):
+    """Builder do dataset compartilhado: lê, descriptografa e processa o arquivo do repositório"""
+    try:
+        with open(path, "rb") as f: cipher_bytes = f.read()
+    except Exception as e: st.error(f"Erro {path}: {e}"); return None
+    plain_bytes = decrypt_data(cipher_bytes)
+    return processar_excel(plain_bytes) if plain_bytes else None
+
+def ler_planilha_upload(path):
+    """Builder do dataset de um upload: descriptografa (ou aceita XLSX sem criptografia) e processa"""
+    plain_bytes, criptografado = upload_ingest.read_upload(path, fernet)
+    if plain_bytes is None: st.error("Arquivo inválido: não é um .encrypted desta chave nem um XLSX"); return None
+    if not criptografado: st.warning("⚠️ Lido como XLSX sem criptografia")
+    return processar_excel(plain_bytes)
+
 def carregar_dados():
-    if not fernet: st.error("Fernet indisponível"); return None
+    """Devolve (df, versão); a versão identifica os dados nos caches derivados"""
+    if not fernet: st.error("Fernet indisponível"); return None, None
     
-    cipher_bytes = ler_arquivo_local(ARQUIVO_CRYPT)
-    if cipher_bytes:
+    if os.path.exists(ARQUIVO_CRYPT):
         st.success(f"✅ Dados: {ARQUIVO_CRYPT}")
-        plain_bytes = decrypt_data(cipher_bytes)
-        if plain_bytes:
-            df = load_excel(plain_bytes)
-            if df is not None:
-                try: st.info(f"📅 Última atualização: {datetime.fromtimestamp(os.stat(ARQUIVO_CRYPT).st_mtime).strftime('%d/%m/%Y às %H:%M:%S')}")
-                except: pass
-                return df
+        # Dataset compartilhado entre processos: só o primeiro a ver a versão descriptografa e processa
+        versao = shared_datasets.file_version(ARQUIVO_CRYPT)
+        df = shared_datasets.load_or_publish("producao", versao, lambda: ler_planilha_local(ARQUIVO_CRYPT))
+        if df is not None:
+            try: st.info(f"📅 Última atualização: {datetime.fromtimestamp(os.stat(ARQUIVO_CRYPT).st_mtime).strftime('%d/%m/%Y às %H:%M:%S')}")
+            except: pass
+            return df, versao
     
     st.warning("⚠️ Arquivo não encontrado. Upload:")
     up = st.file_uploader("Arquivo criptografado", type=["encrypted", "bin", "xlsx"])
     if up:
-        st.write(f"📁 {up.name} ({len(up_bytes := up.read())} bytes)")
-        plain_bytes = decrypt_data(up_bytes)
-        if plain_bytes:
-            st.success("🔓 Descriptografado!")
-            return load_excel(plain_bytes)
-        elif is_valid_xlsx(up_bytes):
-            st.warning("⚠️ Tentando XLSX...")
-            df = load_excel(up_bytes)
-            if df is not None: st.info("📈 Lido sem criptografia"); return df
-    return None
+        st.write(f"📁 {up.name} ({up.size} bytes)")
+        # Upload gravado em disco e identificado pelo digest: conteúdos iguais são processados uma única vez
+        df, versao, reaproveitado = upload_ingest.ingest("producao", up, ler_planilha_upload, up.file_id)
+        if df is not None: st.success("♻️ Upload já processado" if reaproveitado else "🔓 Upload processado"); return df, versao
+    return None, None
 
 # ========== UI ==========
 try:
-    if os.path.exists(LOGO_PATH): st.image(Image.open(LOGO_PATH), width=200)
+    if os.path.exists(LOGO_PATH): st.image(page_assets.reduced_logo(LOGO_PATH), width=200)
     else: st.info("Logo não encontrada")
 except: st.info("Falha logo")
 
 st.title("Dashboard de Produção - Peneiras Móveis Tupacery")
 st.markdown("---")
 
-df = carregar_dados()
+df, versao_dados = carregar_dados()
 if df is None: st.error("❌ Não foi possível carregar dados"); st.stop()
 
+# Médias móveis de todo o histórico (estendidas só com os dias novos a cada versão)
+motor = cache.get_or_compute("produção", ("rolling", versao_dados), lambda: production_analytics.rolling_engine("producao", df), version=versao_dados)
+# Cubo dia × peneira × produto para totais, metas e mix por redução de eixos
+cubo = cache.get_or_compute("produção", ("cubo", versao_dados), lambda: production_analytics.ProductionCube(df), version=versao_dados)
+
 # ========== SIDEBAR ==========
 st.sidebar.header("Filtros de Análise")
-if os.path.exists(LOGO_PATH): st.sidebar.image(LOGO_PATH, use_container_width=True)
+if os.path.exists(LOGO_PATH): st.sidebar.image(page_assets.reduced_logo(LOGO_PATH), use_container_width=True)
 
 df_prod = df[df['total_dia'] > 0]
 if df_prod.empty: st.warning("Sem dias produtivos"); st.stop()
 
-data_inicio, data_fim = datetime(2025, 8, 26).date(), df_prod['data'].max().date()
+data_inicio, data_fim = production_analytics.INICIO_ANALISE, df_prod['data'].max().date()
 data_sel = st.sidebar.date_input("Período", value=(data_inicio, data_fim), min_value=data_inicio, max_value=df['data'].max().date(), format="DD/MM/YYYY")
 
 st.sidebar.markdown("---")
@@ -147,6 +129,8 @@ st.sidebar.markdown(f"- Lump: `{fmt_br(META_LUMP_TOTAL)} t`")
 st.sidebar.markdown(f"- Sinter: `{fmt_br(META_SINTER_TOTAL)} t`")
 st.sidebar.markdown("---")
 st.sidebar.info("🔄 Dados atualizados automaticamente")
+modo_whatif = st.sidebar.toggle("🎛️ Simulador de metas (what-if)", value=False, help="Ajuste metas diárias por peneira e o estoque inicial sem alterar o restante do painel")
+modo_progressivo = st.sidebar.toggle("⚡ Renderização progressiva", value=True, help="KPIs primeiro; estatísticas detalhadas só quando expandidas")
 
 # ========== FILTER DATA ==========
 if isinstance(data_sel, tuple) and len(data_sel) == 2:
@@ -157,78 +141,78 @@ else: df_filt = df.copy()
 if df_filt.empty: st.warning("Período sem dados"); st.stop()
 
 # ========== CALCULATIONS ==========
-df_filt['total_pm01'] = df_filt.get('pm01_lump', 0) + df_filt.get('pm01_hematita', 0) + df_filt.get('pm01_sinter', 0)
-df_filt['total_pm04'] = df_filt.get('pm04_lump', 0) + df_filt.get('pm04_hematita', 0) + df_filt.get('pm04_sinter', 0)
-df_filt['total_lump'] = df_filt.get('pm01_lump', 0) + df_filt.get('pm04_lump', 0)
-df_filt['total_hematita'] = df_filt.get('pm01_hematita', 0) + df_filt.get('pm04_hematita', 0)
-df_filt['total_sinter'] = df_filt.get('pm01_sinter', 0) + df_filt.get('pm04_sinter', 0)
-df_filt['media_movel_7d'] = df_filt['total_dia'].rolling(7, min_periods=1).mean()
-
-df_prod_filt = df_filt[df_filt['total_dia'] > 0].copy()
-dias_prod_comb = len(df_prod_filt)
-
-if dias_prod_comb > 0:
-    dias_prod_pm01 = (df_prod_filt['total_pm01'] > 0).sum()
-    dias_prod_pm04 = (df_prod_filt['total_pm04'] > 0).sum()
-    
-    prod_total_pm01, prod_total_pm04, prod_total_comb = df_prod_filt['total_pm01'].sum(), df_prod_filt['total_pm04'].sum(), df_prod_filt['total_dia'].sum()
-    media_pm01 = prod_total_pm01 / dias_prod_pm01 if dias_prod_pm01 > 0 else 0
-    media_pm04 = prod_total_pm04 / dias_prod_pm04 if dias_prod_pm04 > 0 else 0
-    media_comb = prod_total_comb / dias_prod_comb
-    
-    ultimo_dia_df = df_prod_filt[df_prod_filt['data'].dt.date == df_prod_filt['data'].max().date()]
-    prod_ult_pm01, prod_ult_pm04, prod_ult_comb = ultimo_dia_df['total_pm01'].sum(), ultimo_dia_df['total_pm04'].sum(), ultimo_dia_df['total_dia'].sum()
-    
-    meta_total_pm01, meta_total_pm04 = META_PM * dias_prod_pm01, META_PM * dias_prod_pm04
-    meta_total_comb = meta_total_pm01 + meta_total_pm04
-    
-    ating_pm01 = (prod_total_pm01 / meta_total_pm01) * 100 if meta_total_pm01 > 0 else 0
-    ating_pm04 = (prod_total_pm04 / meta_total_pm04) * 100 if meta_total_pm04 > 0 else 0
-    ating_comb = (prod_total_comb / meta_total_comb) * 100 if meta_total_comb > 0 else 0
-else:
-    prod_total_pm01 = prod_total_pm04 = prod_total_comb = 0
-    media_pm01 = media_pm04 = media_comb = 0
-    prod_ult_pm01 = prod_ult_pm04 = prod_ult_comb = 0
-    ating_pm01 = ating_pm04 = ating_comb = 0
+df_filt = production_analytics.add_totals(df_filt)
+fim_filt = df_filt['data'].max()
+# Recorte da média móvel do histórico completo: o início do período não tem janela truncada
+df_filt['media_movel_7d'] = df_filt['data'].dt.normalize().map(motor.series('total_dia', 7, inicio=df_filt['data'].min(), fim=fim_filt)).to_numpy()
 
-# ========== STOCK CALC ==========
-df_consumo = df[df['data'].dt.date > DATA_EST_INI]
-prod_consumida = df_consumo['total_dia'].sum()
-estoque_atual = ESTOQUE_INI - prod_consumida
-ritmo_atual = df_filt['media_movel_7d'].iloc[-1] if not df_filt.empty else 0
-dias_restantes = (estoque_atual / ritmo_atual) if ritmo_atual > 0 else 0
+resumo = cubo.summary(df_filt['data'].min(), fim_filt, META_PM, META_LUMP_PM)
+comb = resumo.loc['comb']
+dias_prod_comb = int(comb['dias'])
+
+# ========== EXPORT ==========
+# Recorte do período exportado em blocos; o arquivo só é gerado no clique, fora do rerun
+st.sidebar.markdown("---")
+st.sidebar.header("📥 Exportar Dados")
+fmt_export = st.sidebar.radio("Formato", list(data_export.FORMATOS), horizontal=True, key="export_format", format_func=lambda f: data_export.FORMATOS[f][0])
+st.sidebar.download_button(f"⬇️ Baixar {len(df_filt)} dias", data=data_export.deferred(df_filt, fmt_export), file_name=data_export.file_name("producao", fmt_export),
+                           mime=data_export.FORMATOS[fmt_export][2], on_click="ignore", key="export_download")
+
+def grade(chaves, n=2):
+    """Distribui as chaves em linhas de ``n`` colunas, devolvendo (coluna, chave)"""
+    chaves = list(chaves)
+    for i in range(0, len(chaves), n):
+        yield from zip(st.columns(n), chaves[i:i + n])
 
 # ========== DASHBOARD ==========
 st.subheader("Painel de Indicadores (KPIs)")
 st.markdown("##### Visão Geral (Combinado)")
 col1, col2, col3, col4 = st.columns(4)
-col1.metric("Produção Total no Período", f"{fmt_br(prod_total_comb)} t")
-col2.metric("Média Diária (dias produtivos)", f"{fmt_br(media_comb)} t")
-col3.metric(f"Produção do Último Dia ({df_prod_filt['data'].max().strftime('%d/%m') if dias_prod_comb > 0 else 'N/A'})", f"{fmt_br(prod_ult_comb)} t")
-col4.metric("Atingimento Meta Combinada", f"{ating_comb:.1f}%".replace('.', ','))
+col1.metric("Produção Total no Período", f"{fmt_br(comb['producao'])} t")
+col2.metric("Média Diária (dias produtivos)", f"{fmt_br(comb['media'])} t")
+col3.metric(f"Produção do Último Dia ({resumo.attrs['ultima_data'].strftime('%d/%m') if dias_prod_comb > 0 else 'N/A'})", f"{fmt_br(comb['ultimo'])} t")
+col4.metric("Atingimento Meta Combinada", fmt_pct(comb['ating']))
+perf_tracker.since("produção", "tempo_ate_primeiro_kpi", _t0)
 
 st.markdown("---")
 st.markdown("##### Desempenho Individual (Por Peneira)")
 
-def render_pm_metrics(title, media, ultimo, ating):
+def render_pm_metrics(linha):
+    sigla = linha['rotulo']
     with st.container(border=True):
-        st.markdown(f"<h6 style='text-align: center;'>{title}</h6>", unsafe_allow_html=True)
+        st.markdown(f"<h6 style='text-align: center;'>Peneira Móvel {sigla.split()[-1]}</h6>", unsafe_allow_html=True)
         c1, c2, c3 = st.columns(3)
-        c1.metric(f"Média Diária {title[-4:]}", f"{fmt_br(media)} t")
-        c2.metric(f"Último Dia {title[-4:]}", f"{fmt_br(ultimo)} t")
-        c3.metric(f"Meta {title[-4:]}", f"{ating:.1f}%".replace('.', ','))
+        c1.metric(f"Média Diária {sigla}", f"{fmt_br(linha['media'])} t")
+        c2.metric(f"Último Dia {sigla}", f"{fmt_br(linha['ultimo'])} t")
+        c3.metric(f"Meta {sigla}", fmt_pct(linha['ating']))
 
-col1, col2 = st.columns(2)
-with col1: render_pm_metrics("Peneira Móvel 01", media_pm01, prod_ult_pm01, ating_pm01)
-with col2: render_pm_metrics("Peneira Móvel 04", media_pm04, prod_ult_pm04, ating_pm04)
+for col, pen in grade(PENEIRAS):
+    with col: render_pm_metrics(resumo.loc[pen])
 
 st.markdown("---")
+# ========== STOCK CALC ==========
+estoque = production_analytics.stock_status(df, motor, em=fim_filt)
+estoque_atual, prod_consumida, ritmo_atual, dias_restantes = (estoque[k] for k in ('estoque_atual', 'prod_consumida', 'ritmo_atual', 'dias_restantes'))
+
+# Esgotamento por bootstrap dos consumos diários recentes (inclui dias parados), ancorado no último dia produtivo, uma vez por versão
+ultima_data = production_analytics.last_productive_day(df)
+with perf_tracker.timer("produção", "previsao_esgotamento"):
+    modelo_estoque = cache.get_or_compute("produção", ("esgotamento", versao_dados), lambda: production_analytics.DepletionModel(production_analytics.recent_consumption(df, DIAS_BOOTSTRAP), CENARIOS_ESTOQUE), version=versao_dados)
+    previsao = modelo_estoque.forecast(estoque_atual)
+
 st.subheader("Previsão de Estoque & Ritmo Operacional")
 col1, col2, col3 = st.columns(3)
 col1.metric("Estoque Atual (Aprox.)", f"{fmt_br(estoque_atual)} t", f"-{fmt_br(prod_consumida)} t desde {DATA_EST_INI.strftime('%d/%m')}")
 col2.metric("Ritmo Atual (Média Móvel 7d)", f"{fmt_br(ritmo_atual)} t/dia")
 col3.metric("Previsão de Dias Restantes", f"{dias_restantes:.1f} dias".replace('.', ','))
 
+def fmt_esgotamento(dias): return (ultima_data + pd.Timedelta(days=dias)).strftime('%d/%m/%Y') if pd.notna(dias) else f"> {previsao['horizonte']} dias"
+col1, col2, col3 = st.columns(3)
+for col, p, rotulo in [(col1, 10, "Esgotamento P10 (mais cedo)"), (col2, 50, "Esgotamento P50"), (col3, 90, "Esgotamento P90 (mais tarde)")]:
+    dias = previsao['dias'][p]
+    col.metric(rotulo, fmt_esgotamento(dias), f"{fmt_br(dias)} dias" if pd.notna(dias) else None, delta_color="off")
+st.caption(f"Simulação de {fmt_br(previsao['cenarios'])} cenários sorteando o consumo diário dos últimos {DIAS_BOOTSTRAP} dias; {fmt_br_dec(previsao['fracao_esgota'] * 100, 1)}% esgotam no horizonte de {previsao['horizonte']} dias." if previsao['cenarios'] else "Previsão de esgotamento indisponível (sem estoque ou sem consumo no histórico recente).")
+
 st.markdown("---")
 st.subheader("Atingimento de Metas Individuais no Período")
 
@@ -240,13 +224,54 @@ def create_gauge(value, threshold, title, color):
     fig.update_layout(height=250, margin=dict(l=20, r=20, b=20, t=50), paper_bgcolor="rgba(0,0,0,0)", font={'color': "var(--text-color)"})
     return fig
 
-col1, col2 = st.columns(2)
-with col1: st.plotly_chart(create_gauge(prod_total_pm01, META_PM * max(1, dias_prod_pm01), "Meta Total PM 01", "#f47c20"), use_container_width=True)
-with col2: st.plotly_chart(create_gauge(prod_total_pm04, META_PM * max(1, dias_prod_pm04), "Meta Total PM 04", "#5A99E2"), use_container_width=True)
+for col, pen in grade(PENEIRAS):
+    linha = resumo.loc[pen]
+    with col: st.plotly_chart(create_gauge(linha['producao'], META_PM * max(1, linha['dias']), f"Meta Total {linha['rotulo']}", PENEIRAS[pen]['cores'][0]), use_container_width=True)
+
+# ========== WHAT-IF ==========
+# Fragmento: alterar uma meta recalcula só esta seção a partir das somas já agregadas no cubo e do modelo de estoque
+@st.fragment
+def simulador_metas(resumo, modelo_estoque, prod_consumida, ritmo_atual):
+    inicio = time.perf_counter()
+    st.markdown("---")
+    st.subheader("🎛️ Simulador de Metas (What-if)")
+    metas, metas_lump = {}, {}
+    for col, pen in grade(PENEIRAS, 3):
+        rot = PENEIRAS[pen]['rotulo']
+        with col:
+            metas[pen] = st.number_input(f"Meta diária {rot} (t)", min_value=0, value=META_PM, step=100, key=f"whatif_meta_{pen}")
+            metas_lump[pen] = st.number_input(f"Meta Lump {rot} (t)", min_value=0, value=META_LUMP_PM, step=100, key=f"whatif_lump_{pen}")
+    estoque_ini = st.number_input(f"Estoque inicial em {DATA_EST_INI.strftime('%d/%m/%Y')} (t)", min_value=0, value=ESTOQUE_INI, step=1000, key="whatif_estoque")
+    
+    por_pen = resumo.loc[list(PENEIRAS)]
+    meta = por_pen['dias'] * pd.Series(metas)
+    meta_lump = por_pen['dias'] * pd.Series(metas_lump)
+    ating = (por_pen['producao'] / meta * 100).where(meta > 0, 0.0)
+    ating_lump = (por_pen['lump'] / meta_lump * 100).where(meta_lump > 0, 0.0)
+    ating_comb = por_pen['producao'].sum() / meta.sum() * 100 if meta.sum() > 0 else 0.0
+    
+    col1, col2 = st.columns(2)
+    col1.metric("Atingimento Combinado (simulado)", fmt_pct(ating_comb), f"{fmt_br_dec(ating_comb - resumo.loc['comb', 'ating'], 1)} p.p.")
+    col2.metric("Meta Combinada no Período (simulada)", f"{fmt_br(meta.sum())} t", f"{fmt_br(meta.sum() - resumo.loc['comb', 'meta'])} t" if meta.sum() != resumo.loc['comb', 'meta'] else None, delta_color="off")
+    for col, pen in grade(PENEIRAS):
+        with col:
+            st.plotly_chart(create_gauge(por_pen.loc[pen, 'producao'], max(meta[pen], 1), f"Meta Simulada {PENEIRAS[pen]['rotulo']}", PENEIRAS[pen]['cores'][0]), use_container_width=True)
+            st.caption(f"Atingimento: {fmt_pct(ating[pen])} · Lump: {fmt_pct(ating_lump[pen])}")
+    
+    estoque_sim = estoque_ini - prod_consumida
+    prev = modelo_estoque.forecast(estoque_sim)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Estoque Simulado", f"{fmt_br(estoque_sim)} t")
+    col2.metric("Dias Restantes (MM7)", f"{estoque_sim / ritmo_atual:.1f} dias".replace('.', ',') if ritmo_atual > 0 else "N/D")
+    for col, p in [(col3, 10), (col4, 90)]:
+        col.metric(f"Esgotamento P{p}", fmt_esgotamento(prev['dias'][p]))
+    st.caption(f"Esgotamento P50: {fmt_esgotamento(prev['dias'][50])} · recalculado em {fmt_br_dec(perf_tracker.since('produção', 'simulador_metas', inicio), 1)} ms")
+
+if modo_whatif: simulador_metas(resumo, modelo_estoque, prod_consumida, ritmo_atual)
 
 st.markdown("---")
 st.subheader("Evolução da Produção Diária Empilhada por Produto")
-fig_prod = px.bar(df_filt, x='data', y=['total_lump', 'total_sinter', 'total_hematita'], title="Produção Diária Empilhada (PM01 + PM04)",
+fig_prod = px.bar(df_filt, x='data', y=['total_lump', 'total_sinter', 'total_hematita'], title=f"Produção Diária Empilhada ({' + '.join(cfg['rotulo'] for cfg in PENEIRAS.values())})",
                   labels={'value': 'Produção (t)', 'variable': 'Produto', 'data': 'Data'},
                   color_discrete_map={'total_lump': '#f47c20', 'total_sinter': '#5A99E2', 'total_hematita': '#A9A9A9'})
 fig_prod.add_trace(go.Scatter(x=df_filt['data'], y=df_filt['media_movel_7d'], mode='lines', name='Média Móvel 7 Dias', line=dict(color='yellow', width=3)))
@@ -257,59 +282,37 @@ st.markdown("---")
 st.subheader("Análise Detalhada por Peneira (Mix de Produtos)")
 
 def create_pie(values, title, colors):
-    fig = px.pie(values=values, names=['Lump', 'Hematita', 'Sinter Feed'], hole=0.4, color_discrete_sequence=colors)
-    fig.update_layout(template='plotly_dark', showlegend=title == "PM 04")
+    fig = px.pie(values=values, names=[rot for _, rot in production_analytics.TIPOS_PRODUTO.values()], hole=0.4, color_discrete_sequence=colors)
+    fig.update_layout(template='plotly_dark', showlegend=title == PENEIRAS[list(PENEIRAS)[-1]]['rotulo'])
     return fig
 
-col1, col2 = st.columns(2)
-with col1:
-    st.markdown("<h5 style='text-align: center;'>Mix de Produtos - PM 01</h5>", unsafe_allow_html=True)
-    pm01_vals = [df_prod_filt.get(f'pm01_{p}', pd.Series(dtype=float)).sum() for p in ['lump', 'hematita', 'sinter']]
-    st.plotly_chart(create_pie(pm01_vals, "PM 01", ['#f47c20', '#ff9a51', '#ffb885']), use_container_width=True)
-
-with col2:
-    st.markdown("<h5 style='text-align: center;'>Mix de Produtos - PM 04</h5>", unsafe_allow_html=True)
-    pm04_vals = [df_prod_filt.get(f'pm04_{p}', pd.Series(dtype=float)).sum() for p in ['lump', 'hematita', 'sinter']]
-    st.plotly_chart(create_pie(pm04_vals, "PM 04", ['#5A99E2', '#87B5ED', '#B4D1F5']), use_container_width=True)
+for col, pen in grade(PENEIRAS):
+    linha = resumo.loc[pen]
+    with col:
+        st.markdown(f"<h5 style='text-align: center;'>Mix de Produtos - {linha['rotulo']}</h5>", unsafe_allow_html=True)
+        st.plotly_chart(create_pie([linha[f'mix_{prod}'] for prod in production_analytics.TIPOS_PRODUTO], linha['rotulo'], PENEIRAS[pen]['cores']), use_container_width=True)
 
 # ========== DETAILED STATS ==========
-with st.expander("Clique para ver Estatísticas Detalhadas da Produção"):
-    def tendencia_semana(serie): 
-        if len(serie) < 14: return 0.0
-        ult7, penult7 = serie.iloc[-7:].mean(), serie.iloc[-14:-7].mean()
-        return ((ult7 - penult7) / penult7 * 100) if penult7 > 0 else 0.0
-    
-    ritmo_pm01_7d = df_prod_filt['total_pm01'].rolling(7, min_periods=1).mean().iloc[-1] if not df_prod_filt.empty else 0
-    ritmo_pm04_7d = df_prod_filt['total_pm04'].rolling(7, min_periods=1).mean().iloc[-1] if not df_prod_filt.empty else 0
-    
-    tend_pm01 = tendencia_semana(df_prod_filt['total_pm01'])
-    tend_pm04 = tendencia_semana(df_prod_filt['total_pm04'])
-    tend_comb = tendencia_semana(df_prod_filt['total_dia'])
-    
-    proj_adic_pm01 = ritmo_pm01_7d * dias_restantes if ritmo_pm01_7d > 0 and dias_restantes > 0 else 0
-    proj_adic_pm04 = ritmo_pm04_7d * dias_restantes if ritmo_pm04_7d > 0 and dias_restantes > 0 else 0
-    proj_adic_comb = ritmo_atual * dias_restantes if ritmo_atual > 0 and dias_restantes > 0 else 0
+# Em modo progressivo, as estatísticas só são calculadas com o expander aberto
+exp_stats = st.expander("Clique para ver Estatísticas Detalhadas da Produção", key="exp_stats_prod", on_change="rerun")
+if exp_stats.open or not modo_progressivo:
+    with exp_stats:
+        # Ritmo e tendência sobre os dias produtivos do histórico completo, até o fim do período
+        linhas = []
+        for chave, linha in resumo.iloc[[-1] + list(range(len(PENEIRAS)))].iterrows():
+            total = 'total_dia' if chave == 'comb' else f'total_{chave}'
+            ritmo = ritmo_atual if chave == 'comb' else motor.value(total, 7, base='produtivo', em=fim_filt) if dias_prod_comb > 0 else 0
+            proj_ad = ritmo * dias_restantes if ritmo > 0 and dias_restantes > 0 else 0
+            proj_tot = linha['producao'] + proj_ad
+            proj_at = (proj_tot / linha['meta'] * 100) if linha['meta'] > 0 else 0
+            linhas.append({
+                'Entidade': linha['rotulo'].replace(' ', '') if chave != 'comb' else linha['rotulo'], 'Produção Total (t)': fmt_br(linha['producao']), 'Meta Total (t)': fmt_br(linha['meta']),
+                'Média Diária (t/dia)': fmt_br(linha['media']), 'Ritmo MM7 (t/dia)': fmt_br(ritmo),
+                'Tendência 7d vs 7d ant.': fmt_pct(motor.trend(total, fim_filt)), 'Atingimento Meta (%)': fmt_pct(linha['ating']), 'Ating. Meta Lump (%)': fmt_pct(linha['ating_lump']),
+                'Proj. Adicional (t)': fmt_br(proj_ad), 'Proj. Total (t)': fmt_br(proj_tot), 'Proj. Ating. (%)': fmt_pct(proj_at)
+            })
     
-    proj_total_pm01, proj_total_pm04, proj_total_comb = prod_total_pm01 + proj_adic_pm01, prod_total_pm04 + proj_adic_pm04, prod_total_comb + proj_adic_comb
-    proj_ating_pm01 = (proj_total_pm01 / meta_total_pm01 * 100) if meta_total_pm01 > 0 else 0
-    proj_ating_pm04 = (proj_total_pm04 / meta_total_pm04 * 100) if meta_total_pm04 > 0 else 0
-    proj_ating_comb = (proj_total_comb / meta_total_comb * 100) if meta_total_comb > 0 else 0
-    
-    dados = [
-        ['Combinado', prod_total_comb, meta_total_comb, media_comb, ritmo_atual, tend_comb, ating_comb, proj_adic_comb, proj_total_comb, proj_ating_comb],
-        ['PM01', prod_total_pm01, meta_total_pm01, media_pm01, ritmo_pm01_7d, tend_pm01, ating_pm01, proj_adic_pm01, proj_total_pm01, proj_ating_pm01],
-        ['PM04', prod_total_pm04, meta_total_pm04, media_pm04, ritmo_pm04_7d, tend_pm04, ating_pm04, proj_adic_pm04, proj_total_pm04, proj_ating_pm04],
-    ]
-    
-    linhas = []
-    for linha in dados:
-        ent, prod, meta, med, ritmo, tend, ating, proj_ad, proj_tot, proj_at = linha
-        linhas.append({
-            'Entidade': ent, 'Produção Total (t)': fmt_br(prod), 'Meta Total (t)': fmt_br(meta),
-            'Média Diária (t/dia)': fmt_br(med), 'Ritmo MM7 (t/dia)': fmt_br(ritmo),
-            'Tendência 7d vs 7d ant.': f"{tend:.1f}%".replace('.', ','), 'Atingimento Meta (%)': f"{ating:.1f}%".replace('.', ','),
-            'Proj. Adicional (t)': fmt_br(proj_ad), 'Proj. Total (t)': fmt_br(proj_tot), 'Proj. Ating. (%)': f"{proj_at:.1f}%".replace('.', ',')
-        })
-    
-    st.markdown("#### Resumo Estatístico por Entidade")
-    st.dataframe(pd.DataFrame(linhas), use_container_width=True)
\ No newline at end of file
+        st.markdown("#### Resumo Estatístico por Entidade")
+        st.dataframe(pd.DataFrame(linhas), use_container_width=True)
+
+perf_tracker.since("produção", "renderizacao_total", _t0)
@@ -4,9 +4,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-from PIL import Image
-import os, io, base64, zipfile, re, unicodedata
+import os, io, base64, time
 from cryptography.fernet import Fernet
+import data_export, data_sources, page_assets, perf_tracker, quality_analytics, quality_history, rerun_profiler, shared_datasets, upload_ingest
+import plotly.graph_objects as go
+from cache_manager import cache
+
+# ========== PROFILER ==========
+# Execução marcada no painel de administração: a página inteira roda sob cProfile + tracemalloc
+if (_marcacao := rerun_profiler.claim("qualidade")): rerun_profiler.run_script("qualidade", __file__, globals(), _marcacao); st.stop()
+
+_t0 = time.perf_counter()
 
 # ========== CONFIGURAÇÃO ==========
 st.set_page_config(layout="wide", page_title="Dashboard de Qualidade Tupacery")
@@ -27,206 +35,81 @@ else:
 # ========== CONSTANTES ==========
 ARQUIVO_CRYPT = "Relatorio_Qualidade.encrypted"
 LOGO_PATH = "Lhg-02.png"
-ABA_QUALIDADE = "RESUMO GR"
 INDICADORES = ['Fe', 'SiO2', 'Al2O3', 'TMP', '>31_5mm', '<0_15mm']
+# Especificações iniciais (LIE, LSE) para Cp/Cpk; ajustáveis na barra lateral
+ESPECIFICACOES = {'Fe': (62.0, None), 'SiO2': (None, 6.5), 'Al2O3': (None, 2.0), 'TMP': (8.0, 30.0), '>31_5mm': (None, 10.0), '<0_15mm': (None, 10.0)}
 
 # ========== FUNÇÕES UTILITÁRIAS ==========
 def fmt_num(val, dec=2): return f"{float(val):,.{dec}f}".replace(",", "X").replace(".", ",").replace("X", ".") if pd.notna(val) else "N/D"
 def fmt_pct(val): return f"{fmt_num(val, 2)}%" if pd.notna(val) else "N/D"
 def fmt_med(val, unit="mm"): return f"{fmt_num(val, 2)} {unit}" if pd.notna(val) else "N/D"
 
-def norm_text(x):
-    x = ''.join(c for c in unicodedata.normalize('NFD', str(x).strip().lower()) if unicodedata.category(c) != 'Mn')
-    return re.sub(r'\s+', ' ', x.replace('%', '').replace('(', '').replace(')', '').replace(',', '.'))
-
-def map_col(col):
-    s = norm_text(col)
-    mappings = {r'\bfe\b': 'Fe', r'sio2|si o2|silica': 'SiO2', r'al2o3|alumina': 'Al2O3', 
-                r'\bp\b': 'P', r'\bmn\b': 'Mn', r'ton': 'Ton', r'loi': 'LOI', r'\bmm\b': 'TMP',
-                r'(\+|>) *31(\.|,)5': '>31_5mm', r'- *12(?!.*umidade)': '_col1', r'- *6(\.|,)3': '_col2',
-                r'total': 'TOTAL', r'data': 'Data'}
-    for pattern, replacement in mappings.items():
-        if re.search(pattern, s): return replacement
-    return col.strip()
-
-def is_valid_xlsx(b): 
-    try: return zipfile.is_zipfile(io.BytesIO(b))
-    except: return False
+MESES_ABREV = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+def rotulo_mes(ts): return f"{MESES_ABREV[ts.month - 1]}/{ts.year}"
+def unidade(ind): return '%' if ind in ['Fe', 'SiO2', 'Al2O3', '>31_5mm', '<0_15mm'] else 'mm' if ind == 'TMP' else ''
 
 # ========== I/O FUNCTIONS ==========
-def ler_arquivo_local(path):
-    if not os.path.exists(path): return None
-    try:
-        stat = os.stat(path)
-        cache_key = f"{path}_{stat.st_size}_{stat.st_mtime}"
-        if 'file_cache' not in st.session_state: st.session_state['file_cache'] = {}
-        if cache_key in st.session_state['file_cache']: return st.session_state['file_cache'][cache_key]
-        with open(path, "rb") as f: data = f.read()
-        st.session_state['file_cache'] = {cache_key: data}
-        return data
-    except Exception as e: st.error(f"Erro ao ler {path}: {e}"); return None
-
 def decrypt_data(cipher_bytes): 
     try: return fernet.decrypt(cipher_bytes)
     except Exception as e: st.error(f"Erro decrypt: {e}"); return None
 
 # ========== PROCESSAMENTO DE DADOS ==========
-def flatten_cols(df):
-    if not isinstance(df.columns, pd.MultiIndex): return df
-    new_cols = []
-    for col in df.columns:
-        if isinstance(col, tuple):
-            a, b = col
-            a_txt = '' if pd.isna(a) else str(a).strip()
-            b_txt = '' if pd.isna(b) else str(b).strip()
-            new_cols.append(b_txt if b_txt else a_txt if a_txt else f"{a}_{b}")
-        else: new_cols.append(str(col))
-    df.columns = new_cols
-    return df
-
-def process_block(df_block):
-    df_block = flatten_cols(df_block)
-    df_block.rename(columns={c: map_col(c) for c in df_block.columns}, inplace=True)
-    
-    # Fix duplicate columns
-    cols, seen, new_cols = list(df_block.columns), {}, []
-    for c in cols:
-        if c in seen: seen[c] += 1; new_cols.append(f"{c}_{seen[c]}")
-        else: seen[c] = 1; new_cols.append(c)
-    df_block.columns = new_cols
-    
-    # Find date column
-    date_col = next((c for c in df_block.columns if 'data' in norm_text(c)), df_block.columns[0])
-    df_block.rename(columns={date_col: 'Data'}, inplace=True)
-    
-    # Convert types
-    df_block['Data'] = pd.to_datetime(df_block['Data'], errors='coerce')
-    for col in df_block.columns:
-        if col != 'Data': df_block[col] = pd.to_numeric(df_block[col], errors='coerce')
-    
-    # Calculate <0_15mm
-    if '_col1' in df_block.columns and '_col2' in df_block.columns:
-        df_block['<0_15mm'] = df_block['_col1'].fillna(0) + df_block['_col2'].fillna(0)
-    
-    return df_block
+def ler_blocos(excel_bytes):
+    """Lê a aba RESUMO GR e devolve os blocos PMT 01/PMT 02 empilhados (coluna 'Peneira')"""
+    try: return data_sources.parse_quality(excel_bytes)
+    except Exception as e: st.error(f"Erro ao processar dados: {e}"); return None
 
-@st.cache_data(ttl=300)
-def load_quality_data(excel_bytes):
-    try:
-        df_raw = pd.read_excel(io.BytesIO(excel_bytes), sheet_name=ABA_QUALIDADE, header=[0, 1], nrows=34, engine='openpyxl')
-        
-        # Detect blocks (simplified)
-        blocks = [(260, 267), (709, 716)]  # Default positions
-        try:
-            lvl1 = [norm_text(x) if not pd.isna(x) else '' for x in df_raw.columns.get_level_values(1)]
-            starts = [i for i, v in enumerate(lvl1) if 'data' in v]
-            if len(starts) >= 2:
-                blocks = [(starts[0], starts[1]-1), (starts[1], df_raw.shape[1]-1)][:2]
-        except: pass
-        
-        # Process blocks
-        s1, e1 = blocks[0]; s2, e2 = blocks[1]
-        pmt01 = process_block(df_raw.iloc[:, s1:e1+1].copy())
-        pmt02 = process_block(df_raw.iloc[:, s2:e2+1].copy())
-        
-        # Find last valid date
-        def last_valid_date(df):
-            if 'Ton' in df.columns:
-                mask = pd.to_numeric(df['Ton'], errors='coerce').fillna(0) > 0
-                if mask.any(): return df.loc[mask, 'Data'].max()
-            numeric_cols = [c for c in df.columns if c != 'Data']
-            if numeric_cols:
-                mask = df[numeric_cols].notna().any(axis=1)
-                if mask.any(): return df.loc[mask, 'Data'].max()
-            return df['Data'].dropna().max() if df['Data'].notna().any() else pd.NaT
-        
-        ultimo_dia = max([d for d in [last_valid_date(pmt01), last_valid_date(pmt02)] if not pd.isna(d)])
-        
-        # Get data for last day
-        def get_day_data(df, date):
-            try:
-                mask = df['Data'] == date
-                if mask.any(): return df.loc[mask].iloc[0].drop(labels='Data')
-            except: pass
-            if 'Ton' in df.columns:
-                try:
-                    mask = pd.to_numeric(df['Ton'], errors='coerce').fillna(0) > 0
-                    if mask.any(): return df.loc[mask].iloc[-1].drop(labels='Data')
-                except: pass
-            numeric_cols = [c for c in df.columns if c != 'Data']
-            mask = df[numeric_cols].notna().any(axis=1)
-            return df.loc[mask].iloc[-1].drop(labels='Data') if mask.any() else pd.Series([pd.NA] * len(numeric_cols), index=numeric_cols)
-        
-        row1, row2 = get_day_data(pmt01, ultimo_dia), get_day_data(pmt02, ultimo_dia)
-        
-        # Create day DataFrame
-        dia_data = {ind: [row1.get(ind, pd.NA), row2.get(ind, pd.NA)] for ind in INDICADORES}
-        dia = pd.DataFrame(dia_data, index=['PMT 01', 'PMT 02']).T
-        dia.loc['PRODUTO_DIA'] = [ultimo_dia, ultimo_dia]
-        
-        # Calculate monthly means (excluding zeros)
-        def calc_mean(df):
-            subset = df[pd.to_numeric(df.get('Ton', pd.Series([0])), errors='coerce').fillna(0) > 0] if 'Ton' in df.columns else df[df[[c for c in df.columns if c != 'Data']].notna().any(axis=1)]
-            means = {}
-            for ind in INDICADORES:
-                if ind in subset.columns:
-                    col = pd.to_numeric(subset[ind], errors='coerce').dropna()
-                    col = col[col != 0]
-                    means[ind] = col.mean() if not col.empty else pd.NA
-                else: means[ind] = pd.NA
-            return pd.Series(means)
-        
-        media = pd.DataFrame({'PMT 01': calc_mean(pmt01), 'PMT 02': calc_mean(pmt02)})
-        
-        # Boxplot data
-        pmt01['Peneira'] = 'PMT 01'; pmt02['Peneira'] = 'PMT 02'
-        boxplot_data = pd.concat([pmt01, pmt02], ignore_index=True)[lambda x: x['Data'].notna()].reset_index(drop=True)
-        
-        # Format month
-        meses = {'01': 'Janeiro', '02': 'Fevereiro', '03': 'Março', '04': 'Abril', '05': 'Maio', '06': 'Junho',
-                '07': 'Julho', '08': 'Agosto', '09': 'Setembro', '10': 'Outubro', '11': 'Novembro', '12': 'Dezembro'}
-        mm, yy = ultimo_dia.strftime('%m'), ultimo_dia.strftime('%Y')
-        mes_pt = f"{meses.get(mm, mm)}/{yy}"
-        
-        return dia, media, boxplot_data, mes_pt
+def resumir_qualidade(blocos):
+    """Deriva resultados do último dia, médias do mês, dados de boxplot e mês de referência"""
+    try: return quality_analytics.summarize_report(blocos)
     except Exception as e: st.error(f"Erro ao processar dados: {e}"); return None, None, None, None
 
+def ler_blocos_local(path):
+    """Builder do dataset compartilhado: lê, descriptografa e processa o arquivo do repositório"""
+    try:
+        with open(path, "rb") as f: cipher_bytes = f.read()
+    except Exception as e: st.error(f"Erro ao ler {path}: {e}"); return None
+    plain_bytes = decrypt_data(cipher_bytes)
+    return ler_blocos(plain_bytes) if plain_bytes else None
+
+def ler_blocos_upload(path):
+    """Builder do dataset de um upload: descriptografa (ou aceita XLSX sem criptografia) e processa"""
+    plain_bytes, criptografado = upload_ingest.read_upload(path, fernet)
+    if plain_bytes is None: st.error("Arquivo inválido: não é um .encrypted desta chave nem um XLSX"); return None
+    if not criptografado: st.warning("⚠️ Lido como XLSX sem criptografia")
+    return ler_blocos(plain_bytes)
+
 # ========== CARREGAMENTO DE DADOS ==========
 def load_data():
-    if not fernet: st.error("Fernet indisponível"); return None, None, None, None
+    """Devolve (dia, média, boxplot, mês, versão); a versão identifica os dados nos caches derivados"""
+    if not fernet: st.error("Fernet indisponível"); return None, None, None, None, None
     
-    # Try encrypted file from repo
-    cipher_bytes = ler_arquivo_local(ARQUIVO_CRYPT)
-    if cipher_bytes:
+    # Try encrypted file from repo (dataset compartilhado entre processos)
+    if os.path.exists(ARQUIVO_CRYPT):
         st.success(f"✅ Dados carregados: {ARQUIVO_CRYPT}")
-        plain_bytes = decrypt_data(cipher_bytes)
-        if plain_bytes:
-            result = load_quality_data(plain_bytes)
-            if result[0] is not None:
-                try: st.info(f"📅 Última atualização: {datetime.fromtimestamp(os.stat(ARQUIVO_CRYPT).st_mtime).strftime('%d/%m/%Y às %H:%M:%S')}")
-                except: pass
-                return result
+        versao = shared_datasets.file_version(ARQUIVO_CRYPT)
+        blocos = shared_datasets.load_or_publish("qualidade", versao, lambda: ler_blocos_local(ARQUIVO_CRYPT))
+        result = cache.get_or_compute("qualidade", ("resumo", versao), lambda: resumir_qualidade(blocos), version=versao) if blocos is not None else (None, None, None, None)
+        if result[0] is not None:
+            try: st.info(f"📅 Última atualização: {datetime.fromtimestamp(os.stat(ARQUIVO_CRYPT).st_mtime).strftime('%d/%m/%Y às %H:%M:%S')}")
+            except: pass
+            return (*result, versao)
     
     # Fallback: file upload
     st.warning("⚠️ Arquivo não encontrado. Faça upload:")
     up = st.file_uploader("Arquivo criptografado", type=["encrypted", "bin", "xlsx"], key="qual_up")
     if up:
-        st.write(f"📁 {up.name} ({len(up_bytes := up.read())} bytes)")
-        plain_bytes = decrypt_data(up_bytes)
-        if plain_bytes:
-            st.success("🔓 Descriptografado!")
-            result = load_quality_data(plain_bytes)
-            return result if result[0] is not None else (None, None, None, None)
-        elif is_valid_xlsx(up_bytes):
-            st.warning("⚠️ Tentando como XLSX...")
-            result = load_quality_data(up_bytes)
-            if result[0] is not None: st.info("📈 Lido sem criptografia"); return result
-    return None, None, None, None
+        st.write(f"📁 {up.name} ({up.size} bytes)")
+        # Upload gravado em disco e identificado pelo digest: conteúdos iguais são processados uma única vez
+        blocos, versao, reaproveitado = upload_ingest.ingest("qualidade", up, ler_blocos_upload, up.file_id)
+        result = cache.get_or_compute("qualidade", ("resumo", versao), lambda: resumir_qualidade(blocos), version=versao) if blocos is not None else (None, None, None, None)
+        if result[0] is not None: st.success("♻️ Upload já processado" if reaproveitado else "🔓 Upload processado"); return (*result, versao)
+    return None, None, None, None, None
 
 # ========== INTERFACE ==========
 # Logo
 try:
-    if os.path.exists(LOGO_PATH): st.image(Image.open(LOGO_PATH), width=200)
+    if os.path.exists(LOGO_PATH): st.image(page_assets.reduced_logo(LOGO_PATH), width=200)
     else: st.info("Logo não encontrada")
 except: st.info("Falha ao carregar logo")
 
@@ -234,7 +117,7 @@ st.title("Dashboard de Qualidade - Peneiras Móveis Tupacery")
 st.markdown("---")
 
 # Load data
-df_dia, df_media, df_box, mes_ref = load_data()
+df_dia, df_media, df_box, mes_ref, versao_dados = load_data()
 if df_dia is None: st.error("❌ Não foi possível carregar dados"); st.stop()
 
 # Store in session
@@ -244,9 +127,47 @@ for k, v in zip(['df_qualidade_dia', 'df_qualidade_media', 'df_boxplot', 'mes_re
 # Sidebar
 st.sidebar.header("🎯 Metas de Qualidade")
 st.sidebar.markdown(f"**📅 Mês: {mes_ref or 'N/D'}**")
+with st.sidebar.expander("📐 Especificações (Cp/Cpk)"):
+    especificacoes = {}
+    for ind, (lie, lse) in ESPECIFICACOES.items():
+        c1, c2 = st.columns(2)
+        especificacoes[ind] = (c1.number_input(f"{ind} LIE", value=lie, step=0.1, key=f"lie_{ind}"),
+                               c2.number_input(f"{ind} LSE", value=lse, step=0.1, key=f"lse_{ind}"))
 st.sidebar.markdown("---")
 st.sidebar.info("🔄 Dados atualizados automaticamente")
 
+# ========== HISTÓRICO MENSAL ==========
+# Grava as partições do relatório do repositório uma vez por versão e lê só os meses selecionados.
+# Uploads não entram no histórico (não podem sobrescrever os meses gravados): usam só os próprios meses.
+def gravar_historico():
+    try: quality_history.append(df_box, fernet); return None
+    except OSError as e: return str(e)
+do_repositorio = not str(versao_dados).startswith("upload-")
+if do_repositorio and (erro_hist := cache.get_or_compute("qualidade", ("historico_gravado", versao_dados), gravar_historico, version=versao_dados)):
+    st.warning(f"⚠️ Histórico mensal não atualizado: {erro_hist}")
+meses_box = sorted(pd.DatetimeIndex(df_box['Data'].dt.to_period('M').dt.to_timestamp().unique()))
+meses_hist = (quality_history.available_months() if do_repositorio else None) or meses_box
+if len(meses_hist) > 1:
+    ini_hist, fim_hist = st.sidebar.select_slider("📚 Meses do histórico", options=meses_hist, value=(meses_hist[-1], meses_hist[-1]), format_func=rotulo_mes)
+else: ini_hist = fim_hist = meses_hist[-1]
+meses_sel = [m for m in meses_hist if ini_hist <= m <= fim_hist]
+if do_repositorio: df_hist = cache.get_or_compute("qualidade", ("historico", tuple(meses_sel), quality_history.signature()), lambda: quality_history.load_months(meses_sel, fernet), version=versao_dados)
+else: df_hist = df_box[df_box['Data'].dt.to_period('M').dt.to_timestamp().isin(meses_sel)]
+if df_hist.empty: df_hist = df_box
+versao_hist = f"{versao_dados}|{rotulo_mes(ini_hist)}-{rotulo_mes(fim_hist)}"
+periodo_ref = mes_ref if ini_hist == fim_hist else f"{rotulo_mes(ini_hist)} a {rotulo_mes(fim_hist)}"
+
+# ========== EXPORTAÇÃO ==========
+# Relatório do mês (boxplot_data) ou histórico selecionado, gravados em blocos só no clique
+st.sidebar.markdown("---")
+st.sidebar.header("📥 Exportar Dados")
+conjuntos_export = {f"Relatório do mês ({mes_ref or 'N/D'})": ("qualidade_mes", df_box), f"Histórico ({periodo_ref})": ("qualidade_historico", df_hist)}
+conjunto_export = st.sidebar.selectbox("Conjunto", list(conjuntos_export), key="export_dataset")
+fmt_export = st.sidebar.radio("Formato", list(data_export.FORMATOS), horizontal=True, key="export_format", format_func=lambda f: data_export.FORMATOS[f][0])
+base_export, df_export = conjuntos_export[conjunto_export]
+st.sidebar.download_button(f"⬇️ Baixar {len(df_export)} linhas", data=data_export.deferred(df_export, fmt_export), file_name=data_export.file_name(base_export, fmt_export),
+                           mime=data_export.FORMATOS[fmt_export][2], on_click="ignore", key="export_download")
+
 # Get product day
 try: produto_dia_str = pd.to_datetime(df_dia.loc['PRODUTO_DIA', 'PMT 01']).strftime('%d/%m/%Y')
 except: produto_dia_str = 'N/D'
@@ -279,50 +200,107 @@ def render_metrics(df, pmt, title):
 col1, col2 = st.columns(2)
 with col1: render_metrics(df_dia, 'PMT 01', 'PMT 01 - TUPACERY')
 with col2: render_metrics(df_dia, 'PMT 02', 'PMT 02 - TUPACERY')
+perf_tracker.since("qualidade", "tempo_ate_primeiro_kpi", _t0)
 
 st.markdown("---")
 
 # ========== MÉDIA DO MÊS ==========
+def motor_ponderado(df_box, versao):
+    """Somas acumuladas ponderadas por Ton do período carregado, montadas uma vez por versão"""
+    return cache.get_or_compute("qualidade", ("ponderado", versao), lambda: quality_analytics.WeightedAggregator(df_box, INDICADORES), version=versao)
+
+@st.fragment
+def secao_media(motor, df_box):
+    # Janela padrão = período do relatório corrente; outras janelas custam só duas buscas nas somas acumuladas
+    minimo, maximo = pd.Timestamp(motor.datas[0]).date(), pd.Timestamp(motor.datas[-1]).date()
+    ini_rel, fim_rel = [min(max(d.date(), minimo), maximo) for d in (df_box['Data'].min(), df_box['Data'].max())]
+    janela = st.date_input("🗓️ Janela (médias ponderadas por tonelagem)", value=(ini_rel, fim_rel), min_value=minimo, max_value=maximo, key="janela_media")
+    ini, fim = (janela[0], janela[-1]) if janela else (ini_rel, fim_rel)
+    medias = motor.means(ini, fim)
+    col1, col2, col3 = st.columns(3)
+    with col1: render_metrics(medias, 'PMT 01', 'PMT 01 - TUPACERY')
+    with col2: render_metrics(medias, 'PMT 02', 'PMT 02 - TUPACERY')
+    with col3: render_metrics(medias, motor.BLEND, 'BLEND PMT 01 + PMT 02')
+
 st.subheader("📈 Média Geral do Mês")
-col1, col2 = st.columns(2)
-with col1: render_metrics(df_media, 'PMT 01', 'PMT 01 - TUPACERY')
-with col2: render_metrics(df_media, 'PMT 02', 'PMT 02 - TUPACERY')
+motor = motor_ponderado(df_hist, versao_hist)
+if not motor.vazio: secao_media(motor, df_box)
+else:
+    col1, col2 = st.columns(2)
+    with col1: render_metrics(df_media, 'PMT 01', 'PMT 01 - TUPACERY')
+    with col2: render_metrics(df_media, 'PMT 02', 'PMT 02 - TUPACERY')
 
 st.markdown("---")
 
 # ========== ANÁLISES ==========
-st.subheader("📊 Distribuição e Consistência da Qualidade no Mês")
+# Cada seção é um fragmento: trocar o indicador reexecuta só a própria seção
 
-if isinstance(df_box, pd.DataFrame) and not df_box.empty:
+def resumo_quantis(df_box, versao):
+    """Quartis/bigodes por Indicador × Peneira × Mês, calculados uma vez por versão dos dados"""
+    return cache.get_or_compute("qualidade", ("quantis", versao), lambda: quality_analytics.quantile_summary(df_box, INDICADORES), version=versao)
+
+def medianas_periodo(df_box, versao):
+    """Medianas exatas por Indicador × Peneira no período selecionado"""
+    return cache.get_or_compute("qualidade", ("medianas", versao), lambda: quality_analytics.period_medians(df_box, INDICADORES), version=versao)
+
+def fig_box_resumo(resumo, ind, titulo):
+    """Boxplot desenhado a partir dos quartis pré-calculados (sem enviar pontos brutos)"""
+    fig = go.Figure()
+    for pmt, grupo in resumo.groupby('Peneira'):
+        grupo = grupo.sort_values('Mes')
+        fig.add_trace(go.Box(
+            name=pmt, x=[rotulo_mes(m) for m in grupo['Mes']],
+            q1=grupo['q1'], median=grupo['mediana'], q3=grupo['q3'],
+            lowerfence=grupo['lim_inf'], upperfence=grupo['lim_sup'],
+            mean=grupo['media'], sd=grupo['desvio'].fillna(0), boxpoints=False))
+    fig.update_layout(template='plotly_white', height=500, showlegend=True, boxmode='group', title=titulo)
+    fig.update_yaxes(tickformat=',.2f', title=f"{ind} ({unidade(ind)})")
+    return fig
+
+def cep_qualidade(df_box, versao):
+    """Cartas I-MR/X̄-R e regras de Western Electric de todos os indicadores, uma vez por versão"""
+    return cache.get_or_compute("qualidade", ("cep", versao), lambda: quality_analytics.spc_analysis(df_box, INDICADORES), version=versao)
+
+def fig_carta(x, y, centro, lic, lsc, titulo, destaque=None, espec=(None, None)):
+    """Carta de controle com linha central, limites de 3σ, especificações e pontos fora de controle"""
+    fig = go.Figure(go.Scatter(x=x, y=y, mode='lines+markers', name='Valor', line=dict(color='#1f77b4')))
+    for nome, val, cor, estilo in [('LC', centro, 'green', 'solid'), ('LSC', lsc, 'red', 'dash'), ('LIC', lic, 'red', 'dash'), ('LIE', espec[0], 'orange', 'dot'), ('LSE', espec[1], 'orange', 'dot')]:
+        if val is not None and pd.notna(val): fig.add_hline(y=val, line_dash=estilo, line_color=cor, annotation_text=f"{nome} {fmt_num(val)}")
+    if destaque is not None and destaque.any():
+        fig.add_trace(go.Scatter(x=x[destaque], y=y[destaque], mode='markers', name='Fora de controle', marker=dict(color='red', size=11, symbol='x')))
+    fig.update_layout(template='plotly_white', height=320, title=titulo, showlegend=False, margin=dict(t=50, b=30))
+    fig.update_yaxes(tickformat=',.2f')
+    return fig
+
+# Cada seção é um fragmento: trocar o indicador reexecuta só a própria seção
+@st.fragment
+def secao_distribuicao(resumo, medianas, mes_ref):
+    inicio = time.perf_counter()
     ind_sel = st.selectbox("🎯 Selecione um Indicador", INDICADORES)
     if ind_sel:
-        df_box[ind_sel] = pd.to_numeric(df_box[ind_sel], errors='coerce')
-        df_plot = df_box.dropna(subset=[ind_sel, 'Data'])[lambda x: x[ind_sel] != 0].copy()
+        resumo_ind = resumo[resumo['Indicador'] == ind_sel]
         
-        if not df_plot.empty:
+        if not resumo_ind.empty:
             # Boxplot
-            fig_box = px.box(df_plot, x='Peneira', y=ind_sel, color='Peneira', points=False, 
-                           title=f"📊 Distribuição de {ind_sel} - {mes_ref}")
-            fig_box.update_layout(template='plotly_white', height=500, showlegend=True)
-            fig_box.update_yaxes(tickformat=',.2f', title=f"{ind_sel} ({'%' if ind_sel in ['Fe', 'SiO2', 'Al2O3', '>31_5mm', '<0_15mm'] else 'mm' if ind_sel == 'TMP' else ''})")
-            st.plotly_chart(fig_box, use_container_width=True)
+            st.plotly_chart(fig_box_resumo(resumo_ind, ind_sel, f"📊 Distribuição de {ind_sel} - {mes_ref}"), use_container_width=True)
             
-            # Stats
+            # Stats (combinados a partir dos resumos mensais)
             col1, col2 = st.columns(2)
             for col, pmt in [(col1, 'PMT 01'), (col2, 'PMT 02')]:
                 with col:
                     st.markdown(f"#### 📈 Estatísticas - {pmt}")
-                    data = df_plot[df_plot['Peneira'] == pmt][ind_sel]
-                    if not data.empty:
-                        for stat, func in [('Média', 'mean'), ('Mediana', 'median'), ('Desvio Padrão', 'std'), ('Mínimo', 'min'), ('Máximo', 'max')]:
-                            st.write(f"**{stat}:** {fmt_num(getattr(data, func)())}")
+                    linhas = resumo_ind[resumo_ind['Peneira'] == pmt]
+                    if not linhas.empty:
+                        stats = quality_analytics.pooled_stats(linhas)
+                        stats['mediana'] = medianas.get((ind_sel, pmt), float('nan'))
+                        for stat, chave in [('Média', 'media'), ('Mediana', 'mediana'), ('Desvio Padrão', 'desvio'), ('Mínimo', 'minimo'), ('Máximo', 'maximo')]:
+                            st.write(f"**{stat}:** {fmt_num(stats[chave])}")
                     else: st.info("Sem dados válidos")
+    perf_tracker.since("qualidade", "fragmento_distribuicao", inicio)
 
-# ========== TENDÊNCIAS ==========
-st.markdown("---")
-st.subheader("📈 Análise de Tendências Temporais")
-
-if isinstance(df_box, pd.DataFrame) and not df_box.empty:
+@st.fragment
+def secao_tendencias(df_box, mes_ref, cep, especificacoes):
+    inicio = time.perf_counter()
     ind_trend = st.selectbox("📊 Indicador para Tendência", INDICADORES, key="trend")
     if ind_trend:
         df_trend = df_box.copy()
@@ -347,6 +325,87 @@ if isinstance(df_box, pd.DataFrame) and not df_box.empty:
                         cv = (data.std() / data.mean()) * 100
                         st.metric(f"Coef. Variação - {pmt}", fmt_pct(cv))
                     else: st.metric(f"Coef. Variação - {pmt}", "N/D")
+            
+            # Controle estatístico de processo (limites e regras já calculados por versão)
+            if not cep['limites'].empty:
+                limites = cep['limites'].set_index(['Peneira', 'Indicador'])
+                capab = quality_analytics.capability(cep['limites'], especificacoes).set_index(['Peneira', 'Indicador'])
+                serie = cep['series'][cep['series']['Indicador'] == ind_trend]
+                regras = [f'regra_{k}' for k in quality_analytics.REGRAS_WE]
+                col1, col2 = st.columns(2)
+                for col, pmt in [(col1, 'PMT 01'), (col2, 'PMT 02')]:
+                    with col:
+                        if (pmt, ind_trend) not in limites.index: st.info(f"Sem dados de {pmt}"); continue
+                        lim, cap = limites.loc[(pmt, ind_trend)], capab.loc[(pmt, ind_trend)]
+                        s = serie[serie['Peneira'] == pmt]
+                        fora = s[regras].any(axis=1).to_numpy()
+                        m1, m2, m3 = st.columns(3)
+                        m1.metric("Cp", fmt_num(cap['Cp']))
+                        m2.metric("Cpk", fmt_num(cap['Cpk']))
+                        m3.metric("Pontos fora de controle", int(fora.sum()))
+                        aba_i, aba_xr = st.tabs(["Carta I-MR", "Carta X̄-R"])
+                        with aba_i:
+                            st.plotly_chart(fig_carta(s['Data'].to_numpy(), s['valor'].to_numpy(), lim['media'], lim['i_lcl'], lim['i_ucl'], f"Individuais - {pmt}", fora, especificacoes.get(ind_trend, (None, None))), use_container_width=True)
+                            st.plotly_chart(fig_carta(s['Data'].to_numpy(), s['mr'].to_numpy(), lim['mr_bar'], 0, lim['mr_ucl'], f"Amplitude Móvel - {pmt}"), use_container_width=True)
+                        with aba_xr:
+                            sub = cep['subgrupos'][(cep['subgrupos']['Peneira'] == pmt) & (cep['subgrupos']['Indicador'] == ind_trend)]
+                            if sub.empty: st.info(f"Menos de {quality_analytics.SUBGRUPO} dias consecutivos com dados")
+                            else:
+                                x_sub, med, amp = sub['Inicio'].to_numpy(), sub['media'].to_numpy(), sub['amplitude'].to_numpy()
+                                st.plotly_chart(fig_carta(x_sub, med, lim['xbarbar'], lim['xbar_lcl'], lim['xbar_ucl'], f"Médias (n={quality_analytics.SUBGRUPO}) - {pmt}", (med < lim['xbar_lcl']) | (med > lim['xbar_ucl'])), use_container_width=True)
+                                st.plotly_chart(fig_carta(x_sub, amp, lim['r_bar'], lim['r_lcl'], lim['r_ucl'], f"Amplitudes - {pmt}", amp > lim['r_ucl']), use_container_width=True)
+                violacoes = serie[serie[regras].any(axis=1)]
+                if not violacoes.empty:
+                    with st.expander(f"⚠️ Violações das regras de Western Electric ({len(violacoes)})"):
+                        tabela = violacoes.assign(Regras=violacoes[regras].apply(lambda r: "; ".join(quality_analytics.REGRAS_WE[int(c.split('_')[1])] for c in regras if r[c]), axis=1))
+                        st.dataframe(tabela[['Data', 'Peneira', 'valor', 'Regras']].rename(columns={'valor': ind_trend}), hide_index=True, use_container_width=True)
+    perf_tracker.since("qualidade", "fragmento_tendencias", inicio)
+
+def correlacoes(df_box, versao):
+    """Pearson/Spearman e defasagens de 0 a 7 dias de todos os indicadores, uma vez por versão"""
+    return cache.get_or_compute("qualidade", ("correlacoes", versao), lambda: quality_analytics.correlation_analysis(df_box, INDICADORES), version=versao)
+
+def fig_heatmap(matriz, titulo, x_titulo=None, y_titulo=None):
+    fig = px.imshow(matriz, text_auto='.2f', zmin=-1, zmax=1, color_continuous_scale='RdBu_r', aspect='auto', title=titulo)
+    fig.update_layout(template='plotly_white', height=480, xaxis_title=x_titulo, yaxis_title=y_titulo)
+    return fig
+
+@st.fragment
+def secao_correlacoes(corr, mes_ref):
+    inicio = time.perf_counter()
+    col1, col2 = st.columns(2)
+    with col1: metodo = st.radio("Método", ["Pearson", "Spearman"], horizontal=True, key="corr_metodo")
+    with col2: grupo = st.selectbox("🏭 Peneira", list(corr['pearson']), key="corr_grupo")
+    matriz = corr[metodo.lower()].get(grupo)
+    if matriz is not None: st.plotly_chart(fig_heatmap(matriz, f"🔗 Correlação de {metodo} - {grupo} - {mes_ref}"), use_container_width=True)
+    
+    # Defasagens: variável no dia t contra o alvo no dia t + lag
+    defas = corr['defasagem']
+    if not defas.empty:
+        st.markdown("#### ⏱️ Correlações Defasadas (0 a 7 dias)")
+        col1, col2 = st.columns(2)
+        with col1: alvo = st.selectbox("🎯 Indicador alvo", [c for c in corr['colunas'] if c in INDICADORES], key="corr_alvo")
+        with col2: pmt = st.selectbox("🏭 Peneira", sorted(defas['Peneira'].unique()), key="corr_pmt")
+        sel = defas[(defas['Peneira'] == pmt) & (defas['Alvo'] == alvo) & (defas['Variavel'] != alvo)]
+        tabela = sel.pivot(index='Variavel', columns='lag', values='r').reindex([c for c in corr['colunas'] if c != alvo])
+        tabela.columns = [f"{lag}d" for lag in tabela.columns]
+        st.plotly_chart(fig_heatmap(tabela, f"Variável (dia t) × {alvo} (dia t + defasagem) - {pmt}", "Defasagem", "Variável"), use_container_width=True)
+    perf_tracker.since("qualidade", "fragmento_correlacoes", inicio)
+
+st.subheader("📊 Distribuição e Consistência da Qualidade no Período")
+if isinstance(df_hist, pd.DataFrame) and not df_hist.empty: secao_distribuicao(resumo_quantis(df_hist, versao_hist), medianas_periodo(df_hist, versao_hist), periodo_ref)
+
+# ========== TENDÊNCIAS ==========
+st.markdown("---")
+st.subheader("📈 Análise de Tendências Temporais")
+if isinstance(df_hist, pd.DataFrame) and not df_hist.empty: secao_tendencias(df_hist, periodo_ref, cep_qualidade(df_hist, versao_hist), especificacoes)
+
+# ========== CORRELAÇÕES ==========
+st.markdown("---")
+st.subheader("🔗 Correlações entre Indicadores")
+if isinstance(df_hist, pd.DataFrame) and not df_hist.empty: secao_correlacoes(correlacoes(df_hist, versao_hist), periodo_ref)
+
+perf_tracker.since("qualidade", "renderizacao_total", _t0)
 
 # Footer
 st.markdown("---")
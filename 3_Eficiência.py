@@ -0,0 +1,166 @@
+"""Dashboard de Eficiência - diesel por tonelada peneirada"""
+
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import os, io, base64, time
+from cryptography.fernet import Fernet
+import data_export, data_sources, diesel_partitions, fact_table, page_assets, perf_tracker, rerun_profiler, shared_datasets
+from cache_manager import cache
+
+# ========== PROFILER ==========
+# Execução marcada no painel de administração: a página inteira roda sob cProfile + tracemalloc
+if (_marcacao := rerun_profiler.claim("eficiência")): rerun_profiler.run_script("eficiência", __file__, globals(), _marcacao); st.stop()
+
+_t0 = time.perf_counter()
+
+# ========== CONFIG ==========
+st.set_page_config(layout="wide", page_title="Dashboard de Eficiência Tupacery")
+
+# ========== CRYPTO ==========
+HEX_KEY_STRING = st.secrets.get("HEX_KEY_STRING")
+fernet = None
+if HEX_KEY_STRING:
+    try: fernet = Fernet(base64.urlsafe_b64encode(bytes.fromhex(HEX_KEY_STRING)))
+    except ValueError as e: st.error(f"❌ Erro chave: {e}")
+else: st.error("❌ HEX_KEY_STRING ausente")
+
+# ========== CONSTANTS ==========
+LOGO_PATH = "Lhg-02.png"
+def versao_arquivo(arquivo): return shared_datasets.file_version(arquivo) if os.path.exists(arquivo) else None
+# Fonte -> (arquivo, nome do dataset compartilhado com as outras páginas, leitor, versão ou None se indisponível)
+FONTES = {
+    'diesel': (data_sources.DIESEL_FILE, "diesel", diesel_partitions.read_history, diesel_partitions.history_version),
+    'producao': (data_sources.PRODUCTION_FILE, "producao", data_sources.read_production, versao_arquivo),
+    'qualidade': (data_sources.QUALITY_FILE, "qualidade", data_sources.read_quality, versao_arquivo),
+}
+DIAS_PADRAO = 30
+
+# ========== UTILS ==========
+def fmt_br(n, dec=0): return f"{n:,.{dec}f}".replace(',', '|').replace('.', ',').replace('|', '.') if pd.notna(n) else "N/D"
+
+# ========== I/O ==========
+def carregar_fonte(chave):
+    """Dataset compartilhado da fonte (o mesmo publicado pelas páginas de diesel, produção e qualidade)"""
+    arquivo, nome, leitor, versionar = FONTES[chave]
+    versao = versionar(arquivo)
+    if versao is None: return None, None
+    def ler():
+        try: return leitor(arquivo, fernet)
+        except Exception as e: st.error(f"Erro ao ler {arquivo}: {e}"); return None
+    return shared_datasets.load_or_publish(nome, versao, ler), versao
+
+def carregar_fatos():
+    """Tabela de fatos diária, montada uma vez por combinação de versões das três fontes"""
+    if not fernet: st.error("Fernet indisponível"); return None, None
+    fontes = {chave: carregar_fonte(chave) for chave in FONTES}
+    faltando = [FONTES[c][0] for c, (df, _) in fontes.items() if df is None]
+    if faltando: st.warning(f"⚠️ Fontes indisponíveis: {', '.join(faltando)}")
+    if fontes['diesel'][0] is None or fontes['producao'][0] is None: return None, None
+    versoes = tuple(v for _, v in fontes.values())
+    fatos = cache.get_or_compute("eficiência", ("fatos", versoes), lambda: fact_table.build_fact_table(*(df for df, _ in fontes.values())), version=versoes)
+    return fatos, versoes
+
+# ========== UI ==========
+try:
+    if os.path.exists(LOGO_PATH): st.image(page_assets.reduced_logo(LOGO_PATH), width=200)
+    else: st.info("Logo não encontrada")
+except: st.info("Falha logo")
+
+st.title("Dashboard de Eficiência - Diesel por Tonelada Peneirada")
+st.markdown("---")
+
+fatos, versoes = carregar_fatos()
+if fatos is None or fatos.empty: st.error("❌ São necessárias as planilhas de diesel e de produção"); st.stop()
+
+# Período com diesel e produção ao mesmo tempo
+cobertos = fatos.index[fatos['litros_total'].notna() & fatos['ton_total'].notna()]
+if cobertos.empty: st.warning("Diesel e produção não têm dias em comum"); st.stop()
+
+# ========== SIDEBAR ==========
+st.sidebar.header("Filtros de Análise")
+if os.path.exists(LOGO_PATH): st.sidebar.image(page_assets.reduced_logo(LOGO_PATH), use_container_width=True)
+minimo, maximo = cobertos.min().date(), cobertos.max().date()
+padrao_ini = max(minimo, (cobertos.max() - pd.Timedelta(days=DIAS_PADRAO - 1)).date())
+data_sel = st.sidebar.date_input("Período", value=(padrao_ini, maximo), min_value=minimo, max_value=maximo, format="DD/MM/YYYY")
+inicio, fim = (data_sel[0], data_sel[-1]) if isinstance(data_sel, tuple) and data_sel else (padrao_ini, maximo)
+st.sidebar.markdown("---")
+st.sidebar.caption("L/t e R$/t: diesel do Peneiramento sobre a produção total das peneiras. \"Total\" inclui a Expedição.")
+
+inicio_ts, fim_ts = pd.Timestamp(inicio), pd.Timestamp(fim)
+kpis = fact_table.period_kpis(fatos, inicio_ts, fim_ts)
+
+# ========== KPIs ==========
+st.subheader("Painel de Eficiência (KPIs)")
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Diesel Peneiramento por Tonelada", f"{fmt_br(kpis['l_por_t'], 3)} L/t")
+col2.metric("Custo Diesel Peneiramento por Tonelada", f"R$ {fmt_br(kpis['rs_por_t'], 3)}/t")
+col3.metric("Diesel Total por Tonelada", f"{fmt_br(kpis['l_por_t_total'], 3)} L/t")
+col4.metric("Custo Diesel Total por Tonelada", f"R$ {fmt_br(kpis['rs_por_t_total'], 3)}/t")
+perf_tracker.since("eficiência", "tempo_ate_primeiro_kpi", _t0)
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Produção no Período", f"{fmt_br(kpis['ton_total'])} t")
+col2.metric("Diesel Peneiramento", f"{fmt_br(kpis['litros_peneiramento'])} L")
+col3.metric("Diesel Total", f"{fmt_br(kpis['litros_total'])} L")
+col4.metric("Custo Diesel Total", f"R$ {fmt_br(kpis['custo_total'], 2)}")
+
+# ========== EXPORTAÇÃO ==========
+# Tabela de fatos do período, gravada em blocos só no clique (fora do rerun)
+st.sidebar.markdown("---")
+st.sidebar.header("📥 Exportar Dados")
+fmt_export = st.sidebar.radio("Formato", list(data_export.FORMATOS), horizontal=True, key="export_format", format_func=lambda f: data_export.FORMATOS[f][0])
+fatos_export = fatos.loc[inicio_ts:fim_ts].reset_index()
+st.sidebar.download_button(f"⬇️ Baixar {len(fatos_export)} dias", data=data_export.deferred(fatos_export, fmt_export), file_name=data_export.file_name("eficiencia", fmt_export),
+                           mime=data_export.FORMATOS[fmt_export][2], on_click="ignore", key="export_download")
+
+# ========== EVOLUÇÃO ==========
+st.markdown("---")
+st.subheader("Evolução Diária do Consumo Específico")
+recorte = fatos.loc[inicio_ts:fim_ts]
+recorte = recorte[recorte['litros_total'].notna() & recorte['ton_total'].notna()]
+# Média móvel de 7 dias como razão das somas (dias parados não explodem a curva)
+somas_7d = fatos[['litros_peneiramento', 'custo_peneiramento', 'ton_total']].fillna(0).rolling(7, min_periods=1).sum().loc[recorte.index]
+fig = go.Figure()
+fig.add_trace(go.Bar(x=recorte.index, y=recorte['l_por_t'], name='L/t diário', marker_color='#5A99E2'))
+fig.add_trace(go.Scatter(x=recorte.index, y=somas_7d['litros_peneiramento'] / somas_7d['ton_total'].where(somas_7d['ton_total'] > 0), mode='lines', name='L/t (7 dias)', line=dict(color='#f47c20', width=3)))
+fig.update_layout(template='plotly_dark', title="Litros de Diesel (Peneiramento) por Tonelada", yaxis_title="L/t", xaxis_title="Data")
+st.plotly_chart(fig, use_container_width=True)
+
+# ========== QUALIDADE ==========
+st.markdown("---")
+st.subheader("Custo por Tonelada × Teor de Fe")
+if 'Fe' not in fatos.columns or fatos.loc[inicio_ts:fim_ts, 'Fe'].notna().sum() == 0:
+    st.info("Sem dados de qualidade no período")
+else:
+    pontos = recorte[recorte['Fe'].notna() & (recorte['ton_total'] > 0)].reset_index()
+    fig_fe = px.scatter(pontos, x='Fe', y='rs_por_t', size='ton_total', color='ton_lump' if 'ton_lump' in pontos else None, hover_data=['Data', 'l_por_t'],
+                        labels={'Fe': 'Fe blend (%)', 'rs_por_t': 'R$/t (Peneiramento)', 'ton_total': 'Produção (t)', 'ton_lump': 'Lump (t)'},
+                        title="Custo de Diesel por Tonelada vs. Fe do Blend (ponderado por Ton)")
+    fig_fe.update_layout(template='plotly_dark')
+    st.plotly_chart(fig_fe, use_container_width=True)
+    
+    faixas = fact_table.grade_bands(fatos, 'Fe', inicio=inicio_ts, fim=fim_ts)
+    if not faixas.empty:
+        tabela = pd.DataFrame({
+            'Faixa de Fe (%)': [f"{fmt_br(f.left, 2)} – {fmt_br(f.right, 2)}" for f in faixas.index],
+            'Dias': faixas['dias'].to_numpy(),
+            'Produção (t)': [fmt_br(v) for v in faixas['ton_total']],
+            'Lump (t)': [fmt_br(v) for v in faixas.get('ton_lump', pd.Series(0, index=faixas.index))],
+            'L/t': [fmt_br(v, 3) for v in faixas['l_por_t']],
+            'R$/t': [fmt_br(v, 3) for v in faixas['rs_por_t']],
+        })
+        st.markdown("#### Consumo Específico por Faixa de Fe")
+        st.dataframe(tabela, hide_index=True, use_container_width=True)
+
+# ========== DETALHES ==========
+with st.expander("Tabela de fatos diária"):
+    st.dataframe(recorte, use_container_width=True)
+    st.caption(f"Versões das fontes: {', '.join(v or 'N/D' for v in versoes)}")
+
+perf_tracker.since("eficiência", "renderizacao_total", _t0)
+
+# Footer
+st.markdown("---")
+st.markdown("<div style='text-align: center; color: #666; font-size: 0.8em;'>Dashboard de Eficiência - LHG Mining | Tupacery</div>", unsafe_allow_html=True)
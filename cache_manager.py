@@ -0,0 +1,201 @@
+"""
+Gerenciador de cache por namespace para os dashboards.
+
+Substitui o ``st.cache_data`` global: cada namespace (diesel, produção,
+qualidade, eficiência, figures, users, kpi) tem seu próprio orçamento em bytes e
+política LRU, contadores de acertos/faltas/remoções e invalidação seletiva por
+versão dos dados. Assim, atualizar uma fonte não esvazia o cache das demais.
+
+O gerenciador vive no módulo (um por processo) e é compartilhado por todas as
+sessões. Os valores devolvidos são os próprios objetos em cache: quem os usa não
+deve modificá-los no lugar.
+"""
+
+import functools
+import hashlib
+import inspect
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+MB = 1024 * 1024
+
+# Orçamento de memória por namespace
+NAMESPACE_BUDGETS = {
+    "diesel": 256 * MB,
+    "produção": 64 * MB,
+    "qualidade": 64 * MB,
+    "eficiência": 32 * MB,
+    "figures": 128 * MB,
+    "users": 1 * MB,
+    "kpi": 8 * MB,
+}
+
+
+def estimate_size(value, _depth=0):
+    """Estimativa do tamanho em bytes de um valor em cache"""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if _depth > 6:
+        return sys.getsizeof(value)
+    if hasattr(value, "to_plotly_json"):
+        return estimate_size(value.to_plotly_json(), _depth + 1)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v, _depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_size(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+class CacheNamespace:
+    """Cache LRU limitado por bytes, com estatísticas"""
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # chave -> (valor, tamanho, versão)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key][0]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value, version=None):
+        size = estimate_size(value)
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            # Maior que o orçamento inteiro: não vale a pena guardar
+            self.evictions += 1
+            return
+        self.entries[key] = (value, size, version)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, (_, old_size, _) = self.entries.popitem(last=False)
+            self.current_bytes -= old_size
+            self.evictions += 1
+
+    def invalidate(self, version=None):
+        """Remove todas as entradas, ou apenas as da versão informada"""
+        keys = [k for k, (_, _, v) in self.entries.items() if version is None or v == version]
+        for key in keys:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "Namespace": self.name,
+            "Entradas": len(self.entries),
+            "Uso (MB)": round(self.current_bytes / MB, 2),
+            "Orçamento (MB)": round(self.max_bytes / MB, 2),
+            "Acertos": self.hits,
+            "Faltas": self.misses,
+            "Taxa de Acerto (%)": round(self.hits / total * 100, 1) if total else 0.0,
+            "Remoções (LRU)": self.evictions,
+            "Invalidações": self.invalidations,
+        }
+
+
+class CacheManager:
+    """Conjunto de namespaces de cache compartilhado pelo processo"""
+
+    def __init__(self, budgets):
+        self._lock = threading.RLock()
+        self.namespaces = {name: CacheNamespace(name, size) for name, size in budgets.items()}
+
+    def _namespace(self, name):
+        if name not in self.namespaces:
+            raise KeyError(f"Namespace de cache desconhecido: {name}")
+        return self.namespaces[name]
+
+    def get_or_compute(self, namespace, key, compute, version=None):
+        """
+        Devolve o valor em cache para ``key`` ou executa ``compute()`` e o guarda.
+        O cálculo roda fora do lock; em uma corrida, duas sessões podem calcular
+        o mesmo valor, mas nenhuma fica bloqueada esperando a outra.
+        """
+        ns = self._namespace(namespace)
+        with self._lock:
+            found, value = ns.get(key)
+        if found:
+            return value
+        value = compute()
+        with self._lock:
+            ns.put(key, value, version)
+        return value
+
+    def invalidate(self, namespace, version=None):
+        """Invalida um namespace inteiro ou só as entradas de uma versão dos dados"""
+        with self._lock:
+            return self._namespace(namespace).invalidate(version)
+
+    def stats(self):
+        """Estatísticas de todos os namespaces em formato de tabela"""
+        with self._lock:
+            return pd.DataFrame([ns.stats() for ns in self.namespaces.values()])
+
+
+cache = CacheManager(NAMESPACE_BUDGETS)
+
+
+def _key_part(value):
+    """Converte um argumento em parte de chave hasheável (bytes e tabelas viram digests)"""
+    if isinstance(value, (bytes, bytearray)):
+        return ("bytes", hashlib.blake2b(value, digest_size=16).hexdigest())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return ("frame", int(pd.util.hash_pandas_object(value, index=True).sum()))
+    if value is None or isinstance(value, (str, int, float, bool, date, datetime, pd.Timestamp)):
+        return value
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def cached(namespace, version_arg=None, ignore=()):
+    """
+    Decorador que guarda o resultado da função no namespace indicado.
+    ``version_arg`` nomeia o argumento que identifica a versão dos dados (usado
+    na invalidação seletiva); argumentos em ``ignore`` não entram na chave.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__module__, func.__qualname__) + tuple(
+                (name, _key_part(value)) for name, value in bound.arguments.items() if name not in ignore
+            )
+            version = bound.arguments.get(version_arg) if version_arg else None
+            return cache.get_or_compute(namespace, key, lambda: func(*args, **kwargs), version=version)
+
+        wrapper.invalidate = lambda version=None: cache.invalidate(namespace, version)
+        return wrapper
+
+    return decorator
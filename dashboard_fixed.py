@@ -2,6 +2,7 @@ import json
 import os
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import date, timedelta, datetime
@@ -11,6 +12,18 @@ from cryptography.fernet import Fernet
 import io
 import time
 
+import copy
+
+import data_export
+import data_sources
+import diesel_analytics
+import diesel_partitions
+import equipment_matrix
+import perf_tracker
+import rerun_profiler
+import shared_datasets
+from cache_manager import cache, cached
+
 ENCRYPTED_FILENAME = "Diesel-area.encrypted"
 ENCRYPTED_USERS_FILE = "users.encrypted"
 ADMIN_USERNAME = "admin"  # Usuário administrador fixo
@@ -114,12 +127,17 @@ def get_last_update_info():
 
 # --- Funções de Gerenciamento de Usuários ---
 def load_users():
-    """Carrega usuários do arquivo criptografado"""
-    return decrypt_users_file()
+    """Carrega usuários do arquivo criptografado (em cache até o arquivo mudar)"""
+    version = shared_datasets.file_version(ENCRYPTED_USERS_FILE) if os.path.exists(ENCRYPTED_USERS_FILE) else None
+    users = cache.get_or_compute("users", ("users", version), decrypt_users_file, version=version)
+    # Cópia: os chamadores alteram o dicionário antes de salvar
+    return copy.deepcopy(users)
 
 def save_users(users):
     """Salva usuários no arquivo criptografado"""
-    return encrypt_users_file(users)
+    saved = encrypt_users_file(users)
+    cache.invalidate("users")
+    return saved
 
 def hash_password(password):
     """Hash da senha usando SHA256"""
@@ -363,7 +381,7 @@ def admin_panel():
         st.rerun()
     
     # Tabs do painel
-    tab1, tab2, tab3 = st.tabs(["👥 Gerenciar Usuários", "➕ Criar Usuário", "📊 Logs de Acesso"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["👥 Gerenciar Usuários", "➕ Criar Usuário", "📊 Logs de Acesso", "📦 Cache", "⏱️ Desempenho", "🔬 Profiler"])
     
     with tab1:
         user_management_tab()
@@ -373,6 +391,15 @@ def admin_panel():
     
     with tab3:
         access_logs_tab()
+    
+    with tab4:
+        cache_stats_tab()
+    
+    with tab5:
+        performance_tab()
+    
+    with tab6:
+        profiler_tab()
 
 def user_management_tab():
     """Tab de gerenciamento de usuários"""
@@ -398,7 +425,12 @@ def user_management_tab():
     df_users = pd.DataFrame(user_data)
     st.dataframe(df_users, use_container_width=True)
     
-    # Seção de edição
+    edit_user_section(users)
+
+@st.fragment
+def edit_user_section(users):
+    """Seção de edição (fragmento: selecionar um usuário não reexecuta o painel inteiro)"""
+    section_start = time.perf_counter()
     st.markdown("### ✏️ Editar Usuário")
     
     selected_user = st.selectbox(
@@ -467,6 +499,8 @@ def user_management_tab():
             st.write(f"**Função:** {user_info.get('role', 'user')}")
             st.write(f"**Criado:** {user_info.get('created_at', 'N/A')[:19] if user_info.get('created_at') else 'N/A'}")
             st.write(f"**Último Login:** {user_info.get('last_login', 'Nunca')[:19] if user_info.get('last_login') else 'Nunca'}")
+    
+    perf_tracker.since("admin", "fragmento_edicao_usuario", section_start)
 
 def create_user_tab():
     """Tab de criação de usuário"""
@@ -544,156 +578,172 @@ def access_logs_tab():
     else:
         st.info("Arquivo de logs não encontrado.")
 
+def cache_stats_tab():
+    """Tab de estatísticas e invalidação do cache por namespace"""
+    st.subheader("Cache por Namespace")
+    st.dataframe(cache.stats(), use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        namespace = st.selectbox("Namespace:", list(cache.namespaces.keys()))
+    with col2:
+        st.write("")
+        if st.button("🧹 Invalidar Namespace"):
+            removed = cache.invalidate(namespace)
+            log_access(st.session_state.username, f"cache_invalidate_{namespace}")
+            st.success(f"{removed} entradas removidas de '{namespace}'")
+
+def performance_tab():
+    """Tab com métricas de renderização (tempo até o primeiro KPI, etc.)"""
+    st.subheader("Métricas de Renderização")
+    stats = perf_tracker.summary()
+    if stats.empty:
+        st.info("Nenhuma métrica registrada ainda neste processo.")
+    else:
+        st.dataframe(stats, use_container_width=True, hide_index=True)
+
+def profiler_tab():
+    """Tab para perfilar a próxima execução de uma página (cProfile + tracemalloc)"""
+    st.subheader("Perfilar Próxima Execução")
+    st.caption("A próxima execução da página escolhida, em qualquer sessão, roda sob cProfile e tracemalloc. "
+               "Abra ou atualize a página para gerar o perfil.")
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        page = st.selectbox("Página:", list(rerun_profiler.PAGES), format_func=rerun_profiler.PAGES.get, key="profiler_page")
+    with col2:
+        st.write("")
+        if st.button("🎯 Perfilar próxima execução"):
+            rerun_profiler.arm(page, st.session_state.username)
+            log_access(st.session_state.username, f"profiler_arm_{page}")
+    
+    pending = rerun_profiler.armed()
+    if pending:
+        st.info("Aguardando execução: " + ", ".join(rerun_profiler.PAGES.get(p, p) for p in pending))
+        if st.button("Cancelar marcações"):
+            for p in pending:
+                rerun_profiler.disarm(p)
+            st.rerun()
+    
+    profiles = rerun_profiler.list_profiles()
+    if not profiles:
+        st.info("Nenhum perfil gravado ainda.")
+        return
+    
+    st.subheader("Perfis Gravados")
+    labels = {
+        p['id']: f"{rerun_profiler.PAGES.get(p['pagina'], p['pagina'])} · {datetime.fromisoformat(p['inicio']):%d/%m/%Y %H:%M:%S} · {p['duracao_s']:.2f} s"
+        for p in profiles
+    }
+    profile_id = st.selectbox("Perfil:", list(labels), format_func=labels.get, key="profiler_id")
+    meta = rerun_profiler.load_meta(profile_id)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Duração", f"{meta['duracao_s']:.2f} s")
+    col2.metric("Pico de memória rastreada", f"{meta['pico_mb']:.1f} MB")
+    col3.metric("Término", meta['status'])
+    col4.metric("Solicitado por", meta.get('solicitado_por') or "-")
+    
+    stats = rerun_profiler.function_stats(profile_id)
+    search = st.text_input("Filtrar funções:", key="profiler_search", placeholder="ex.: calculate_kpis, summarize_report")
+    shown = stats[stats['Função'].str.contains(search, case=False, regex=False)] if search else stats
+    st.dataframe(shown.head(300), use_container_width=True, hide_index=True,
+                 column_config={c: st.column_config.NumberColumn(format="%.2f") for c in stats.columns if "(ms)" in c})
+    
+    if not shown.empty:
+        function = st.selectbox("Chamadores e chamadas de:", shown['Função'].head(300), key="profiler_function")
+        callers, callees = rerun_profiler.call_tree(profile_id, function)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Chamado por**")
+            st.dataframe(callers, use_container_width=True, hide_index=True)
+        with col2:
+            st.markdown("**Chama**")
+            st.dataframe(callees, use_container_width=True, hide_index=True)
+    
+    st.markdown("**Principais pontos de alocação** (memória viva ao fim da execução)")
+    st.dataframe(rerun_profiler.allocations(profile_id), use_container_width=True, hide_index=True)
+    
+    with open(rerun_profiler.pstats_path(profile_id), "rb") as f:
+        st.download_button("📥 Baixar .pstats", f.read(), file_name=f"{profile_id}.pstats",
+                           mime="application/octet-stream", on_click="ignore")
+
 # --- Funções do Dashboard (mantenha todas as funções originais aqui) ---
-@st.cache_data
+def read_diesel_history(file_path):
+    """
+    Histórico completo a partir das partições mensais; quando a planilha mudou,
+    lê a planilha e atualiza as partições para as próximas leituras por período
+    """
+    if not fernet:
+        return None
+    try:
+        return diesel_partitions.read_history(file_path, fernet)
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar os dados de diesel: {e}")
+        return None
+
+def load_diesel_dataset(file_path):
+    """
+    Retorna a planilha de diesel processada a partir do dataset compartilhado
+    entre processos; apenas o primeiro processo a ver uma nova versão do arquivo
+    descriptografa e processa a planilha.
+    """
+    return shared_datasets.load_or_publish(
+        "diesel", diesel_partitions.history_version(file_path), lambda: read_diesel_history(file_path)
+    )
+
+def load_diesel_range(file_path, start_date, end_date):
+    """
+    Linhas do período lidas só das partições mensais que o cruzam. Devolve None
+    se as partições não refletem a planilha atual (ou foram substituídas durante
+    a leitura): o histórico completo é lido então e atualiza as partições
+    (``read_diesel_history``). Cada partição fica em cache pelo seu digest.
+    """
+    manifest = diesel_partitions.active_manifest(file_path)
+    if manifest is None or not fernet:
+        return None
+    reader = lambda entry: cache.get_or_compute("diesel", ("particao", entry["digest"]),
+                                                lambda: diesel_partitions.read_partition(entry, fernet))
+    try:
+        return diesel_partitions.load_range(fernet, start_date, end_date, manifest=manifest, reader=reader)
+    except (OSError, ValueError):
+        return None
+
 def load_and_preprocess_data(file_path, start_date, end_date, cache_key):
+    """Consumo diário do período; falhas não ficam em cache e são tentadas de novo no próximo rerun"""
     try:
-        # Descriptografa o arquivo na memória
-        decrypted_file = decrypt_file_in_memory(file_path)
-        if not decrypted_file:
-            return pd.DataFrame(), pd.DataFrame()
-
-        df = pd.read_excel(decrypted_file)
-
-        # Renomear colunas para facilitar o uso
-        df.rename(columns={
-            'data de Inclusão': 'DataInclusao',
-            'Quantidade': 'ConsumoDiesel',
-            'Valo Unitário': 'CustoUnitario',
-            'Valor Total': 'CustoTotalAbastecimento',
-            'Área': 'Setor',
-            'Dia': 'DataConsumo'
-        }, inplace=True)
-
-        # Converter as colunas de data para datetime
-        df['DataInclusao'] = pd.to_datetime(df['DataInclusao'])
-        df['DataConsumo'] = pd.to_datetime(df['DataConsumo'])
-
-        # Filtrar apenas os setores 'Tup' e 'Rep'
-        df = df[df['Setor'].isin(['Tup', 'Rep'])].copy()
-
-        # Renomear 'Tup' para 'Expedição' e 'Rep' para 'Peneiramento'
-        df['Setor'] = df['Setor'].replace({'Tup': 'Expedição', 'Rep': 'Peneiramento'})
-
-        # Garantir que o consumo e custos são numéricos
-        df['ConsumoDiesel'] = pd.to_numeric(df['ConsumoDiesel'], errors='coerce')
-        df['CustoUnitario'] = pd.to_numeric(df['CustoUnitario'], errors='coerce')
-        df['CustoTotalAbastecimento'] = pd.to_numeric(df['CustoTotalAbastecimento'], errors='coerce')
-        df.dropna(subset=['ConsumoDiesel', 'CustoUnitario', 'CustoTotalAbastecimento'], inplace=True)
-
-        # Aplicar filtro de data se fornecido
-        if start_date and end_date:
-            df = df[(df['DataConsumo'] >= pd.to_datetime(start_date)) & 
-                           (df['DataConsumo'] <= pd.to_datetime(end_date))]
-
-        # Calcular o consumo diário e custo diário por setor
-        daily_data = df.groupby(['DataConsumo', 'Setor']).agg(
-            ConsumoDiario=('ConsumoDiesel', 'sum'),
-            CustoDiario=('CustoTotalAbastecimento', 'sum')
-        ).reset_index()
-
-        # Calcular o consumo acumulado e custo acumulado por setor
-        daily_data = daily_data.sort_values(by=['DataConsumo', 'Setor'])
-        daily_data['ConsumoAcumulado'] = daily_data.groupby('Setor')['ConsumoDiario'].cumsum()
-        daily_data['CustoAcumulado'] = daily_data.groupby('Setor')['CustoDiario'].cumsum()
-
-        return daily_data, df
+        return daily_consumption_data(file_path, start_date, end_date, cache_key)
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
         return pd.DataFrame(), pd.DataFrame()
 
+@cached("diesel", version_arg="cache_key")
+def daily_consumption_data(file_path, start_date, end_date, cache_key):
+    df = load_diesel_range(file_path, start_date, end_date) if start_date and end_date else None
+    if df is None:
+        df = load_diesel_dataset(file_path)
+    if df is None:
+        raise ValueError("histórico de diesel indisponível")
+    return diesel_analytics.daily_consumption(df, start_date, end_date)
+
 # Função para calcular KPIs
-def calculate_kpis(df, period_type="month"):
-    if df.empty:
-        return {}
-    
+def calculate_kpis(df, period_type="month", projection_engine=None):
     try:
-        today = pd.to_datetime(date.today())
-        
-        # Ajustar cálculo baseado no tipo de período
-        if period_type == "month":
-            # Filtrar dados do mês atual, excluindo o dia atual para cálculo de tendência e projeção
-            current_period_data_complete_days = df[(df['DataConsumo'].dt.month == today.month) & (df['DataConsumo'] < today)]
-        else:
-            # Para períodos personalizados, usar todos os dados exceto o último dia
-            unique_dates = sorted(df['DataConsumo'].unique())
-            if len(unique_dates) > 1:
-                current_period_data_complete_days = df[df['DataConsumo'] < unique_dates[-1]]
-            else:
-                current_period_data_complete_days = df
-
-        # Consumo acumulado do período
-        total_consumed_expedicao = df[df['Setor'] == 'Expedição']['ConsumoDiario'].sum()
-        total_consumed_peneiramento = df[df['Setor'] == 'Peneiramento']['ConsumoDiario'].sum()
-        total_consumed_period = total_consumed_expedicao + total_consumed_peneiramento
-
-        # Custo total acumulado do período
-        total_cost_expedicao = df[df['Setor'] == 'Expedição']['CustoDiario'].sum()
-        total_cost_peneiramento = df[df['Setor'] == 'Peneiramento']['CustoDiario'].sum()
-        total_cost_period = total_cost_expedicao + total_cost_peneiramento
-
-        # Custo médio do litro de diesel (total de custo / total de consumo)
-        avg_liter_cost = total_cost_period / total_consumed_period if total_consumed_period > 0 else 0
-
-        # Consumo médio diário (para projeção, baseado em dias completos)
-        days_in_period_so_far = len(current_period_data_complete_days['DataConsumo'].unique())
-        avg_daily_consumption = current_period_data_complete_days['ConsumoDiario'].sum() / days_in_period_so_far if days_in_period_so_far > 0 else 0
-        
-        # Custo médio diário (para projeção, baseado em dias completos)
-        avg_daily_cost = current_period_data_complete_days['CustoDiario'].sum() / days_in_period_so_far if days_in_period_so_far > 0 else 0
-
-        # Estimativa de fechamento (apenas para período mensal)
-        if period_type == "month":
-            last_day_of_month = (pd.Timestamp(today.year, today.month, 1) + pd.DateOffset(months=1) - pd.DateOffset(days=1)).day
-            days_remaining_in_month = last_day_of_month - today.day
-            projected_consumption = total_consumed_period + (avg_daily_consumption * days_remaining_in_month)
-            projected_cost = total_cost_period + (avg_daily_cost * days_remaining_in_month)
-        else:
-            projected_consumption = total_consumed_period
-            projected_cost = total_cost_period
-
-        # Tendência do ritmo de abastecimento (baseado nos últimos 7 dias completos)
-        trend_data = current_period_data_complete_days.sort_values('DataConsumo').tail(7)
-        trend = 'Não há dados suficientes'
-        if len(trend_data) >= 6:
-            avg_last_3_days = trend_data['ConsumoDiario'].tail(3).mean()
-            avg_prev_3_days = trend_data['ConsumoDiario'].iloc[-6:-3].mean()
-            
-            if avg_prev_3_days == 0:
-                trend = 'Estável (sem consumo anterior para comparação)'
-            elif avg_last_3_days > avg_prev_3_days * 1.05:
-                trend = 'Aumentando'
-            elif avg_last_3_days < avg_prev_3_days * 0.95:
-                trend = 'Diminuindo'
-            else:
-                trend = 'Estável'
-        elif len(current_period_data_complete_days['DataConsumo'].unique()) >= 2:
-            unique_dates = sorted(current_period_data_complete_days['DataConsumo'].unique())
-            last_day_consumption = current_period_data_complete_days[current_period_data_complete_days['DataConsumo'] == unique_dates[-1]]['ConsumoDiario'].sum()
-            second_last_day_consumption = current_period_data_complete_days[current_period_data_complete_days['DataConsumo'] == unique_dates[-2]]['ConsumoDiario'].sum()
-            if last_day_consumption > second_last_day_consumption:
-                trend = 'Aumentando'
-            elif last_day_consumption < second_last_day_consumption:
-                trend = 'Diminuindo'
-            else:
-                trend = 'Estável'
-
-        return {
-            'total_consumed_period': total_consumed_period,
-            'avg_daily_consumption': avg_daily_consumption,
-            'projected_consumption': projected_consumption,
-            'trend': trend,
-            'total_consumed_expedicao': total_consumed_expedicao,
-            'total_consumed_peneiramento': total_consumed_peneiramento,
-            'total_cost_period': total_cost_period,
-            'avg_daily_cost': avg_daily_cost,
-            'projected_cost': projected_cost,
-            'avg_liter_cost': avg_liter_cost
-        }
+        return diesel_analytics.calculate_kpis(df, period_type, projection_engine)
     except Exception as e:
         st.error(f"Erro ao calcular KPIs: {str(e)}")
         return {}
 
+@cached("diesel", version_arg="cache_key")
+def projection_engine(file_path, cache_key):
+    """Perfis de consumo por setor e dia da semana sobre todo o histórico (uma vez por versão)"""
+    return diesel_analytics.ProjectionEngine(load_diesel_dataset(file_path))
+
+@cached("diesel", version_arg="cache_key", ignore=("df", "engine"))
+def cached_kpis(df, period_type, start_date, end_date, today, cache_key, engine=None):
+    """KPIs em cache por período, dia corrente e versão dos dados"""
+    return calculate_kpis(df, period_type, engine)
+
 # Função para gerar insights automáticos
 def generate_insights(kpis, period_label="mês"):
     if not kpis:
@@ -712,7 +762,12 @@ def generate_insights(kpis, period_label="mês"):
         insights.append(f"O ritmo atual de abastecimento está {kpis['trend'].lower()}, com uma média diária de {format_number(kpis['avg_daily_consumption'])} litros e um custo médio diário de R$ {format_number(kpis['avg_daily_cost'])}.")
         
         # Projeção de fechamento
-        if period_label == "mês":
+        if period_label == "mês" and 'projected_consumption_p10' in kpis:
+            by_sector = kpis['projected_consumption_by_sector']
+            insights.append(f"Pelo perfil de cada setor por dia da semana, a projeção para o fechamento do {period_label} é de {format_number(kpis['projected_consumption'])} litros de diesel (80% de confiança: {format_number(kpis['projected_consumption_p10'])} a {format_number(kpis['projected_consumption_p90'])} L), sendo {format_number(by_sector['Expedição'])} L na Expedição e {format_number(by_sector['Peneiramento'])} L no Peneiramento, com um custo total estimado de R$ {format_number(kpis['projected_cost'])} (R$ {format_number(kpis['projected_cost_p10'])} a R$ {format_number(kpis['projected_cost_p90'])}).")
+            if kpis.get('weekday_ratio'):
+                insights.append(f"{kpis['busiest_weekday']} é o dia de maior consumo esperado e {kpis['quietest_weekday'].lower()} o de menor ({kpis['weekday_ratio']:.1f}x de diferença); faltam {kpis['days_remaining']} dias no mês.")
+        elif period_label == "mês":
             insights.append(f"Com base no consumo atual, a projeção para o fechamento do {period_label} é de {format_number(kpis['projected_consumption'])} litros de diesel, com um custo total estimado de R$ {format_number(kpis['projected_cost'])}.")
         else:
             insights.append(f"No período selecionado, o consumo total foi de {format_number(kpis['total_consumed_period'])} litros de diesel, com um custo total de R$ {format_number(kpis['total_cost_period'])}.")
@@ -728,61 +783,77 @@ def generate_insights(kpis, period_label="mês"):
 def format_number(value):
     return f"{int(value):,}".replace(",", ".")
 
+# Matriz equipamento × dia construída uma vez por versão dos dados (sem filtro de período)
+@cached("diesel", version_arg="cache_key")
+def tag_day_matrix(file_path, cache_key):
+    """Matriz esparsa Tag × dia de litros e custo sobre toda a planilha"""
+    return equipment_matrix.TagDayMatrix(load_diesel_dataset(file_path))
+
+@cached("diesel", version_arg="cache_key")
+def consumption_anomalies(file_path, cache_key):
+    """Detector de anomalias do processo, pontuando só os dias novos a cada versão dos dados"""
+    return equipment_matrix.anomaly_detector("diesel", tag_day_matrix(file_path, cache_key))
+
+@cached("diesel", version_arg="cache_key", ignore=("matrix",))
+def cached_cost_variance(matrix, base_start, base_end, start, end, cache_key):
+    """Decomposição preço × volume × mix em cache por par de períodos e versão dos dados"""
+    return diesel_analytics.cost_variance(matrix, (base_start, base_end), (start, end))
+
 # Função para criar histograma de consumo por equipamento
-def create_equipment_histogram(df_original):
-    if df_original.empty or 'Tag' not in df_original.columns:
+@cached("figures", version_arg="cache_key", ignore=("matrix",))
+def cached_equipment_histogram(matrix, start_date, end_date, cache_key, top_n=15):
+    """Histogramas por equipamento em cache por período, top-N e versão dos dados"""
+    return create_equipment_histogram(matrix, start_date, end_date, top_n)
+
+SECTOR_COLORS = {'Expedição': "#FF6600", 'Peneiramento': "#808080"}
+
+def create_equipment_histogram(matrix, start_date, end_date, top_n=15):
+    if matrix.vazia:
         return None, None
     
     try:
-        # Agrupar por Tag e Setor para obter o consumo total por equipamento
-        equipment_data = df_original.groupby(['Tag', 'Setor'])['ConsumoDiesel'].sum().reset_index()
-        
-        # Separar por setor
-        expedicao_data = equipment_data[equipment_data['Setor'] == 'Expedição'].sort_values('ConsumoDiesel', ascending=True)
-        peneiramento_data = equipment_data[equipment_data['Setor'] == 'Peneiramento'].sort_values('ConsumoDiesel', ascending=True)
-        
-        # Criar gráfico para Expedição
-        fig_expedicao = None
-        if not expedicao_data.empty:
-            fig_expedicao = px.bar(
-                expedicao_data,
-                x='ConsumoDiesel',
-                y='Tag',
-                orientation='h',
-                title="Consumo por Equipamento - Expedição",
-                labels={'ConsumoDiesel': 'Consumo (Litros)', 'Tag': 'Equipamento'},
-                color_discrete_sequence=["#FF6600"]
-            )
-            fig_expedicao.update_layout(height=400, showlegend=False)
-            fig_expedicao.update_traces(
-                texttemplate='%{x:,.0f}L',
-                textposition='outside'
-            )
-        
-        # Criar gráfico para Peneiramento
-        fig_peneiramento = None
-        if not peneiramento_data.empty:
-            fig_peneiramento = px.bar(
-                peneiramento_data,
+        # Totais do período por recorte da matriz: os N maiores de cada setor e "Outros"
+        figs = {}
+        for setor, color in SECTOR_COLORS.items():
+            equipment_data = matrix.top_n(setor, top_n, start_date, end_date).iloc[::-1]
+            if equipment_data.empty:
+                figs[setor] = None
+                continue
+            fig = px.bar(
+                equipment_data,
                 x='ConsumoDiesel',
                 y='Tag',
                 orientation='h',
-                title="Consumo por Equipamento - Peneiramento",
+                title=f"Consumo por Equipamento - {setor}",
                 labels={'ConsumoDiesel': 'Consumo (Litros)', 'Tag': 'Equipamento'},
-                color_discrete_sequence=["#808080"]
+                color_discrete_sequence=[color]
             )
-            fig_peneiramento.update_layout(height=400, showlegend=False)
-            fig_peneiramento.update_traces(
+            fig.update_layout(height=max(400, 28 * len(equipment_data)), showlegend=False,
+                              yaxis={'type': 'category'})
+            fig.update_traces(
                 texttemplate='%{x:,.0f}L',
                 textposition='outside'
             )
+            figs[setor] = fig
         
-        return fig_expedicao, fig_peneiramento
+        return figs['Expedição'], figs['Peneiramento']
         
     except Exception as e:
         st.error(f"Erro ao criar histograma de equipamentos: {str(e)}")
         return None, None
 
+def create_equipment_series(matrix, tag, setor, start_date, end_date):
+    """Consumo diário de um equipamento (barras) com média móvel de 7 dias"""
+    value_label = 'Consumo (Litros)'
+    serie = matrix.series(tag, setor, start_date, end_date)
+    fig = go.Figure()
+    fig.add_bar(x=serie.index, y=serie.values, name=value_label, marker_color=SECTOR_COLORS.get(setor, PRIMARY_COLOR))
+    fig.add_scatter(x=serie.index, y=serie.rolling(7, min_periods=1).mean().values, name="Média 7 dias",
+                    mode='lines', line={'color': '#333333'})
+    fig.update_layout(height=350, title=f"{tag} ({setor}) - {value_label} diário",
+                      xaxis_title="Data", yaxis_title=value_label, legend={'orientation': 'h'})
+    return fig, serie
+
 # --- Configuração da Página ---
 st.set_page_config(
     page_title="Dashboard de Consumo de Diesel - LHG Logística",
@@ -797,6 +868,7 @@ SECONDARY_COLOR = "#808080"
 # --- Interface Principal ---
 def dashboard_main():
     """Função principal do dashboard"""
+    render_start = time.perf_counter()
     # Pega informações da última atualização
     update_info = get_last_update_info()
     
@@ -823,6 +895,10 @@ def dashboard_main():
     st.sidebar.info(f"Usuário: {st.session_state.get('username', 'Desconhecido')}")
     st.sidebar.info(f"🔄 Última atualização: {update_info.get('last_update', 'N/A')[:19]}")
     
+    # Modo progressivo: KPIs primeiro, seções abaixo da dobra só quando abertas
+    progressive = st.sidebar.toggle("⚡ Renderização progressiva", value=True,
+                                    help="Exibe os KPIs antes dos gráficos e só monta as tabelas detalhadas quando expandidas")
+    
     # Botão para acessar painel admin (se for admin)
     if st.session_state.get('is_admin', False):
         st.sidebar.header("👨‍💼 Administração")
@@ -841,8 +917,7 @@ def dashboard_main():
         ["Mês Atual", "Período Personalizado", "Mês Específico"]
     )
     
-    start_date = None
-    end_date = None
+    start_date, end_date = diesel_analytics.current_month()
     period_label = "mês"
     period_type = "month"
     
@@ -872,8 +947,8 @@ def dashboard_main():
     # Caminho para o arquivo criptografado
     file_path = ENCRYPTED_FILENAME
     
-    if not os.path.exists(file_path):
-        st.error("Arquivo de dados não encontrado! Certifique-se de que 'Diesel-area.encrypted' está na mesma pasta que o script.")
+    if not diesel_partitions.history_available(file_path):
+        st.error("Arquivo de dados não encontrado! Certifique-se de que 'Diesel-area.encrypted' (ou as partições em 'diesel_particoes') está na mesma pasta que o script.")
         return
 
     # Usar o timestamp do JSON como cache_key
@@ -886,7 +961,8 @@ def dashboard_main():
         st.error("Não foi possível carregar os dados ou não há dados válidos para o período selecionado.")
         return
         
-    kpis = calculate_kpis(df, period_type)
+    engine = projection_engine(file_path, cache_key) if period_type == "month" else None
+    kpis = cached_kpis(df, period_type, start_date, end_date, date.today(), cache_key, engine)
     insights = generate_insights(kpis, period_label)
     
     if not kpis:
@@ -922,8 +998,13 @@ def dashboard_main():
         if period_type == "month":
             st.metric(
                 label="Projeção Consumo Fechamento",
-                value=f"{format_number(kpis['projected_consumption'])} L"
+                value=f"{format_number(kpis['projected_consumption'])} L",
+                help=(f"Perfil por setor e dia da semana. Faixa de 80%: {format_number(kpis['projected_consumption_p10'])} "
+                      f"a {format_number(kpis['projected_consumption_p90'])} L")
+                     if 'projected_consumption_p10' in kpis else None
             )
+            if 'projected_consumption_p10' in kpis:
+                st.caption(f"80%: {format_number(kpis['projected_consumption_p10'])} – {format_number(kpis['projected_consumption_p90'])} L")
         else:
             st.metric(
                 label="Total do Período",
@@ -946,8 +1027,13 @@ def dashboard_main():
         if period_type == "month":
             st.metric(
                 label="Projeção Custo Fechamento",
-                value=f"R$ {format_number(kpis['projected_cost'])}"
+                value=f"R$ {format_number(kpis['projected_cost'])}",
+                help=(f"Perfil por setor e dia da semana. Faixa de 80%: R$ {format_number(kpis['projected_cost_p10'])} "
+                      f"a R$ {format_number(kpis['projected_cost_p90'])}")
+                     if 'projected_cost_p10' in kpis else None
             )
+            if 'projected_cost_p10' in kpis:
+                st.caption(f"80%: R$ {format_number(kpis['projected_cost_p10'])} – R$ {format_number(kpis['projected_cost_p90'])}")
         else:
             st.metric(
                 label="Custo Total do Período",
@@ -966,6 +1052,7 @@ def dashboard_main():
             label="Tendência de Consumo",
             value=kpis['trend']
         )
+    perf_tracker.since("diesel", "tempo_ate_primeiro_kpi", render_start)
 
     # Gráficos
     st.header("📈 Visualizações")
@@ -1017,24 +1104,18 @@ def dashboard_main():
     st.header("🚛 Consumo por Equipamento")
     
     if not df_original.empty:
-        fig_exp, fig_pen = create_equipment_histogram(df_original)
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if fig_exp:
-                st.plotly_chart(fig_exp, use_container_width=True)
-            else:
-                st.warning("Não há dados de equipamentos para Expedição no período selecionado.")
-        
-        with col2:
-            if fig_pen:
-                st.plotly_chart(fig_pen, use_container_width=True)
-            else:
-                st.warning("Não há dados de equipamentos para Peneiramento no período selecionado.")
+        equipment_section(file_path, start_date, end_date, cache_key)
     else:
         st.warning("Não há dados para exibir o consumo por equipamento.")
 
+    # Decomposição da variação de custo
+    st.header("💰 Variação de Custo: Volume × Preço × Mix")
+    cost_variance_section(file_path, start_date, end_date, cache_key)
+
+    # Anomalias de consumo por equipamento
+    st.header("🚨 Anomalias")
+    anomaly_section(file_path, start_date, end_date, cache_key, progressive)
+
     # Insights automáticos
     st.header("🔍 Insights Automáticos")
     for i, insight in enumerate(insights, 1):
@@ -1042,10 +1123,16 @@ def dashboard_main():
 
     # Tabela de dados
     st.header("📋 Dados Detalhados")
-    if not df.empty:
-        st.dataframe(df, use_container_width=True)
-    else:
+    if df.empty:
         st.warning("Não há dados para exibir.")
+    elif progressive:
+        # A tabela só é montada quando o expander é aberto
+        details = st.expander("Ver tabela de consumo diário", key="exp_dados_detalhados", on_change="rerun")
+        if details.open:
+            with details:
+                st.dataframe(df, use_container_width=True)
+    else:
+        st.dataframe(df, use_container_width=True)
         
     # Informações adicionais na sidebar
     st.sidebar.header("ℹ️ Informações")
@@ -1053,10 +1140,197 @@ def dashboard_main():
     if not df.empty:
         st.sidebar.info(f"Período: {df['DataConsumo'].min().strftime('%d/%m/%Y')} a {df['DataConsumo'].max().strftime('%d/%m/%Y')}")
 
+    # Exportação do recorte atual (o arquivo só é gerado no clique, fora do rerun)
+    st.sidebar.header("📥 Exportar Dados")
+    export_frames = {
+        "Registros filtrados": ("diesel_registros", df_original),
+        "Consumo diário por setor": ("diesel_diario", df),
+    }
+    export_choice = st.sidebar.selectbox("Conjunto", list(export_frames), key="export_dataset")
+    export_format = st.sidebar.radio("Formato", list(data_export.FORMATOS), horizontal=True, key="export_format",
+                                     format_func=lambda f: data_export.FORMATOS[f][0])
+    export_base, export_df = export_frames[export_choice]
+    st.sidebar.download_button(
+        f"⬇️ Baixar {len(export_df)} linhas",
+        data=data_export.deferred(export_df, export_format),
+        file_name=data_export.file_name(export_base, export_format),
+        mime=data_export.FORMATOS[export_format][2],
+        on_click="ignore",
+        key="export_download"
+    )
+
     # Adiciona botão na sidebar para forçar refresh manual e clear cache
     if st.sidebar.button("🔄 Forçar Atualização"):
-        st.cache_data.clear()
+        # Invalida apenas os dados de diesel da versão atual (demais páginas e usuários mantêm o cache)
+        cache.invalidate("diesel", version=cache_key)
+        cache.invalidate("figures", version=cache_key)
         st.rerun()
+    
+    perf_tracker.since("diesel", "renderizacao_total", render_start)
+
+@st.fragment
+def equipment_section(file_path, start_date, end_date, cache_key):
+    """Gráficos por equipamento (fragmento: trocar o top-N ou o equipamento reexecuta só esta seção)"""
+    section_start = time.perf_counter()
+    matrix = tag_day_matrix(file_path, cache_key)
+    top_n = st.slider("Equipamentos exibidos por setor", 5, 40, 15, step=5, key="equipment_top_n",
+                      help="Os demais são somados em \"Outros\"")
+    fig_exp, fig_pen = cached_equipment_histogram(matrix, start_date, end_date, cache_key, top_n)
+    
+    col1, col2 = st.columns(2)
+    clicked = None
+    
+    for col, fig, setor in ((col1, fig_exp, 'Expedição'), (col2, fig_pen, 'Peneiramento')):
+        with col:
+            if fig:
+                event = st.plotly_chart(fig, use_container_width=True, on_select="rerun",
+                                        selection_mode="points", key=f"equipment_chart_{setor}")
+                points = event.selection.points if event else []
+                if points and not str(points[0].get('y', '')).startswith(equipment_matrix.OUTROS):
+                    clicked = (points[0]['y'], setor)
+            else:
+                st.warning(f"Não há dados de equipamentos para {setor} no período selecionado.")
+    
+    # Drill-down: clique numa barra (ou escolha na lista) para ver a série diária do equipamento
+    totals = matrix.totals(start_date, end_date)
+    totals = totals[totals['ConsumoDiesel'] != 0].sort_values('ConsumoDiesel', ascending=False)
+    if not totals.empty:
+        # Opções = posição do equipamento na matriz (par Setor, Tag)
+        options = totals.index.tolist()
+        row_of = {(t, sector): i for i, t, sector in zip(totals.index, totals['Tag'], totals['Setor'])}
+        if clicked and clicked != st.session_state.get("equipment_last_click") and clicked in row_of:
+            st.session_state["equipment_drilldown"] = row_of[clicked]
+        st.session_state["equipment_last_click"] = clicked
+        if st.session_state.get("equipment_drilldown") not in options:
+            st.session_state["equipment_drilldown"] = options[0]
+        row = st.selectbox("🔎 Detalhe do equipamento (clique numa barra para selecionar):", options,
+                           format_func=lambda i: f"{totals.at[i, 'Tag']} ({totals.at[i, 'Setor']})",
+                           key="equipment_drilldown")
+        tag, setor = totals.at[row, 'Tag'], totals.at[row, 'Setor']
+        fig_series, serie = create_equipment_series(matrix, tag, setor, start_date, end_date)
+        st.plotly_chart(fig_series, use_container_width=True)
+        active_days = int((serie != 0).sum())
+        st.caption(f"Consumo (Litros): total {format_number(serie.sum())} em {active_days} dia(s) com abastecimento "
+                   f"de {len(serie)} no período.")
+    
+    perf_tracker.since("diesel", "fragmento_equipamentos", section_start)
+
+# Rótulos dos efeitos da decomposição de custo
+COST_EFFECTS = {'volume': 'Volume', 'preco': 'Preço', 'mix': 'Mix'}
+
+@st.fragment
+def cost_variance_section(file_path, start_date, end_date, cache_key):
+    """Variação de custo entre o período selecionado e um período base (fragmento)"""
+    section_start = time.perf_counter()
+    today = date.today()
+    start = start_date or today.replace(day=1)
+    end = end_date or today
+    length = end - start
+    
+    base_mode = st.radio(
+        "Comparar com:",
+        ["Período anterior", "Mesmo período do ano anterior", "Personalizado"],
+        horizontal=True,
+        key="cost_variance_base"
+    )
+    if base_mode == "Período anterior":
+        base_end = start - timedelta(days=1)
+        base_start = base_end - length
+    elif base_mode == "Mesmo período do ano anterior":
+        base_start, base_end = (pd.Timestamp(start) - pd.DateOffset(years=1)).date(), (pd.Timestamp(end) - pd.DateOffset(years=1)).date()
+    else:
+        chosen = st.date_input("Período base", value=(start - timedelta(days=30), start - timedelta(days=1)),
+                               key="cost_variance_custom")
+        if len(chosen) != 2:
+            st.info("Selecione a data inicial e a final do período base.")
+            return
+        base_start, base_end = chosen
+    
+    matrix = tag_day_matrix(file_path, cache_key)
+    by_sector, by_tag = cached_cost_variance(matrix, base_start, base_end, start, end, cache_key)
+    if by_tag.empty:
+        st.warning("Não há abastecimentos nos períodos comparados.")
+        return
+    
+    total = by_sector.loc['Total']
+    st.caption(f"Base: {base_start.strftime('%d/%m/%Y')} a {base_end.strftime('%d/%m/%Y')} · "
+               f"Atual: {start.strftime('%d/%m/%Y')} a {end.strftime('%d/%m/%Y')} · custo = litros × custo unitário")
+    
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        fig = go.Figure(go.Waterfall(
+            x=["Custo base"] + list(COST_EFFECTS.values()) + ["Custo atual"],
+            y=[total['custo_base']] + [total[e] for e in COST_EFFECTS] + [total['custo_atual']],
+            measure=["absolute"] + ["relative"] * len(COST_EFFECTS) + ["total"],
+            text=[f"R$ {format_number(total['custo_base'])}"] + [f"R$ {format_number(total[e])}" for e in COST_EFFECTS] + [f"R$ {format_number(total['custo_atual'])}"],
+            increasing={'marker': {'color': PRIMARY_COLOR}},
+            decreasing={'marker': {'color': '#2E8B57'}},
+            totals={'marker': {'color': SECONDARY_COLOR}},
+        ))
+        fig.update_layout(height=400, title="Da base ao período atual (R$)", showlegend=False)
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        table = pd.DataFrame({
+            'Setor': by_sector.index,
+            'Variação (R$)': by_sector['variacao'].round(0),
+            **{f"{label} (R$)": by_sector[e].round(0) for e, label in COST_EFFECTS.items()},
+            'Preço base (R$/L)': by_sector['preco_base'].round(2),
+            'Preço atual (R$/L)': by_sector['preco_atual'].round(2),
+        })
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        main_effect = max(COST_EFFECTS, key=lambda e: abs(total[e]))
+        st.info(f"A maior parte da variação de R$ {format_number(abs(total['variacao']))} "
+                f"({'alta' if total['variacao'] >= 0 else 'queda'}) vem do efeito {COST_EFFECTS[main_effect].lower()}.")
+    
+    top = by_tag.reindex(by_tag['variacao'].abs().sort_values(ascending=False).index).head(10)
+    st.dataframe(pd.DataFrame({
+        'Equipamento': top['Tag'],
+        'Setor': top['Setor'],
+        'Litros base': top['litros_base'].round(0),
+        'Litros atual': top['litros_atual'].round(0),
+        'Variação (R$)': top['variacao'].round(0),
+        **{f"{label} (R$)": top[e].round(0) for e, label in COST_EFFECTS.items()},
+    }), use_container_width=True, hide_index=True)
+    perf_tracker.since("diesel", "fragmento_variacao_custo", section_start)
+
+def anomaly_section(file_path, start_date, end_date, cache_key, progressive=False):
+    """Abastecimentos fora do padrão do próprio equipamento (z-score robusto mediana/MAD)"""
+    detector = consumption_anomalies(file_path, cache_key)
+    anomalies = detector.anomalies(start_date, end_date)
+    st.caption(f"Consumo diário de cada equipamento comparado aos seus {equipment_matrix.JANELA_ANOMALIA} "
+               f"abastecimentos anteriores; |z| acima de {equipment_matrix.LIMIAR_Z} é sinalizado.")
+    if anomalies.empty:
+        st.success("Nenhum abastecimento anômalo no período selecionado.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Abastecimentos anômalos", len(anomalies))
+    with col2:
+        st.metric("Equipamentos afetados", anomalies[['Setor', 'Tag']].drop_duplicates().shape[0])
+    with col3:
+        above = anomalies[anomalies['z'] > 0]
+        st.metric("Excesso sobre a mediana", f"{format_number((above['ConsumoDiesel'] - above['mediana']).sum())} L")
+    
+    if progressive:
+        # A tabela só é montada quando o expander é aberto
+        details = st.expander("Ver abastecimentos anômalos", key="exp_anomalias", on_change="rerun")
+        if not details.open:
+            return
+        container = details
+    else:
+        container = st.container()
+    
+    table = pd.DataFrame({
+        'Data': anomalies['Data'].dt.strftime('%d/%m/%Y'),
+        'Setor': anomalies['Setor'],
+        'Equipamento': anomalies['Tag'],
+        'Consumo (L)': anomalies['ConsumoDiesel'].round(0),
+        'Mediana (L)': anomalies['mediana'].round(0),
+        'z robusto': anomalies['z'].round(1),
+        'Tipo': np.where(anomalies['z'] > 0, 'Acima do padrão', 'Abaixo do padrão'),
+    })
+    container.dataframe(table, use_container_width=True, hide_index=True)
 
 def main():
     # Verificar autenticação
@@ -1075,4 +1349,9 @@ def main():
     dashboard_main()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Execução marcada no painel de administração: roda sob cProfile + tracemalloc
+    marcacao = rerun_profiler.claim("diesel")
+    if marcacao:
+        rerun_profiler.profile("diesel", main, marcacao)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Exportação dos recortes exibidos nas páginas em CSV, Parquet ou XLSX.
+
+O DataFrame é percorrido em blocos de linhas (fatias sem cópia) e cada bloco
+é gravado num arquivo temporário em disco: CSV por ``to_csv`` incremental,
+Parquet por ``ParquetWriter`` (um row group por bloco) e XLSX pelo modo
+``write_only`` do openpyxl, que grava as linhas em fluxo com memória constante.
+
+``deferred`` devolve a função usada como ``data`` do ``st.download_button``: o
+Streamlit só a executa quando o usuário clica, numa thread separada do rerun,
+então exportações grandes não travam a página nem as demais sessões.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+LINHAS_POR_BLOCO = 50_000
+# formato -> (rótulo, extensão, MIME)
+FORMATOS = {
+    'csv': ('CSV', '.csv', 'text/csv'),
+    'parquet': ('Parquet', '.parquet', 'application/vnd.apache.parquet'),
+    'xlsx': ('Excel (XLSX)', '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+LIMITE_LINHAS_XLSX = 1_048_575  # linhas de dados de uma planilha (além do cabeçalho)
+
+
+def _blocos(df, linhas=LINHAS_POR_BLOCO):
+    for inicio in range(0, len(df), linhas):
+        yield df.iloc[inicio:inicio + linhas]
+
+
+def write_csv(df, destino, linhas=LINHAS_POR_BLOCO):
+    """CSV para o Excel em português: UTF-8 com BOM, ``;`` como separador e vírgula decimal"""
+    destino.write(b'\xef\xbb\xbf')
+    if df.empty:
+        destino.write(df.to_csv(sep=';', decimal=',', index=False).encode('utf-8'))
+        return
+    for i, bloco in enumerate(_blocos(df, linhas)):
+        destino.write(bloco.to_csv(sep=';', decimal=',', index=False, header=i == 0,
+                                   date_format='%Y-%m-%d %H:%M:%S').encode('utf-8'))
+
+
+def write_parquet(df, destino, linhas=LINHAS_POR_BLOCO):
+    """Parquet com um row group por bloco e o esquema inferido do primeiro"""
+    esquema, escritor = None, None
+    try:
+        for bloco in _blocos(df, linhas) if not df.empty else [df]:
+            tabela = pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False)
+            if escritor is None:
+                esquema = tabela.schema
+                escritor = pq.ParquetWriter(destino, esquema)
+            escritor.write_table(tabela)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def _celula(valor):
+    """Valores do pandas/numpy -> tipos aceitos pelo openpyxl (nulos viram célula vazia)"""
+    if valor is None or valor is pd.NaT or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime().replace(tzinfo=None)
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def write_xlsx(df, destino, aba='Dados', linhas=LINHAS_POR_BLOCO):
+    """XLSX em modo ``write_only`` (linhas gravadas em fluxo, sem montar a planilha na memória)"""
+    if len(df) > LIMITE_LINHAS_XLSX:
+        raise ValueError(f"O Excel aceita até {LIMITE_LINHAS_XLSX:,} linhas; use CSV ou Parquet".replace(",", "."))
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet(aba[:31])
+    planilha.append([str(c) for c in df.columns])
+    for bloco in _blocos(df, linhas):
+        for linha in bloco.itertuples(index=False, name=None):
+            planilha.append([_celula(v) for v in linha])
+    livro.save(destino)
+
+
+ESCRITORES = {'csv': write_csv, 'parquet': write_parquet, 'xlsx': write_xlsx}
+
+
+def export_file(df, formato):
+    """
+    Grava ``df`` num arquivo temporário e o devolve aberto para leitura. O
+    arquivo é removido do disco logo após aberto (no Windows, ao ser fechado
+    ou na limpeza do diretório temporário).
+    """
+    fd, caminho = tempfile.mkstemp(prefix='export-', suffix=FORMATOS[formato][1])
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            ESCRITORES[formato](df, destino)
+        arquivo = open(caminho, 'rb')
+    except Exception:
+        os.remove(caminho)
+        raise
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+    return arquivo
+
+
+def deferred(df, formato):
+    """Função sem argumentos para o ``data`` do ``st.download_button`` (gera o arquivo só no clique)"""
+    return lambda: export_file(df, formato)
+
+
+def file_name(base, formato):
+    """Nome do arquivo baixado, com a data de hoje"""
+    return f"{base}_{pd.Timestamp.today():%Y%m%d}{FORMATOS[formato][1]}"
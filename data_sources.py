@@ -0,0 +1,211 @@
+"""
+Leitura das planilhas de diesel, produção e qualidade sem dependência do Streamlit.
+
+Os dashboards são scripts (não importáveis), então o parsing de cada fonte
+vive aqui e é usado tanto pelas próprias páginas quanto por quem cruza as
+fontes (página de Eficiência). Erros de formato levantam exceções; cada página
+decide como exibi-las.
+
+Os datasets compartilhados (``shared_datasets``) usam os mesmos nomes em todas
+as páginas — "diesel", "producao" e "qualidade" —, então quem publicar primeiro
+uma versão serve as demais.
+"""
+
+import base64
+import io
+import os
+import re
+import unicodedata
+
+import pandas as pd
+from cryptography.fernet import Fernet
+
+import production_analytics
+
+DIESEL_FILE = "Diesel-area.encrypted"
+PRODUCTION_FILE = "Informativo_Operacional.encrypted"
+QUALITY_FILE = "Relatorio_Qualidade.encrypted"
+
+PRODUCTION_SHEET = "BD_Real"
+PRODUCTION_COLUMNS = {'2025_Data': 'data', **production_analytics.column_map('PENEIRAMENTO MSC_Santa Cruz - Tupacery')}
+QUALITY_SHEET = "RESUMO GR"
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+
+def fernet_from_hex(hex_key):
+    """Fernet a partir da chave hexadecimal guardada nos segredos"""
+    return Fernet(base64.urlsafe_b64encode(bytes.fromhex(hex_key)))
+
+
+def read_hex_key(secrets_file=SECRETS_FILE):
+    """Chave HEX para processos fora do Streamlit: ``HEX_KEY_STRING`` do ambiente ou do ``secrets.toml``"""
+    hex_key = os.environ.get("HEX_KEY_STRING")
+    if not hex_key and os.path.exists(secrets_file):
+        import tomllib
+        with open(secrets_file, "rb") as f:
+            hex_key = tomllib.load(f).get("HEX_KEY_STRING")
+    return hex_key
+
+
+def decrypt_file(path, fernet):
+    with open(path, "rb") as f:
+        return fernet.decrypt(f.read())
+
+
+# ========== DIESEL ==========
+def parse_diesel(excel_file):
+    """Padroniza a planilha de diesel completa (sem filtro de data)"""
+    df = pd.read_excel(excel_file)
+
+    # Renomear colunas para facilitar o uso
+    df.rename(columns={
+        'data de Inclusão': 'DataInclusao',
+        'Quantidade': 'ConsumoDiesel',
+        'Valo Unitário': 'CustoUnitario',
+        'Valor Total': 'CustoTotalAbastecimento',
+        'Área': 'Setor',
+        'Dia': 'DataConsumo'
+    }, inplace=True)
+
+    # Converter as colunas de data para datetime
+    df['DataInclusao'] = pd.to_datetime(df['DataInclusao'])
+    df['DataConsumo'] = pd.to_datetime(df['DataConsumo'])
+
+    # Filtrar apenas os setores 'Tup' e 'Rep'
+    df = df[df['Setor'].isin(['Tup', 'Rep'])].copy()
+
+    # Renomear 'Tup' para 'Expedição' e 'Rep' para 'Peneiramento'
+    df['Setor'] = df['Setor'].replace({'Tup': 'Expedição', 'Rep': 'Peneiramento'})
+
+    # Garantir que o consumo e custos são numéricos
+    df['ConsumoDiesel'] = pd.to_numeric(df['ConsumoDiesel'], errors='coerce')
+    df['CustoUnitario'] = pd.to_numeric(df['CustoUnitario'], errors='coerce')
+    df['CustoTotalAbastecimento'] = pd.to_numeric(df['CustoTotalAbastecimento'], errors='coerce')
+    df.dropna(subset=['ConsumoDiesel', 'CustoUnitario', 'CustoTotalAbastecimento'], inplace=True)
+    return df.reset_index(drop=True)
+
+
+# ========== PRODUÇÃO ==========
+def parse_production(excel_bytes):
+    """Aba BD_Real com uma coluna por peneira/produto do registro e ``total_dia``"""
+    df = pd.read_excel(io.BytesIO(excel_bytes), sheet_name=PRODUCTION_SHEET, header=[0, 1, 2])
+    df.columns = ['_'.join([str(c) for c in col if 'Unnamed' not in str(c)]).strip() for col in df.columns]
+    df = df.rename(columns={k: v for k, v in PRODUCTION_COLUMNS.items() if k in df.columns})
+
+    cols_keep = [col for col in PRODUCTION_COLUMNS.values() if col in df.columns]
+    if 'data' not in cols_keep:
+        raise ValueError("Coluna 'data' não encontrada")
+
+    df = df[cols_keep].dropna(subset=['data'], how='all')
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    df = df.dropna(subset=['data'])
+
+    for col in df.columns:
+        if col != 'data':
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    df['total_dia'] = sum(df.get(col, 0) for col in production_analytics.PRODUTOS)
+    return df.reset_index(drop=True)
+
+
+# ========== QUALIDADE ==========
+def norm_text(x):
+    x = ''.join(c for c in unicodedata.normalize('NFD', str(x).strip().lower()) if unicodedata.category(c) != 'Mn')
+    return re.sub(r'\s+', ' ', x.replace('%', '').replace('(', '').replace(')', '').replace(',', '.'))
+
+
+def map_col(col):
+    s = norm_text(col)
+    mappings = {r'\bfe\b': 'Fe', r'sio2|si o2|silica': 'SiO2', r'al2o3|alumina': 'Al2O3',
+                r'\bp\b': 'P', r'\bmn\b': 'Mn', r'ton': 'Ton', r'loi': 'LOI', r'\bmm\b': 'TMP',
+                r'(\+|>) *31(\.|,)5': '>31_5mm', r'- *12(?!.*umidade)': '_col1', r'- *6(\.|,)3': '_col2',
+                r'total': 'TOTAL', r'data': 'Data'}
+    for pattern, replacement in mappings.items():
+        if re.search(pattern, s):
+            return replacement
+    return col.strip()
+
+
+def flatten_cols(df):
+    if not isinstance(df.columns, pd.MultiIndex):
+        return df
+    new_cols = []
+    for col in df.columns:
+        if isinstance(col, tuple):
+            a, b = col
+            a_txt = '' if pd.isna(a) else str(a).strip()
+            b_txt = '' if pd.isna(b) else str(b).strip()
+            new_cols.append(b_txt if b_txt else a_txt if a_txt else f"{a}_{b}")
+        else:
+            new_cols.append(str(col))
+    df.columns = new_cols
+    return df
+
+
+def process_block(df_block):
+    df_block = flatten_cols(df_block)
+    df_block.rename(columns={c: map_col(c) for c in df_block.columns}, inplace=True)
+
+    # Fix duplicate columns
+    cols, seen, new_cols = list(df_block.columns), {}, []
+    for c in cols:
+        if c in seen:
+            seen[c] += 1
+            new_cols.append(f"{c}_{seen[c]}")
+        else:
+            seen[c] = 1
+            new_cols.append(c)
+    df_block.columns = new_cols
+
+    # Find date column
+    date_col = next((c for c in df_block.columns if 'data' in norm_text(c)), df_block.columns[0])
+    df_block.rename(columns={date_col: 'Data'}, inplace=True)
+
+    # Convert types
+    df_block['Data'] = pd.to_datetime(df_block['Data'], errors='coerce')
+    for col in df_block.columns:
+        if col != 'Data':
+            df_block[col] = pd.to_numeric(df_block[col], errors='coerce')
+
+    # Calculate <0_15mm
+    if '_col1' in df_block.columns and '_col2' in df_block.columns:
+        df_block['<0_15mm'] = df_block['_col1'].fillna(0) + df_block['_col2'].fillna(0)
+
+    return df_block
+
+
+def parse_quality(excel_bytes):
+    """Aba RESUMO GR com os blocos PMT 01/PMT 02 empilhados (coluna 'Peneira')"""
+    df_raw = pd.read_excel(io.BytesIO(excel_bytes), sheet_name=QUALITY_SHEET, header=[0, 1], nrows=34, engine='openpyxl')
+
+    # Detect blocks (simplified)
+    blocks = [(260, 267), (709, 716)]  # Default positions
+    try:
+        lvl1 = [norm_text(x) if not pd.isna(x) else '' for x in df_raw.columns.get_level_values(1)]
+        starts = [i for i, v in enumerate(lvl1) if 'data' in v]
+        if len(starts) >= 2:
+            blocks = [(starts[0], starts[1] - 1), (starts[1], df_raw.shape[1] - 1)][:2]
+    except Exception:
+        pass
+
+    # Process blocks
+    s1, e1 = blocks[0]
+    s2, e2 = blocks[1]
+    pmt01 = process_block(df_raw.iloc[:, s1:e1 + 1].copy())
+    pmt02 = process_block(df_raw.iloc[:, s2:e2 + 1].copy())
+    pmt01['Peneira'] = 'PMT 01'
+    pmt02['Peneira'] = 'PMT 02'
+    return pd.concat([pmt01, pmt02], ignore_index=True)
+
+
+# ========== LEITURA DOS ARQUIVOS DO REPOSITÓRIO ==========
+def read_diesel(path, fernet):
+    return parse_diesel(io.BytesIO(decrypt_file(path, fernet)))
+
+
+def read_production(path, fernet):
+    return parse_production(decrypt_file(path, fernet))
+
+
+def read_quality(path, fernet):
+    return parse_quality(decrypt_file(path, fernet))
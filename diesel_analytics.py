@@ -0,0 +1,298 @@
+"""
+Projeção de fechamento do mês de diesel por setor e dia da semana.
+
+O ``ProjectionEngine`` ajusta, uma vez por versão da planilha, um perfil de
+consumo e custo por setor e dia da semana sobre todo o histórico diário (dias
+sem abastecimento contam como 0), com peso exponencial que favorece as semanas
+recentes. A projeção soma o perfil de cada dia do calendário que falta no mês,
+com banda de confiança pela soma das variâncias diárias.
+
+``cost_variance`` decompõe a variação de custo entre dois períodos em efeitos
+de volume, preço e mix por setor e equipamento, recortando os totais da matriz
+Tag × dia (``equipment_matrix``) em vez de reagrupar os registros.
+
+``daily_consumption`` e ``calculate_kpis`` montam os KPIs do período exibidos
+no dashboard e servidos pelo ``kpi_service``; ``current_month`` define o
+período "mês atual" dos dois.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+SETORES = ('Expedição', 'Peneiramento')
+METRICAS = {'consumo': 'ConsumoDiesel', 'custo': 'CustoTotalAbastecimento'}
+DIAS_SEMANA = ('Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo')
+MEIA_VIDA_DIAS = 91       # peso de um dia cai pela metade a cada trimestre de idade
+Z_BANDA = 1.2816          # banda de 80% (P10-P90) pela aproximação normal
+
+
+class ProjectionEngine:
+    """
+    Perfis ponderados (média e variância) por setor × dia da semana para cada
+    métrica. O último dia da planilha fica fora do ajuste por poder estar
+    incompleto.
+    """
+
+    def __init__(self, df, meia_vida=MEIA_VIDA_DIAS):
+        self.meia_vida = meia_vida
+        colunas = pd.MultiIndex.from_product([list(METRICAS.values()), SETORES])
+        if df is None or df.empty:
+            self.dias = 0
+            self.media = self.variancia = pd.DataFrame(0.0, index=range(7), columns=colunas)
+            return
+
+        diario = df.groupby([df['DataConsumo'].dt.normalize(), 'Setor'])[list(METRICAS.values())].sum()
+        diario = diario.unstack('Setor', fill_value=0).reindex(columns=colunas, fill_value=0)
+        datas = pd.date_range(diario.index.min(), diario.index.max(), freq='D')
+        diario = diario.reindex(datas, fill_value=0).iloc[:-1]
+        self.dias = len(diario)
+        if diario.empty:
+            self.media = self.variancia = pd.DataFrame(0.0, index=range(7), columns=colunas)
+            return
+
+        # Média e variância ponderadas por dia da semana: soma de pesos via matriz indicadora (7 × dias)
+        x = diario.to_numpy(dtype=float)
+        idade = (datas[-1] - diario.index).days.to_numpy()
+        peso = 0.5 ** (idade / meia_vida)
+        indicadora = np.zeros((7, len(diario)))
+        indicadora[diario.index.dayofweek, np.arange(len(diario))] = peso
+        soma_pesos = indicadora.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = np.where(soma_pesos > 0, indicadora @ x / soma_pesos, 0.0)
+            variancia = np.where(soma_pesos > 0, indicadora @ (x ** 2) / soma_pesos - media ** 2, 0.0)
+        self.media = pd.DataFrame(media, index=range(7), columns=colunas)
+        self.variancia = pd.DataFrame(np.clip(variancia, 0, None), index=range(7), columns=colunas)
+
+    def profile(self, metrica='consumo'):
+        """Média esperada por dia da semana (linhas) e setor (colunas)"""
+        perfil = self.media[METRICAS[metrica]].copy()
+        perfil.index = DIAS_SEMANA
+        return perfil
+
+    def project(self, hoje, realizado=None):
+        """
+        Fechamento do mês de ``hoje``: ``realizado`` ({metrica: {setor: valor}})
+        mais o perfil dos dias de amanhã até o fim do mês. Devolve, por métrica,
+        o esperado, P10 e P90 (totais e por setor) e o número de dias restantes.
+        """
+        hoje = pd.Timestamp(hoje).normalize()
+        fim_mes = hoje + pd.offsets.MonthEnd(0)
+        restantes = pd.date_range(hoje + pd.Timedelta(days=1), fim_mes, freq='D')
+        contagem = np.bincount(restantes.dayofweek, minlength=7)
+        realizado = realizado or {}
+
+        resultado = {'dias_restantes': len(restantes)}
+        for metrica, coluna in METRICAS.items():
+            feito = realizado.get(metrica, {})
+            esperado_setor = contagem @ self.media[coluna].to_numpy()
+            variancia_setor = contagem @ self.variancia[coluna].to_numpy()
+            base = sum(feito.get(s, 0) for s in SETORES)
+            esperado = base + esperado_setor.sum()
+            desvio = np.sqrt(variancia_setor.sum())
+            resultado[metrica] = {
+                'esperado': esperado,
+                'p10': max(esperado - Z_BANDA * desvio, base),
+                'p90': esperado + Z_BANDA * desvio,
+                'por_setor': {s: feito.get(s, 0) + e for s, e in zip(SETORES, esperado_setor)},
+            }
+        return resultado
+
+
+# ========== KPIs DO PERÍODO ==========
+def current_month(today=None):
+    """Período "mês atual" (dashboard e ``kpi_service``): do dia 1 até ``today`` (hoje por padrão)"""
+    today = pd.Timestamp(today or date.today()).date()
+    return today.replace(day=1), today
+
+
+def daily_consumption(df, start_date=None, end_date=None):
+    """Consumo e custo diários por setor, com acumulados, no período [start_date, end_date]"""
+    if start_date and end_date:
+        df = df[(df['DataConsumo'] >= pd.to_datetime(start_date)) & (df['DataConsumo'] <= pd.to_datetime(end_date))]
+    daily_data = df.groupby(['DataConsumo', 'Setor']).agg(
+        ConsumoDiario=('ConsumoDiesel', 'sum'),
+        CustoDiario=('CustoTotalAbastecimento', 'sum')
+    ).reset_index()
+    daily_data = daily_data.sort_values(by=['DataConsumo', 'Setor'])
+    daily_data['ConsumoAcumulado'] = daily_data.groupby('Setor')['ConsumoDiario'].cumsum()
+    daily_data['CustoAcumulado'] = daily_data.groupby('Setor')['CustoDiario'].cumsum()
+    return daily_data, df
+
+
+def calculate_kpis(df, period_type="month", projection_engine=None, today=None):
+    """
+    KPIs do período a partir do consumo diário por setor (``daily_consumption``).
+    No período mensal, só entram os dias de ``current_month(today)`` e a projeção
+    de fechamento usa ``projection_engine`` quando fornecido. Erros de dados
+    propagam; cada consumidor decide como exibi-los.
+    """
+    if df.empty:
+        return {}
+
+    today = pd.to_datetime(today or date.today()).normalize()
+
+    # Ajustar cálculo baseado no tipo de período
+    if period_type == "month":
+        # Só o mês corrente até hoje: a projeção soma o realizado do mês ao perfil dos dias restantes
+        month_start, _ = current_month(today)
+        df = df[(df['DataConsumo'] >= pd.Timestamp(month_start)) & (df['DataConsumo'] <= today)]
+        # Excluindo o dia atual para cálculo de tendência e projeção
+        current_period_data_complete_days = df[df['DataConsumo'] < today]
+    else:
+        # Para períodos personalizados, usar todos os dados exceto o último dia
+        unique_dates = sorted(df['DataConsumo'].unique())
+        if len(unique_dates) > 1:
+            current_period_data_complete_days = df[df['DataConsumo'] < unique_dates[-1]]
+        else:
+            current_period_data_complete_days = df
+
+    # Consumo acumulado do período
+    total_consumed_expedicao = df[df['Setor'] == 'Expedição']['ConsumoDiario'].sum()
+    total_consumed_peneiramento = df[df['Setor'] == 'Peneiramento']['ConsumoDiario'].sum()
+    total_consumed_period = total_consumed_expedicao + total_consumed_peneiramento
+
+    # Custo total acumulado do período
+    total_cost_expedicao = df[df['Setor'] == 'Expedição']['CustoDiario'].sum()
+    total_cost_peneiramento = df[df['Setor'] == 'Peneiramento']['CustoDiario'].sum()
+    total_cost_period = total_cost_expedicao + total_cost_peneiramento
+
+    # Custo médio do litro de diesel (total de custo / total de consumo)
+    avg_liter_cost = total_cost_period / total_consumed_period if total_consumed_period > 0 else 0
+
+    # Consumo médio diário (para projeção, baseado em dias completos)
+    days_in_period_so_far = len(current_period_data_complete_days['DataConsumo'].unique())
+    avg_daily_consumption = current_period_data_complete_days['ConsumoDiario'].sum() / days_in_period_so_far if days_in_period_so_far > 0 else 0
+
+    # Custo médio diário (para projeção, baseado em dias completos)
+    avg_daily_cost = current_period_data_complete_days['CustoDiario'].sum() / days_in_period_so_far if days_in_period_so_far > 0 else 0
+
+    # Estimativa de fechamento (apenas para período mensal)
+    projection = None
+    if period_type == "month" and projection_engine is not None:
+        # Perfil por setor e dia da semana aplicado aos dias que faltam no mês
+        projection = projection_engine.project(today, {
+            'consumo': {'Expedição': total_consumed_expedicao, 'Peneiramento': total_consumed_peneiramento},
+            'custo': {'Expedição': total_cost_expedicao, 'Peneiramento': total_cost_peneiramento},
+        })
+        projected_consumption = projection['consumo']['esperado']
+        projected_cost = projection['custo']['esperado']
+    elif period_type == "month":
+        last_day_of_month = (pd.Timestamp(today.year, today.month, 1) + pd.DateOffset(months=1) - pd.DateOffset(days=1)).day
+        days_remaining_in_month = last_day_of_month - today.day
+        projected_consumption = total_consumed_period + (avg_daily_consumption * days_remaining_in_month)
+        projected_cost = total_cost_period + (avg_daily_cost * days_remaining_in_month)
+    else:
+        projected_consumption = total_consumed_period
+        projected_cost = total_cost_period
+
+    # Tendência do ritmo de abastecimento (baseado nos últimos 7 dias completos)
+    trend_data = current_period_data_complete_days.sort_values('DataConsumo').tail(7)
+    trend = 'Não há dados suficientes'
+    if len(trend_data) >= 6:
+        avg_last_3_days = trend_data['ConsumoDiario'].tail(3).mean()
+        avg_prev_3_days = trend_data['ConsumoDiario'].iloc[-6:-3].mean()
+
+        if avg_prev_3_days == 0:
+            trend = 'Estável (sem consumo anterior para comparação)'
+        elif avg_last_3_days > avg_prev_3_days * 1.05:
+            trend = 'Aumentando'
+        elif avg_last_3_days < avg_prev_3_days * 0.95:
+            trend = 'Diminuindo'
+        else:
+            trend = 'Estável'
+    elif len(current_period_data_complete_days['DataConsumo'].unique()) >= 2:
+        unique_dates = sorted(current_period_data_complete_days['DataConsumo'].unique())
+        last_day_consumption = current_period_data_complete_days[current_period_data_complete_days['DataConsumo'] == unique_dates[-1]]['ConsumoDiario'].sum()
+        second_last_day_consumption = current_period_data_complete_days[current_period_data_complete_days['DataConsumo'] == unique_dates[-2]]['ConsumoDiario'].sum()
+        if last_day_consumption > second_last_day_consumption:
+            trend = 'Aumentando'
+        elif last_day_consumption < second_last_day_consumption:
+            trend = 'Diminuindo'
+        else:
+            trend = 'Estável'
+
+    kpis = {
+        'total_consumed_period': total_consumed_period,
+        'avg_daily_consumption': avg_daily_consumption,
+        'projected_consumption': projected_consumption,
+        'trend': trend,
+        'total_consumed_expedicao': total_consumed_expedicao,
+        'total_consumed_peneiramento': total_consumed_peneiramento,
+        'total_cost_period': total_cost_period,
+        'avg_daily_cost': avg_daily_cost,
+        'projected_cost': projected_cost,
+        'avg_liter_cost': avg_liter_cost
+    }
+    if projection:
+        profile = projection_engine.profile('consumo').sum(axis=1)
+        kpis.update({
+            'projected_consumption_p10': projection['consumo']['p10'],
+            'projected_consumption_p90': projection['consumo']['p90'],
+            'projected_cost_p10': projection['custo']['p10'],
+            'projected_cost_p90': projection['custo']['p90'],
+            'projected_consumption_by_sector': projection['consumo']['por_setor'],
+            'days_remaining': projection['dias_restantes'],
+            'busiest_weekday': profile.idxmax(),
+            'quietest_weekday': profile.idxmin(),
+            'weekday_ratio': profile.max() / profile.min() if profile.min() > 0 else None,
+        })
+    return kpis
+
+
+# ========== DECOMPOSIÇÃO PREÇO × VOLUME × MIX ==========
+def cost_variance(matrix, base, atual):
+    """
+    Decomposição da variação de custo (litros × ``CustoUnitario``) entre os
+    períodos ``base`` e ``atual`` (pares início, fim). Para cada equipamento i
+    de um setor com litros totais Q, participação s_i, preço médio p_i e preço
+    médio do setor P:
+
+    - volume = s_i,base × (Q_atual − Q_base) × p_i,base
+    - mix    = (s_i,atual − s_i,base) × Q_atual × p_i,base
+    - preço  = q_i,atual × (p_i,atual − p_i,base)
+
+    Os três somam exatamente a variação de custo do equipamento. Equipamentos
+    sem consumo no período base usam o preço médio do setor na base. Devolve
+    ``(por_setor, por_tag)``; ``por_setor`` soma os equipamentos e tem uma linha
+    ``Total``.
+    """
+    colunas = ['ConsumoDiesel', 'CustoCalculado']
+    a = pd.concat([matrix.totals(*base, value_col=c)[c] for c in colunas], axis=1).to_numpy()
+    b = pd.concat([matrix.totals(*atual, value_col=c)[c] for c in colunas], axis=1).to_numpy()
+    setor = matrix.linhas['Setor'].to_numpy()
+    q_a, c_a, q_b, c_b = a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+
+    # Totais do setor de cada linha (soma por grupo devolvida à linha)
+    codigo, _ = pd.factorize(setor)
+    por_grupo = lambda x: np.bincount(codigo, weights=x, minlength=codigo.max() + 1)[codigo] if len(codigo) else x
+    Q_a, Q_b, C_a = por_grupo(q_a), por_grupo(q_b), por_grupo(c_a)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        preco_setor_a = np.where(Q_a > 0, C_a / Q_a, 0.0)
+        p_a = np.where(q_a > 0, c_a / q_a, preco_setor_a)
+        p_b = np.where(q_b > 0, c_b / q_b, 0.0)
+        s_a = np.where(Q_a > 0, q_a / Q_a, 0.0)
+        s_b = np.where(Q_b > 0, q_b / Q_b, 0.0)
+
+    por_tag = matrix.linhas.assign(
+        litros_base=q_a, litros_atual=q_b, custo_base=c_a, custo_atual=c_b,
+        preco_base=np.where(q_a > 0, p_a, np.nan), preco_atual=np.where(q_b > 0, p_b, np.nan),
+        volume=s_a * (Q_b - Q_a) * p_a,
+        mix=(s_b - s_a) * Q_b * p_a,
+        preco=q_b * (p_b - p_a),
+    )
+    # Setor sem consumo na base: toda a variação é volume (não há preço de referência)
+    sem_base = Q_a == 0
+    por_tag.loc[sem_base, 'volume'] = c_b[sem_base]
+    por_tag.loc[sem_base, ['mix', 'preco']] = 0.0
+    por_tag['variacao'] = por_tag['custo_atual'] - por_tag['custo_base']
+    por_tag = por_tag[(q_a != 0) | (q_b != 0)].reset_index(drop=True)
+
+    somas = ['litros_base', 'litros_atual', 'custo_base', 'custo_atual', 'volume', 'preco', 'mix', 'variacao']
+    por_setor = por_tag.groupby('Setor')[somas].sum()
+    por_setor.loc['Total'] = por_setor.sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        por_setor['preco_base'] = por_setor['custo_base'] / por_setor['litros_base']
+        por_setor['preco_atual'] = por_setor['custo_atual'] / por_setor['litros_atual']
+    return por_setor, por_tag
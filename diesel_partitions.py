@@ -0,0 +1,285 @@
+"""
+Histórico de diesel particionado por mês, cada partição criptografada à parte.
+
+A planilha ``Diesel-area.encrypted`` cresce sem parar e precisava ser
+descriptografada e lida inteira mesmo para exibir um único mês. A migração
+(``python diesel_partitions.py``) lê a planilha uma vez e grava em
+``diesel_particoes/`` um arquivo Parquet criptografado (Fernet) por mês de
+``DataConsumo``, mais um ``manifest.json`` com o intervalo de datas, o número
+de linhas e os digests de cada partição e o digest da planilha de origem.
+
+Leitura:
+- ``load_range`` abre só as partições que cruzam o período pedido;
+- ``read_history`` é o builder do dataset compartilhado "diesel": remonta o
+  histórico completo a partir das partições (bem mais barato que ler o XLSX)
+  e, quando a planilha mudou, lê a planilha uma vez e refaz a migração;
+- as partições só são usadas enquanto refletem a planilha atual (mesmo
+  digest). Como o builder roda sob o lock exclusivo do dataset, só o primeiro
+  processo a ver a nova versão relê a planilha; os demais, e as leituras por
+  período, voltam às partições atualizadas.
+
+A ordem original das linhas é preservada (coluna interna ``_linha``), então o
+DataFrame remontado é igual ao de ``data_sources.read_diesel``. Uma nova
+migração só grava os meses cujo conteúdo mudou (normalmente só o mês corrente).
+O nome de cada arquivo leva o digest do conteúdo: um mês alterado vira um
+arquivo novo e o anterior só é apagado depois da troca do manifesto, então
+quem ainda usa o manifesto anterior continua lendo arquivos válidos.
+
+Uso:
+    python diesel_partitions.py --source Diesel-area.encrypted --out diesel_particoes
+    python diesel_partitions.py --verify
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import data_sources
+import shared_datasets
+
+PARTITION_DIR = "diesel_particoes"
+MANIFEST_FILE = "manifest.json"
+FORMATO = 1
+SEM_DATA = "sem-data"  # linhas sem DataConsumo: entram no histórico, nunca num período
+COLUNA_ORDEM = "_linha"
+
+# Digest da planilha de origem por versão (tamanho-mtime), para não reler o arquivo a cada rerun
+_digests = {}
+_lock = threading.Lock()
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def source_digest(path):
+    """Digest do conteúdo do arquivo, calculado uma vez por versão (tamanho e mtime)"""
+    versao = shared_datasets.file_version(path)
+    with _lock:
+        if (path, versao) in _digests:
+            return _digests[(path, versao)]
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while bloco := f.read(1024 * 1024):
+            hasher.update(bloco)
+    with _lock:
+        _digests[(path, versao)] = hasher.hexdigest()
+    return _digests[(path, versao)]
+
+
+# ========== MANIFESTO ==========
+def read_manifest(directory=PARTITION_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def active_manifest(source=data_sources.DIESEL_FILE, directory=PARTITION_DIR):
+    """Manifesto das partições, se elas refletem a planilha atual (ou se só existem as partições); senão None"""
+    manifest = read_manifest(directory)
+    if not manifest or manifest.get("formato") != FORMATO:
+        return None
+    if os.path.exists(source) and source_digest(source) != manifest["origem"]["digest"]:
+        return None
+    return manifest
+
+
+def history_available(source=data_sources.DIESEL_FILE, directory=PARTITION_DIR):
+    return os.path.exists(source) or active_manifest(source, directory) is not None
+
+
+def history_version(source=data_sources.DIESEL_FILE, directory=PARTITION_DIR):
+    """
+    Versão do histórico para os caches: a da planilha quando ela existe (as
+    partições ativas têm o mesmo conteúdo) ou o digest de origem do manifesto.
+    """
+    if os.path.exists(source):
+        return shared_datasets.file_version(source)
+    manifest = active_manifest(source, directory)
+    return f"particoes-{manifest['origem']['digest']}" if manifest else None
+
+
+# ========== LEITURA ==========
+def read_partition(entry, fernet, directory=PARTITION_DIR):
+    """DataFrame de uma partição, conferindo o digest do arquivo criptografado"""
+    with open(os.path.join(directory, entry["arquivo"]), "rb") as f:
+        cifrado = f.read()
+    if _digest(cifrado) != entry["digest"]:
+        raise ValueError(f"Partição {entry['arquivo']} não confere com o manifesto")
+    return pq.read_table(io.BytesIO(fernet.decrypt(cifrado))).to_pandas()
+
+
+def _overlaps(entry, inicio, fim):
+    if entry["inicio"] is None:
+        return inicio is None and fim is None
+    return (fim is None or entry["inicio"] <= fim) and (inicio is None or entry["fim"] >= inicio)
+
+
+def _combine(partes):
+    df = pd.concat(partes, ignore_index=True) if partes else None
+    if df is None:
+        return None
+    return df.sort_values(COLUNA_ORDEM, kind="stable").drop(columns=COLUNA_ORDEM).reset_index(drop=True)
+
+
+def load_range(fernet, start_date=None, end_date=None, manifest=None, directory=PARTITION_DIR, reader=None):
+    """
+    Linhas com ``DataConsumo`` em [start_date, end_date], lendo só as partições
+    que cruzam o período. ``reader(entry)`` permite cachear partições já lidas.
+    """
+    manifest = manifest or active_manifest(directory=directory)
+    inicio = pd.Timestamp(start_date).date().isoformat() if start_date is not None else None
+    fim = pd.Timestamp(end_date).date().isoformat() if end_date is not None else None
+    reader = reader or (lambda entry: read_partition(entry, fernet, directory))
+    partes = [reader(entry) for entry in manifest["particoes"] if _overlaps(entry, inicio, fim)]
+    df = _combine(partes)
+    if df is None:
+        return pd.DataFrame(columns=list(manifest["colunas"])).astype(manifest["colunas"])
+    if inicio is not None or fim is not None:
+        mascara = pd.Series(True, index=df.index)
+        if inicio is not None:
+            mascara &= df["DataConsumo"] >= pd.Timestamp(start_date)
+        if fim is not None:
+            mascara &= df["DataConsumo"] <= pd.Timestamp(end_date)
+        df = df[mascara]
+    return df
+
+
+def read_history(source, fernet, directory=PARTITION_DIR):
+    """
+    Histórico completo (builder do dataset "diesel"): das partições se ativas;
+    senão lê a planilha e atualiza as partições com ela. Se as partições não
+    puderem ser gravadas (disco cheio, somente leitura), devolve a planilha lida.
+    """
+    manifest = active_manifest(source, directory)
+    if manifest is not None:
+        return load_range(fernet, manifest=manifest, directory=directory)
+    df = data_sources.read_diesel(source, fernet)
+    try:
+        _write_partitions(df, source, fernet, directory)
+    except OSError:
+        pass
+    return df
+
+
+# ========== MIGRAÇÃO ==========
+def _parquet(df):
+    buffer = io.BytesIO()
+    pq.write_table(shared_datasets.to_table(df), buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def _gravar(path, data):
+    temporario = f"{path}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(data)
+    os.replace(temporario, path)
+
+
+def migrate(source, fernet, directory=PARTITION_DIR):
+    """
+    Divide a planilha em partições mensais e grava o manifesto (por último,
+    atomicamente). Meses com o mesmo conteúdo da migração anterior não são
+    regravados; partições substituídas ou de meses que sumiram da planilha são
+    removidas depois do manifesto. Devolve o manifesto.
+    """
+    return _write_partitions(data_sources.read_diesel(source, fernet), source, fernet, directory)
+
+
+def _write_partitions(df, source, fernet, directory):
+    os.makedirs(directory, exist_ok=True)
+    df = df.assign(**{COLUNA_ORDEM: range(len(df))})
+    anterior = {p["mes"]: p for p in (read_manifest(directory) or {}).get("particoes", [])}
+
+    meses = df["DataConsumo"].dt.strftime("%Y-%m").fillna(SEM_DATA)
+    particoes = []
+    for mes, parte in df.groupby(meses, sort=True):
+        plano = _parquet(parte.reset_index(drop=True))
+        conteudo = _digest(plano)
+        entry = anterior.get(mes)
+        if not (entry and entry.get("conteudo") == conteudo and os.path.exists(os.path.join(directory, entry["arquivo"]))):
+            cifrado = fernet.encrypt(plano)
+            entry = {"mes": mes, "arquivo": f"diesel-{mes}-{conteudo[:12]}.encrypted", "digest": _digest(cifrado), "conteudo": conteudo}
+            _gravar(os.path.join(directory, entry["arquivo"]), cifrado)
+        datas = parte["DataConsumo"].dropna()
+        particoes.append({**entry,
+                          "inicio": datas.min().date().isoformat() if not datas.empty else None,
+                          "fim": datas.max().date().isoformat() if not datas.empty else None,
+                          "linhas": len(parte)})
+
+    manifest = {
+        "formato": FORMATO,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "origem": {"arquivo": os.path.basename(source), "digest": source_digest(source), "linhas": len(df)},
+        "colunas": {c: str(t) for c, t in df.dtypes.items() if c != COLUNA_ORDEM},
+        "particoes": particoes,
+    }
+    _gravar(os.path.join(directory, MANIFEST_FILE), json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    ativos = {p["arquivo"] for p in particoes}
+    for entry in anterior.values():
+        if entry["arquivo"] not in ativos:
+            try:
+                os.remove(os.path.join(directory, entry["arquivo"]))
+            except FileNotFoundError:
+                pass
+    return manifest
+
+
+def verify(source, fernet, directory=PARTITION_DIR):
+    """Confere digests e contagens das partições e, se a planilha existir, o conteúdo remontado"""
+    manifest = read_manifest(directory)
+    if not manifest:
+        return ["Manifesto ausente"]
+    problemas = []
+    for entry in manifest["particoes"]:
+        try:
+            n = len(read_partition(entry, fernet, directory))
+            if n != entry["linhas"]:
+                problemas.append(f"{entry['arquivo']}: {n} linhas, manifesto diz {entry['linhas']}")
+        except Exception as e:
+            problemas.append(f"{entry['arquivo']}: {e}")
+    if os.path.exists(source):
+        if source_digest(source) != manifest["origem"]["digest"]:
+            problemas.append("A planilha mudou desde a migração (rode a migração de novo)")
+        elif not problemas:
+            original = shared_datasets.to_table(data_sources.read_diesel(source, fernet)).to_pandas()
+            if not load_range(fernet, manifest=manifest, directory=directory).equals(original):
+                problemas.append("Histórico remontado difere da planilha")
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=data_sources.DIESEL_FILE, help="planilha criptografada de origem")
+    parser.add_argument("--out", default=PARTITION_DIR, help="diretório das partições")
+    parser.add_argument("--verify", action="store_true", help="apenas confere as partições existentes")
+    args = parser.parse_args()
+
+    hex_key = data_sources.read_hex_key()
+    if not hex_key:
+        raise SystemExit("HEX_KEY_STRING ausente (variável de ambiente ou .streamlit/secrets.toml)")
+    fernet = data_sources.fernet_from_hex(hex_key)
+
+    if args.verify:
+        problemas = verify(args.source, fernet, args.out)
+        print("\n".join(problemas) if problemas else "✅ Partições conferem")
+        raise SystemExit(1 if problemas else 0)
+
+    manifest = migrate(args.source, fernet, args.out)
+    resumo = pd.DataFrame(manifest["particoes"])[["mes", "inicio", "fim", "linhas", "arquivo"]]
+    print(resumo.to_string(index=False))
+    print(f"📦 {len(resumo)} partições, {manifest['origem']['linhas']} linhas em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
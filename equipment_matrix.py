@@ -0,0 +1,252 @@
+"""
+Matriz esparsa equipamento (Tag) × dia de litros e custo de diesel.
+
+Construída uma vez por versão da planilha a partir dos registros brutos, no
+formato CSR: para cada par (Setor, Tag) guarda apenas os dias com
+abastecimento, em ordem, com somas acumuladas de cada métrica. Totais por
+equipamento em qualquer período saem de duas buscas binárias por linha (sem
+``groupby`` sobre os registros), e a série diária de um equipamento é um
+recorte contíguo dos arrays.
+
+O ``AnomalyDetector`` usa as mesmas entradas para calcular, numa passada
+vetorizada sobre todos os equipamentos, o z-score robusto (mediana/MAD) de cada
+abastecimento diário em relação aos abastecimentos anteriores do mesmo
+equipamento.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# CustoCalculado = ConsumoDiesel × CustoUnitario (base da decomposição preço × volume × mix)
+METRICAS = ('ConsumoDiesel', 'CustoTotalAbastecimento', 'CustoCalculado')
+OUTROS = 'Outros'
+
+
+class TagDayMatrix:
+    """Consumo diário por equipamento; linhas = pares (Setor, Tag), colunas = dias"""
+
+    def __init__(self, df):
+        df = df[df['Tag'].notna()] if 'Tag' in df.columns else df.iloc[0:0]
+        self.vazia = df.empty
+        if self.vazia:
+            self.linhas = pd.DataFrame(columns=['Setor', 'Tag'])
+            self.inicio, self.n_dias = pd.Timestamp.today().normalize(), 0
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.dias = np.zeros(0, dtype=np.int64)
+            self.valores = {m: np.zeros(0) for m in METRICAS}
+            self.acumulado = {m: np.zeros(1) for m in METRICAS}
+            self._chaves = np.zeros(0, dtype=np.int64)
+            return
+
+        datas = df['DataConsumo'].dt.normalize()
+        self.inicio = datas.min()
+        self.n_dias = (datas.max() - self.inicio).days + 1
+
+        codigos, self.linhas = pd.MultiIndex.from_frame(df[['Setor', 'Tag']]).factorize(sort=True)
+        self.linhas = self.linhas.set_names(['Setor', 'Tag']).to_frame(index=False)
+        dia = ((datas - self.inicio).dt.days).to_numpy(dtype=np.int64)
+
+        # Uma entrada por (linha, dia) com abastecimento, ordenada por linha e dia
+        numerico = lambda col: pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy()
+        celulas = pd.DataFrame({
+            'ConsumoDiesel': numerico('ConsumoDiesel'),
+            'CustoTotalAbastecimento': numerico('CustoTotalAbastecimento'),
+            'CustoCalculado': numerico('ConsumoDiesel') * numerico('CustoUnitario') if 'CustoUnitario' in df.columns
+                              else numerico('CustoTotalAbastecimento'),
+        })
+        celulas = celulas.groupby([codigos, dia]).sum()
+        linha = celulas.index.get_level_values(0).to_numpy(dtype=np.int64)
+        self.dias = celulas.index.get_level_values(1).to_numpy(dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(linha, minlength=len(self.linhas)))])
+        self.valores = {m: celulas[m].to_numpy(dtype=float) for m in METRICAS}
+        self.acumulado = {m: np.concatenate([[0.0], np.cumsum(v)]) for m, v in self.valores.items()}
+        self._chaves = linha * self.n_dias + self.dias
+
+    def _dia(self, data, padrao):
+        """Data -> posição de coluna (``padrao`` quando nula)"""
+        return padrao if data is None else (pd.Timestamp(data).normalize() - self.inicio).days
+
+    def totals(self, inicio=None, fim=None, value_col='ConsumoDiesel'):
+        """Total de cada equipamento no período [inicio, fim] (linhas na ordem da matriz)"""
+        d0 = max(self._dia(inicio, 0), 0)
+        d1 = min(self._dia(fim, self.n_dias - 1), self.n_dias - 1)
+        base = np.arange(len(self.linhas), dtype=np.int64) * self.n_dias
+        if d1 < d0:
+            valores = np.zeros(len(self.linhas))
+        else:
+            lo = np.searchsorted(self._chaves, base + d0, side='left')
+            hi = np.searchsorted(self._chaves, base + d1, side='right')
+            acumulado = self.acumulado[value_col]
+            valores = acumulado[hi] - acumulado[lo]
+        return self.linhas.assign(**{value_col: valores})
+
+    def top_n(self, setor, n=15, inicio=None, fim=None, value_col='ConsumoDiesel'):
+        """
+        Os ``n`` maiores equipamentos do setor no período, em ordem decrescente,
+        mais uma linha "Outros (k)" com a soma dos demais quando houver.
+        """
+        totais = self.totals(inicio, fim, value_col)
+        totais = totais[(totais['Setor'] == setor) & (totais[value_col] != 0)]
+        totais = totais.sort_values(value_col, ascending=False, kind='stable')
+        topo, resto = totais.head(n), totais.iloc[n:]
+        if not resto.empty:
+            topo = pd.concat([topo, pd.DataFrame({'Setor': [setor], 'Tag': [f"{OUTROS} ({len(resto)})"],
+                                                  value_col: [resto[value_col].sum()]})], ignore_index=True)
+        return topo.reset_index(drop=True)
+
+    def series(self, tag, setor, inicio=None, fim=None, value_col='ConsumoDiesel'):
+        """Série diária de um equipamento no período, com 0 nos dias sem abastecimento"""
+        d0 = max(self._dia(inicio, 0), 0)
+        d1 = min(self._dia(fim, self.n_dias - 1), self.n_dias - 1)
+        datas = pd.date_range(self.inicio + pd.Timedelta(days=d0), periods=max(d1 - d0 + 1, 0), freq='D', name='Data')
+        serie = pd.Series(0.0, index=datas, name=value_col)
+        pos = self.linhas.index[(self.linhas['Setor'] == setor) & (self.linhas['Tag'] == tag)]
+        if len(pos) == 0 or serie.empty:
+            return serie
+        a, b = self.indptr[pos[0]], self.indptr[pos[0] + 1]
+        dias = self.dias[a:b]
+        valores = self.valores[value_col][a:b]
+        dentro = (dias >= d0) & (dias <= d1)
+        serie.iloc[dias[dentro] - d0] = valores[dentro]
+        return serie
+
+    def entries(self):
+        """Entradas não nulas em formato longo (Setor, Tag, Data e métricas), na ordem da matriz"""
+        linha = np.repeat(np.arange(len(self.linhas)), np.diff(self.indptr))
+        return pd.DataFrame({
+            'Setor': self.linhas['Setor'].to_numpy()[linha],
+            'Tag': self.linhas['Tag'].to_numpy()[linha],
+            'Data': self.inicio + pd.to_timedelta(self.dias, unit='D'),
+            **self.valores,
+        })
+
+
+# ========== ANOMALIAS ==========
+JANELA_ANOMALIA = 20      # abastecimentos anteriores do equipamento usados como referência
+HISTORICO_MINIMO = 8      # abaixo disso o abastecimento não é avaliado
+LIMIAR_Z = 3.5            # |z| robusto acima do qual o abastecimento é anômalo (Iglewicz-Hoaglin)
+BLOCO = 100_000           # entradas por bloco da passada vetorizada (limita a memória da janela)
+
+
+def _mediana_valida(janela, n):
+    """Mediana por linha de uma matriz com NaN no final de cada linha ordenada e ``n`` valores válidos"""
+    ordenada = np.sort(janela, axis=1)
+    i = np.arange(len(janela))
+    lo, hi = np.maximum((n - 1) // 2, 0), np.maximum(n // 2, 0)
+    return (ordenada[i, lo] + ordenada[i, hi]) / 2
+
+
+def robust_scores(valores, indptr, alvo, janela=JANELA_ANOMALIA, minimo=HISTORICO_MINIMO):
+    """
+    Mediana, MAD e z-score robusto das entradas ``alvo`` (posições no CSR) contra
+    as até ``janela`` entradas anteriores da mesma linha. O MAD tem piso de 1% da
+    mediana para que séries constantes não gerem divisão por zero.
+    """
+    linha = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    mediana, mad = np.full(len(alvo), np.nan), np.full(len(alvo), np.nan)
+    passos = np.arange(1, janela + 1)
+    for a in range(0, len(alvo), BLOCO):
+        pos = alvo[a:a + BLOCO]
+        idx = pos[:, None] - passos[None, :]
+        valido = idx >= indptr[linha[pos]][:, None]
+        hist = np.where(valido, valores[np.maximum(idx, 0)], np.nan)
+        n = valido.sum(axis=1)
+        med = _mediana_valida(hist, n)
+        desv = _mediana_valida(np.abs(hist - med[:, None]), n)
+        ok = n >= minimo
+        mediana[a:a + BLOCO] = np.where(ok, med, np.nan)
+        mad[a:a + BLOCO] = np.where(ok, np.maximum(desv, 0.01 * np.abs(med)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = 0.6745 * (valores[alvo] - mediana) / mad
+    return mediana, mad, z
+
+
+class AnomalyDetector:
+    """
+    Z-score robusto do consumo de cada abastecimento diário por equipamento.
+    ``pontos`` tem uma linha por (Setor, Tag, Data) com consumo, mediana e MAD
+    da janela anterior, ``z`` e ``anomalia``.
+    """
+
+    def __init__(self, matrix, limiar=LIMIAR_Z):
+        self.limiar = limiar
+        self.matriz = matrix
+        self.pontos = self._pontuar(matrix, np.arange(len(matrix.dias)))
+
+    @property
+    def ultima_data(self):
+        m = self.matriz
+        return m.inicio + pd.Timedelta(days=m.n_dias - 1) if m.n_dias else None
+
+    def _pontuar(self, matrix, alvo):
+        valores = matrix.valores['ConsumoDiesel']
+        mediana, mad, z = robust_scores(valores, matrix.indptr, alvo)
+        linha = np.searchsorted(matrix.indptr, alvo, side='right') - 1
+        return pd.DataFrame({
+            'Setor': matrix.linhas['Setor'].to_numpy()[linha],
+            'Tag': matrix.linhas['Tag'].to_numpy()[linha],
+            'Data': matrix.inicio + pd.to_timedelta(matrix.dias[alvo], unit='D'),
+            'ConsumoDiesel': valores[alvo],
+            'mediana': mediana, 'mad': mad, 'z': z, 'anomalia': np.abs(z) > self.limiar,
+        })
+
+    def _dias_absolutos(self, matrix):
+        return matrix.dias + (matrix.inicio - self.matriz.inicio).days
+
+    def extends(self, matrix):
+        """Indica se ``matrix`` tem os mesmos abastecimentos até ``ultima_data`` (só dias novos no final)"""
+        antiga = self.matriz
+        if antiga.vazia or matrix.vazia or matrix.inicio > antiga.inicio:
+            return False
+        # Linha de cada equipamento antigo na nova matriz (monótona: as duas são ordenadas por Setor, Tag)
+        destino = pd.MultiIndex.from_frame(matrix.linhas).get_indexer(pd.MultiIndex.from_frame(antiga.linhas))
+        if (destino < 0).any():
+            return False
+        dias = self._dias_absolutos(matrix)
+        ate = dias < antiga.n_dias
+        linha_nova = np.repeat(np.arange(len(matrix.linhas)), np.diff(matrix.indptr))[ate]
+        linha_antiga = np.repeat(destino, np.diff(antiga.indptr))
+        return (len(linha_nova) == len(linha_antiga) and np.array_equal(linha_nova, linha_antiga)
+                and np.array_equal(dias[ate], antiga.dias)
+                and np.array_equal(matrix.valores['ConsumoDiesel'][ate], antiga.valores['ConsumoDiesel']))
+
+    def appended(self, matrix):
+        """Novo detector pontuando apenas as entradas posteriores a ``ultima_data``; pressupõe ``extends``"""
+        alvo = np.flatnonzero(self._dias_absolutos(matrix) >= self.matriz.n_dias)
+        detector = object.__new__(AnomalyDetector)
+        detector.limiar = self.limiar
+        detector.matriz = matrix
+        detector.pontos = pd.concat([self.pontos, self._pontuar(matrix, alvo)], ignore_index=True)
+        return detector
+
+    def anomalies(self, inicio=None, fim=None):
+        """Abastecimentos anômalos no período, do mais recente para o mais antigo"""
+        pontos = self.pontos[self.pontos['anomalia']]
+        if inicio is not None:
+            pontos = pontos[pontos['Data'] >= pd.Timestamp(inicio)]
+        if fim is not None:
+            pontos = pontos[pontos['Data'] <= pd.Timestamp(fim)]
+        return pontos.sort_values(['Data', 'z'], ascending=[False, False]).reset_index(drop=True)
+
+
+_detectors = {}
+_lock = threading.Lock()
+
+
+def anomaly_detector(name, matrix):
+    """
+    Detector do processo para o dataset ``name``: pontua só os dias novos
+    quando ``matrix`` apenas acrescenta abastecimentos e recalcula tudo caso contrário.
+    """
+    with _lock:
+        anterior = _detectors.get(name)
+    if anterior is not None and anterior.extends(matrix):
+        novo_fim = matrix.inicio + pd.Timedelta(days=matrix.n_dias - 1)
+        detector = anterior if anterior.ultima_data == novo_fim else anterior.appended(matrix)
+    else:
+        detector = AnomalyDetector(matrix)
+    with _lock:
+        _detectors[name] = detector
+    return detector
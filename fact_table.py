@@ -0,0 +1,127 @@
+"""
+Tabela de fatos diária que cruza diesel, produção e qualidade.
+
+Cada linha é um dia com os litros e o custo de diesel por setor, as toneladas
+peneiradas (total, por peneira e por produto) e os indicadores de qualidade do
+blend PMT 01 + PMT 02 ponderados pela tonelagem. Dentro do período coberto por
+uma fonte, dias sem registro valem 0 (sem abastecimento ou sem produção); fora
+dele ficam nulos, para não diluir os indicadores de eficiência.
+"""
+
+import numpy as np
+import pandas as pd
+
+import production_analytics
+from quality_analytics import INDICADORES
+
+SETORES = {'Peneiramento': 'peneiramento', 'Expedição': 'expedicao'}
+
+
+def _cobertura(frame, datas):
+    """Reindexa no calendário completo: 0 dentro do intervalo da fonte, NaN fora"""
+    if frame.empty:
+        return frame.reindex(datas)
+    out = frame.reindex(datas)
+    dentro = (datas >= frame.index.min()) & (datas <= frame.index.max())
+    out.loc[dentro] = out.loc[dentro].fillna(0)
+    return out
+
+
+def diesel_daily(diesel):
+    """Litros e custo por dia e setor (mesma agregação do ``daily_data`` do dashboard de diesel)"""
+    if diesel is None or diesel.empty:
+        return pd.DataFrame()
+    diario = diesel.groupby([diesel['DataConsumo'].dt.normalize(), 'Setor']).agg(
+        litros=('ConsumoDiesel', 'sum'), custo=('CustoTotalAbastecimento', 'sum')).unstack('Setor', fill_value=0)
+    diario = diario.reindex(columns=pd.MultiIndex.from_product([['litros', 'custo'], list(SETORES)]), fill_value=0)
+    diario.columns = [f"{medida}_{SETORES[setor]}" for medida, setor in diario.columns]
+    diario['litros_total'] = diario['litros_peneiramento'] + diario['litros_expedicao']
+    diario['custo_total'] = diario['custo_peneiramento'] + diario['custo_expedicao']
+    return diario
+
+
+def production_daily(producao):
+    """Toneladas por dia: total, por peneira e por produto do registro"""
+    if producao is None or producao.empty:
+        return pd.DataFrame()
+    df = production_analytics.add_totals(producao)
+    colunas = list(production_analytics.TOTAIS) + ['total_dia']
+    diario = df.groupby(df['data'].dt.normalize())[colunas].sum()
+    return diario.rename(columns={c: f"ton_{c.removeprefix('total_')}" for c in colunas}).rename(columns={'ton_dia': 'ton_total'})
+
+
+def quality_daily(blocos, indicadores=INDICADORES):
+    """Indicadores diários do blend das peneiras, ponderados pela tonelagem (zeros/nulos não pesam)"""
+    if blocos is None or blocos.empty:
+        return pd.DataFrame()
+    df = blocos[blocos['Data'].notna()]
+    cols = [c for c in indicadores if c in df.columns]
+    x = df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    ton = pd.to_numeric(df['Ton'], errors='coerce').fillna(0).clip(lower=0).to_numpy() if 'Ton' in df.columns else np.ones(len(df))
+    peso = np.where(np.isnan(x) | (x == 0), 0.0, ton[:, None])
+    dia = df['Data'].dt.normalize().to_numpy()
+    somas = pd.DataFrame(np.hstack([peso * np.nan_to_num(x), peso]), index=dia).groupby(level=0).sum().to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(somas[:, len(cols):] > 0, somas[:, :len(cols)] / somas[:, len(cols):], np.nan)
+    diario = pd.DataFrame(media, index=pd.DatetimeIndex(np.unique(dia)), columns=cols)
+    diario['ton_qualidade'] = pd.Series(ton, index=dia).groupby(level=0).sum().to_numpy()
+    return diario
+
+
+def build_fact_table(diesel, producao, blocos):
+    """Tabela diária (índice ``Data``) com diesel, produção, qualidade e razões L/t e R$/t"""
+    partes = [p for p in (diesel_daily(diesel), production_daily(producao)) if not p.empty]
+    qualidade = quality_daily(blocos)
+    indices = [p.index for p in partes + ([qualidade] if not qualidade.empty else [])]
+    if not indices:
+        return pd.DataFrame()
+    inicio, fim = min(i.min() for i in indices), max(i.max() for i in indices)
+    datas = pd.date_range(inicio, fim, freq='D', name='Data')
+
+    fatos = pd.concat([_cobertura(p, datas) for p in partes] + ([qualidade.reindex(datas)] if not qualidade.empty else []), axis=1)
+    for col in ['litros_peneiramento', 'litros_expedicao', 'litros_total', 'custo_peneiramento', 'custo_expedicao', 'custo_total', 'ton_total']:
+        if col not in fatos.columns:
+            fatos[col] = np.nan
+    ton = fatos['ton_total'].where(fatos['ton_total'] > 0)
+    fatos['l_por_t'] = fatos['litros_peneiramento'] / ton
+    fatos['rs_por_t'] = fatos['custo_peneiramento'] / ton
+    fatos['l_por_t_total'] = fatos['litros_total'] / ton
+    fatos['rs_por_t_total'] = fatos['custo_total'] / ton
+    return fatos
+
+
+def period_kpis(fatos, inicio=None, fim=None):
+    """
+    Razões do período como razão das somas (não média das razões diárias),
+    apenas nos dias cobertos por diesel e produção.
+    """
+    recorte = fatos.loc[inicio:fim]
+    recorte = recorte[recorte['litros_total'].notna() & recorte['ton_total'].notna()]
+    ton = recorte['ton_total'].sum()
+    razao = lambda col: recorte[col].sum() / ton if ton > 0 else np.nan
+    return {
+        'dias': len(recorte),
+        'ton_total': ton,
+        'litros_peneiramento': recorte['litros_peneiramento'].sum(),
+        'litros_total': recorte['litros_total'].sum(),
+        'custo_total': recorte['custo_total'].sum(),
+        'l_por_t': razao('litros_peneiramento'),
+        'rs_por_t': razao('custo_peneiramento'),
+        'l_por_t_total': razao('litros_total'),
+        'rs_por_t_total': razao('custo_total'),
+    }
+
+
+def grade_bands(fatos, indicador='Fe', faixas=4, inicio=None, fim=None):
+    """R$/t e L/t por faixa (quantis) de um indicador de qualidade, com toneladas de cada produto"""
+    recorte = fatos.loc[inicio:fim]
+    recorte = recorte[recorte[indicador].notna() & (recorte['ton_total'] > 0) & recorte['litros_total'].notna()] if indicador in recorte else recorte.iloc[0:0]
+    if len(recorte) < faixas:
+        return pd.DataFrame()
+    faixa = pd.qcut(recorte[indicador], faixas, duplicates='drop')
+    ton_cols = [f"ton_{p}" for p in production_analytics.TIPOS_PRODUTO if f"ton_{p}" in recorte.columns]
+    tabela = recorte.groupby(faixa, observed=True)[['ton_total', 'litros_peneiramento', 'custo_peneiramento'] + ton_cols].sum()
+    tabela['dias'] = recorte.groupby(faixa, observed=True).size()
+    tabela['l_por_t'] = tabela['litros_peneiramento'] / tabela['ton_total']
+    tabela['rs_por_t'] = tabela['custo_peneiramento'] / tabela['ton_total']
+    return tabela
@@ -0,0 +1,308 @@
+"""
+Serviço HTTP somente leitura com os KPIs dos dashboards em JSON.
+
+Roda ao lado do Streamlit (mesmo diretório e mesmos segredos) para painéis de
+TV e scripts de relatório que só precisam de alguns números. Os dados vêm dos
+datasets compartilhados (``shared_datasets``): se uma página já publicou a
+versão atual de uma planilha, o serviço só anexa o arquivo Arrow; senão, publica
+a versão para as páginas. Os cálculos são os mesmos das páginas
+(``diesel_analytics``, ``production_analytics`` e ``quality_analytics``).
+
+Cada resposta é montada uma vez por versão dos dados (e por dia, por causa das
+projeções) e guardada já serializada. O ``ETag`` é o hash dos dados, sem o
+horário de geração: quem repete a consulta com ``If-None-Match`` recebe 304 sem
+corpo enquanto nada mudar. As versões dos arquivos são verificadas no máximo
+uma vez por segundo.
+
+Endpoints (GET):
+    /kpis/diesel      KPIs do mês atual (ou de ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD)
+    /kpis/producao    atingimento de metas por peneira, estoque e esgotamento
+    /kpis/qualidade   resultados do último dia e médias do mês
+    /kpis             os três juntos
+    /saude            versões carregadas (sem cálculo)
+
+Uso:
+    python kpi_service.py --host 0.0.0.0 --port 8765
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import data_sources
+import diesel_analytics
+import diesel_partitions
+import perf_tracker
+import production_analytics
+import quality_analytics
+import shared_datasets
+from cache_manager import cache
+
+INTERVALO_VERSOES = 1.0  # segundos entre verificações dos arquivos de origem
+
+
+def _file_version(arquivo):
+    return shared_datasets.file_version(arquivo) if os.path.exists(arquivo) else None
+
+
+# Fonte -> (arquivo, nome do dataset compartilhado com as páginas, leitor, versão ou None se indisponível)
+FONTES = {
+    'diesel': (data_sources.DIESEL_FILE, "diesel", diesel_partitions.read_history, diesel_partitions.history_version),
+    'producao': (data_sources.PRODUCTION_FILE, "producao", data_sources.read_production, _file_version),
+    'qualidade': (data_sources.QUALITY_FILE, "qualidade", data_sources.read_quality, _file_version),
+}
+
+
+class RotaDesconhecida(Exception):
+    """Caminho sem endpoint (respondido com 404)"""
+
+
+class ConsultaInvalida(Exception):
+    """Parâmetros de consulta malformados (respondidos com 400)"""
+
+
+class DadosIndisponiveis(Exception):
+    """Fonte ausente ou ilegível (respondida com 503)"""
+
+
+def load_fernet():
+    """Chave do ambiente (``HEX_KEY_STRING``) ou do ``secrets.toml`` do Streamlit"""
+    hex_key = data_sources.read_hex_key()
+    if not hex_key:
+        raise SystemExit("HEX_KEY_STRING ausente (variável de ambiente ou .streamlit/secrets.toml)")
+    return data_sources.fernet_from_hex(hex_key)
+
+
+def _periodo(consulta):
+    """(inicio, fim) em ISO de ``?inicio=&fim=``: os dois ou nenhum, datas AAAA-MM-DD com inicio <= fim"""
+    inicio, fim = consulta.get('inicio', [None])[0], consulta.get('fim', [None])[0]
+    if inicio is None and fim is None:
+        return None, None
+    if inicio is None or fim is None:
+        raise ConsultaInvalida("Informe 'inicio' e 'fim' juntos")
+    try:
+        inicio, fim = date.fromisoformat(inicio), date.fromisoformat(fim)
+    except ValueError:
+        raise ConsultaInvalida("Datas devem estar no formato AAAA-MM-DD") from None
+    if inicio > fim:
+        raise ConsultaInvalida("'inicio' posterior a 'fim'")
+    return inicio.isoformat(), fim.isoformat()
+
+
+def _json_safe(valor):
+    """Converte tipos do numpy/pandas para JSON (NaN/NaT viram null)"""
+    if isinstance(valor, dict):
+        return {str(k): _json_safe(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_json_safe(v) for v in valor]
+    if valor is None or valor is pd.NaT or valor is pd.NA:
+        return None
+    if isinstance(valor, (pd.Timestamp, datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+class KPIService:
+    """Versões das fontes, datasets compartilhados e respostas serializadas em cache"""
+
+    def __init__(self, fernet):
+        self.fernet = fernet
+        self._versoes, self._verificado = {}, 0.0
+        self._lock = threading.Lock()
+
+    def versions(self):
+        """Versão atual de cada fonte (None se o arquivo não existe), com verificação limitada"""
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._verificado >= INTERVALO_VERSOES:
+                self._versoes = {fonte: versionar(arquivo) for fonte, (arquivo, _, _, versionar) in FONTES.items()}
+                self._verificado = agora
+            return self._versoes
+
+    def dataset(self, fonte, versao):
+        if versao is None:
+            raise DadosIndisponiveis(f"Arquivo de {fonte} não encontrado")
+        arquivo, nome, leitor, _ = FONTES[fonte]
+        df = shared_datasets.load_or_publish(nome, versao, lambda: leitor(arquivo, self.fernet))
+        if df is None:
+            raise DadosIndisponiveis(f"Não foi possível ler {fonte}")
+        return df
+
+    # ---------- Diesel ----------
+    def diesel(self, versao, inicio=None, fim=None):
+        df = self.dataset('diesel', versao)
+        periodo = "custom" if inicio and fim else "month"
+        if periodo == "month":
+            inicio, fim = (d.isoformat() for d in diesel_analytics.current_month())
+        diario, _ = diesel_analytics.daily_consumption(df, inicio, fim)
+        motor = cache.get_or_compute("diesel", ("projecao", versao), lambda: diesel_analytics.ProjectionEngine(df), version=versao)
+        kpis = diesel_analytics.calculate_kpis(diario, periodo, motor if periodo == "month" else None)
+        return {'periodo': {'tipo': "mês atual" if periodo == "month" else "personalizado", 'inicio': inicio, 'fim': fim}, 'kpis': kpis}
+
+    # ---------- Produção ----------
+    def producao(self, versao):
+        df = self.dataset('producao', versao)
+        motor = production_analytics.rolling_engine("producao", df)
+        cubo = cache.get_or_compute("produção", ("cubo", versao), lambda: production_analytics.ProductionCube(df), version=versao)
+        produtivos = df[df['total_dia'] > 0]
+        if produtivos.empty:
+            raise DadosIndisponiveis("Sem dias produtivos")
+        # Mesmo recorte padrão da página: do início da análise ao último dia produtivo
+        recorte = df[(df['data'].dt.date >= production_analytics.INICIO_ANALISE) & (df['data'] <= produtivos['data'].max())]
+        inicio, fim = recorte['data'].min(), recorte['data'].max()
+        resumo = cubo.summary(inicio, fim, production_analytics.META_DIA, production_analytics.META_LUMP_DIA)
+
+        estoque = production_analytics.stock_status(df, motor, em=fim)
+        modelo = cache.get_or_compute(
+            "produção", ("esgotamento", versao),
+            lambda: production_analytics.DepletionModel(production_analytics.recent_consumption(df), production_analytics.CENARIOS_ESTOQUE),
+            version=versao)
+        previsao = modelo.forecast(estoque['estoque_atual'])
+        ultima_data = production_analytics.last_productive_day(df)
+        esgotamento = {f"p{p}": {'dias': dias, 'data': ultima_data + pd.Timedelta(days=dias) if pd.notna(dias) else None}
+                       for p, dias in previsao['dias'].items()}
+
+        colunas = ['rotulo', 'producao', 'dias', 'media', 'ultimo', 'meta', 'ating', 'meta_lump', 'lump', 'ating_lump']
+        colunas += [c for c in resumo.columns if c.startswith('mix_')]
+        return {
+            'periodo': {'inicio': inicio, 'fim': fim},
+            'peneiras': {chave: resumo.loc[chave, colunas].to_dict() for chave in resumo.index if chave != 'comb'},
+            'combinado': resumo.loc['comb', colunas].to_dict(),
+            'estoque': {**estoque, 'esgotamento': esgotamento, 'fracao_esgota': previsao['fracao_esgota'],
+                        'cenarios': previsao['cenarios'], 'horizonte_dias': previsao['horizonte']},
+        }
+
+    # ---------- Qualidade ----------
+    def qualidade(self, versao):
+        dia, media, _, mes = quality_analytics.summarize_report(self.dataset('qualidade', versao))
+        indicadores = dia.drop(index='PRODUTO_DIA')
+        return {
+            'mes_referencia': mes,
+            'ultimo_dia': {'data': dia.loc['PRODUTO_DIA'].iloc[0], **{p: indicadores[p].to_dict() for p in indicadores.columns}},
+            'media_mes': {p: media[p].to_dict() for p in media.columns},
+        }
+
+    # ---------- Respostas ----------
+    def response(self, rota, consulta):
+        """(etag, versão, corpo JSON em bytes) da rota, montados uma vez por versão dos dados e dia"""
+        versoes = self.versions()
+        if rota == '/kpis/diesel':
+            inicio, fim = _periodo(consulta)
+            fontes, montar = ('diesel',), lambda: self.diesel(versoes['diesel'], inicio, fim)
+            chave_consulta = (inicio, fim)
+        elif rota == '/kpis/producao':
+            fontes, montar, chave_consulta = ('producao',), lambda: self.producao(versoes['producao']), ()
+        elif rota == '/kpis/qualidade':
+            fontes, montar, chave_consulta = ('qualidade',), lambda: self.qualidade(versoes['qualidade']), ()
+        elif rota == '/kpis':
+            fontes, chave_consulta = tuple(FONTES), ()
+            montar = lambda: {'diesel': self.diesel(versoes['diesel']), 'producao': self.producao(versoes['producao']),
+                              'qualidade': self.qualidade(versoes['qualidade'])}
+        else:
+            raise RotaDesconhecida(rota)
+
+        versao = "|".join(f"{f}={versoes[f]}" for f in fontes)
+
+        def serializar():
+            # O ETag cobre só os dados: remontar a resposta (ex.: após despejo do cache) não o altera
+            dados = _json_safe({'versao': versao, **montar()})
+            etag = hashlib.blake2b(json.dumps(dados, ensure_ascii=False).encode('utf-8'), digest_size=12).hexdigest()
+            corpo = json.dumps({'versao': versao, 'gerado_em': datetime.now().isoformat(), **dados}, ensure_ascii=False).encode('utf-8')
+            return f'"{etag}"', corpo
+
+        etag, corpo = cache.get_or_compute("kpi", (rota, chave_consulta, versao, date.today()), serializar, version=versao)
+        return etag, versao, corpo
+
+
+class KPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # conexões persistentes para quem consulta em intervalos curtos
+    disable_nagle_algorithm = True  # cabeçalho e corpo saem em escritas separadas
+    server_version = "DieselDashKPI/1.0"
+    service = None
+    verbose = False
+
+    def _send(self, status, corpo=b"", headers=None):
+        self.send_response(status)
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if corpo and self.command != "HEAD":
+            self.wfile.write(corpo)
+
+    def _send_json(self, status, dados):
+        self._send(status, json.dumps(dados, ensure_ascii=False).encode('utf-8'),
+                   {"Content-Type": "application/json; charset=utf-8", "Cache-Control": "no-cache"})
+
+    def do_GET(self):
+        inicio = time.perf_counter()
+        partes = urlsplit(self.path)
+        rota = partes.path.rstrip('/') or '/'
+        try:
+            if rota == '/saude':
+                self._send_json(200, {'status': 'ok', 'versoes': self.service.versions()})
+                return
+            etag, versao, corpo = self.service.response(rota, parse_qs(partes.query))
+        except ConsultaInvalida as e:
+            self._send_json(400, {'erro': str(e)})
+            return
+        except RotaDesconhecida:
+            self._send_json(404, {'erro': f"Rota desconhecida: {rota}"})
+            return
+        except DadosIndisponiveis as e:
+            self._send_json(503, {'erro': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'erro': f"{type(e).__name__}: {e}"})
+            return
+
+        headers = {"ETag": etag, "X-Data-Version": versao, "Cache-Control": "no-cache"}
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, headers=headers)
+        else:
+            self._send(200, corpo, {**headers, "Content-Type": "application/json; charset=utf-8"})
+        perf_tracker.since("kpi", rota, inicio)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--verbose", action="store_true", help="registra cada requisição no stderr")
+    args = parser.parse_args()
+
+    KPIHandler.service = KPIService(load_fernet())
+    KPIHandler.verbose = args.verbose
+    servidor = ThreadingHTTPServer((args.host, args.port), KPIHandler)
+    servidor.daemon_threads = True
+    print(f"Serviço de KPIs em http://{args.host}:{args.port}/kpis")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Teste de carga dos dashboards com sessões simultâneas (Streamlit AppTest).
+
+Gera dados sintéticos criptografados (diesel, produção, qualidade e usuários)
+em um diretório temporário, abre N sessões contra ``dashboard_fixed.py``,
+``1_Produção.py``, ``2_Qualidade.py`` e ``3_Eficiência.py`` e executa
+interações realistas: login, troca de filtro de datas, troca de indicador e
+atualização forçada.
+
+Relata os percentis de latência de rerun por interação e o crescimento de RSS
+por sessão adicional.
+
+Uso:
+    python load_test.py --sessions 8 --rounds 3 --workers 4
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from cryptography.fernet import Fernet
+from openpyxl import Workbook
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    "diesel": "dashboard_fixed.py",
+    "produção": "1_Produção.py",
+    "qualidade": "2_Qualidade.py",
+    "eficiência": "3_Eficiência.py",
+}
+TEST_USER, TEST_PASSWORD = "carga", "carga123"
+INDICADORES = ['Fe', 'SiO2', 'Al2O3', 'TMP', '>31_5mm', '<0_15mm']
+
+
+# ========== DADOS SINTÉTICOS ==========
+def _save_encrypted(fernet, wb, path):
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    with open(path, "wb") as f:
+        f.write(fernet.encrypt(buffer.getvalue()))
+
+
+def build_diesel_workbook(rng, days, tags):
+    """Planilha de abastecimentos no formato de 'Diesel-area.encrypted'"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['data de Inclusão', 'Quantidade', 'Valo Unitário', 'Valor Total', 'Área', 'Dia', 'Tag'])
+    for day in pd.date_range(date.today() - timedelta(days=days), date.today()):
+        for _ in range(int(rng.integers(5, 15))):
+            qtd = float(rng.gamma(4, 60))
+            preco = float(5.9 + rng.normal(0, 0.15))
+            ws.append([day.to_pydatetime(), qtd, preco, qtd * preco, str(rng.choice(['Tup', 'Rep', 'Out'])),
+                       day.to_pydatetime(), f"EQ-{int(rng.integers(1, tags + 1)):03d}"])
+    return wb
+
+
+def build_production_workbook(rng):
+    """Aba BD_Real com cabeçalho de três níveis, como no Informativo Operacional"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "BD_Real"
+    produtos = ['Lump', 'Hemat', 'Sinter Feed\nNP']
+    linha0, linha1, linha2 = ['2025'], ['Data'], [None]
+    for pm in ['PM 01', 'PM 04']:
+        for produto in produtos:
+            linha0.append('PENEIRAMENTO MSC')
+            linha1.append(f'Santa Cruz - Tupacery {pm}')
+            linha2.append(produto)
+    for linha in (linha0, linha1, linha2):
+        ws.append(linha)
+    for day in pd.date_range(datetime(2025, 8, 1), date.today()):
+        valores = []
+        for _ in range(2):
+            opera = rng.random() > 0.15
+            valores += [max(0.0, float(rng.normal(3100, 400))) * opera,
+                        max(0.0, float(rng.normal(250, 60))) * opera,
+                        max(0.0, float(rng.normal(1650, 250))) * opera]
+        ws.append([day.to_pydatetime()] + valores)
+    return wb
+
+
+def build_quality_workbook(rng):
+    """Aba RESUMO GR com os blocos PMT 01 e PMT 02 do mês corrente"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO GR"
+    colunas = ['Data', 'Ton', 'Fe', 'SiO2', 'Al2O3', 'P', 'Mn', 'LOI', 'MM', '+31,5', '-12', '-6,3']
+    linha0, linha1 = ['Resumo'], ['Info']
+    for pmt in ['PMT 01', 'PMT 02']:
+        linha0 += [pmt] * len(colunas)
+        linha1 += colunas
+    ws.append(linha0)
+    ws.append(linha1)
+    inicio = date.today().replace(day=1)
+    for i in range(32):
+        dia = inicio + timedelta(days=i)
+        if dia.month != inicio.month or dia > date.today():
+            break
+        linha = ['']
+        for _ in range(2):
+            linha += [datetime(dia.year, dia.month, dia.day), float(rng.normal(4000, 600)),
+                      float(rng.normal(62, 1)), float(rng.normal(5, 0.6)), float(rng.normal(2, 0.2)),
+                      float(rng.normal(0.05, 0.01)), float(rng.normal(0.1, 0.02)), float(rng.normal(3, 0.3)),
+                      float(rng.normal(20, 2)), float(rng.normal(15, 3)), float(rng.normal(3, 0.5)),
+                      float(rng.normal(2, 0.4))]
+        ws.append(linha)
+    return wb
+
+
+def build_dataset(workdir, days=365, tags=40, seed=42):
+    """Gera todos os arquivos criptografados em ``workdir`` e devolve a chave HEX"""
+    rng = np.random.default_rng(seed)
+    hex_key = os.urandom(32).hex()
+    fernet = Fernet(base64.urlsafe_b64encode(bytes.fromhex(hex_key)))
+
+    _save_encrypted(fernet, build_diesel_workbook(rng, days, tags), os.path.join(workdir, "Diesel-area.encrypted"))
+    _save_encrypted(fernet, build_production_workbook(rng), os.path.join(workdir, "Informativo_Operacional.encrypted"))
+    _save_encrypted(fernet, build_quality_workbook(rng), os.path.join(workdir, "Relatorio_Qualidade.encrypted"))
+
+    # Segredos em arquivo: o patch de ``AppTest.secrets`` não é seguro entre threads
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        f.write(f'HEX_KEY_STRING = "{hex_key}"\n')
+
+    users = {TEST_USER: {
+        "password": hashlib.sha256(TEST_PASSWORD.encode()).hexdigest(), "role": "admin",
+        "email": f"{TEST_USER}@lhg.com", "full_name": "Teste de Carga",
+        "created_at": datetime.now().isoformat(), "last_login": None,
+    }}
+    with open(os.path.join(workdir, "users.encrypted"), "wb") as f:
+        f.write(fernet.encrypt(json.dumps(users).encode("utf-8")))
+    with open(os.path.join(workdir, "last_update.json"), "w") as f:
+        json.dump({"last_update": datetime.now().isoformat(), "timestamp": time.time(), "version": "carga"}, f)
+    if os.path.exists(os.path.join(REPO_DIR, "Lhg-02.png")):
+        shutil.copy(os.path.join(REPO_DIR, "Lhg-02.png"), workdir)
+    return hex_key
+
+
+# ========== MEDIÇÃO ==========
+def rss_mb():
+    """RSS atual do processo em MB (pico via getrusage quando /proc não existe)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def serialize_script_compilation():
+    """
+    Cada AppTest recompila o script a cada rerun, e ``ast.parse`` concorrente
+    em threads falha no CPython 3.11 ("AST constructor recursion depth
+    mismatch"). O servidor real compila uma vez por script; aqui a compilação
+    é serializada para que só a execução das páginas rode em paralelo.
+    """
+    from streamlit.runtime.scriptrunner import magic, script_cache
+
+    compile_lock = threading.Lock()
+    add_magic = magic.add_magic
+
+    def locked_add_magic(*args, **kwargs):
+        with compile_lock:
+            return add_magic(*args, **kwargs)
+
+    script_cache.magic.add_magic = locked_add_magic
+
+
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+class Session:
+    """Uma sessão de usuário com todas as páginas abertas"""
+
+    def __init__(self, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.apps = {name: AppTest.from_file(os.path.join(REPO_DIR, script), default_timeout=timeout)
+                     for name, script in SCRIPTS.items()}
+        self.samples = []
+
+    def _timed(self, page, action, step):
+        start = time.perf_counter()
+        app = step(self.apps[page])
+        elapsed = (time.perf_counter() - start) * 1000
+        failed = bool(app.exception)
+        self.samples.append({"pagina": page, "acao": action, "latencia_ms": elapsed, "erro": failed})
+        return app
+
+    def open(self):
+        """Login no dashboard de diesel e primeira carga das páginas"""
+        self._timed("diesel", "abrir", lambda a: a.run())
+
+        def login(app):
+            _widget(app.text_input, "Usuário").input(TEST_USER)
+            _widget(app.text_input, "Senha").input(TEST_PASSWORD)
+            return _widget(app.button, "Entrar").click().run()
+
+        self._timed("diesel", "login", login)
+        self._timed("produção", "abrir", lambda a: a.run())
+        self._timed("qualidade", "abrir", lambda a: a.run())
+        self._timed("eficiência", "abrir", lambda a: a.run())
+
+    def interact(self, rng):
+        """Um ciclo de interações típicas em cada página"""
+        hoje = date.today()
+
+        def filtro_periodo(app):
+            _widget(app.sidebar.selectbox, "Tipo de Filtro").select("Período Personalizado").run()
+            inicio = hoje - timedelta(days=int(rng.integers(7, 90)))
+            return _widget(app.sidebar.date_input, "Data Inicial").set_value(inicio).run()
+
+        def filtro_mes_atual(app):
+            return _widget(app.sidebar.selectbox, "Tipo de Filtro").select("Mês Atual").run()
+
+        self._timed("diesel", "filtro_datas", filtro_periodo)
+        self._timed("diesel", "filtro_datas", filtro_mes_atual)
+        top_n = int(rng.choice([10, 15, 20]))
+        self._timed("diesel", "top_equipamentos",
+                    lambda a: _widget(a.slider, "Equipamentos exibidos por setor").set_value(top_n).run())
+        self._timed("diesel", "forcar_atualizacao",
+                    lambda a: _widget(a.sidebar.button, "🔄 Forçar Atualização").click().run())
+
+        def periodo_producao(app):
+            fim = hoje - timedelta(days=int(rng.integers(0, 10)))
+            return _widget(app.sidebar.date_input, "Período").set_value((fim - timedelta(days=30), fim)).run()
+
+        self._timed("produção", "filtro_datas", periodo_producao)
+        self._timed("eficiência", "filtro_datas", periodo_producao)
+
+        for label in ["🎯 Selecione um Indicador", "📊 Indicador para Tendência"]:
+            indicador = str(rng.choice(INDICADORES))
+            self._timed("qualidade", "indicador",
+                        lambda a, label=label, indicador=indicador: _widget(a.selectbox, label).select(indicador).run())
+
+
+def summarize(samples):
+    """Percentis de latência por página e interação"""
+    df = pd.DataFrame(samples)
+    grouped = df.groupby(["pagina", "acao"])["latencia_ms"]
+    resumo = grouped.agg(
+        n="count",
+        p50=lambda x: np.percentile(x, 50),
+        p90=lambda x: np.percentile(x, 90),
+        p95=lambda x: np.percentile(x, 95),
+        p99=lambda x: np.percentile(x, 99),
+        max="max",
+    ).round(1)
+    resumo["erros"] = df.groupby(["pagina", "acao"])["erro"].sum()
+    return resumo.reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="número de sessões simultâneas")
+    parser.add_argument("--rounds", type=int, default=3, help="ciclos de interação por sessão")
+    parser.add_argument("--workers", type=int, default=4, help="sessões executadas em paralelo")
+    parser.add_argument("--days", type=int, default=365, help="dias de histórico de diesel sintético")
+    parser.add_argument("--tags", type=int, default=40, help="quantidade de equipamentos sintéticos")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout de cada rerun (s)")
+    parser.add_argument("--csv", help="grava as amostras brutas neste arquivo CSV")
+    args = parser.parse_args()
+
+    csv_path = os.path.abspath(args.csv) if args.csv else None
+    workdir = tempfile.mkdtemp(prefix="dieseldash_carga_")
+    os.environ.setdefault("DIESELDASH_SHARED_DIR", os.path.join(workdir, "shm"))
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    print(f"📁 Dados sintéticos em {workdir}")
+    build_dataset(workdir, days=args.days, tags=args.tags)
+    serialize_script_compilation()
+
+    sessions, rss = [], [(0, rss_mb())]
+    for i in range(args.sessions):
+        session = Session(args.timeout)
+        session.open()
+        sessions.append(session)
+        rss.append((i + 1, rss_mb()))
+        print(f"  sessão {i + 1}: RSS {rss[-1][1]:.1f} MB")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for r in range(args.rounds):
+            rngs = [np.random.default_rng(1000 * r + i) for i in range(len(sessions))]
+            list(pool.map(lambda pair: pair[0].interact(pair[1]), zip(sessions, rngs)))
+            print(f"  ciclo {r + 1}/{args.rounds} concluído")
+
+    samples = [s for session in sessions for s in session.samples]
+    print("\n📊 Latência de rerun (ms)")
+    print(summarize(samples).to_string(index=False))
+
+    counts, values = zip(*rss)
+    growth = np.polyfit(counts[1:], values[1:], 1)[0] if len(counts) > 2 else values[-1] - values[0]
+    print(f"\n🧠 RSS: base {values[0]:.1f} MB, final {values[-1]:.1f} MB, "
+          f"crescimento por sessão adicional ≈ {growth:.2f} MB")
+
+    if csv_path:
+        pd.DataFrame(samples).to_csv(csv_path, index=False)
+        print(f"💾 Amostras gravadas em {csv_path}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Recursos visuais comuns às páginas.
+
+A logo original (``Lhg-02.png``) tem 14110 px de largura e decodificá-la a cada
+rerun custava segundos; as páginas usam a versão reduzida, gerada uma vez por
+versão do arquivo e guardada no namespace "figures" do cache.
+"""
+
+import io
+
+from PIL import Image
+
+import shared_datasets
+from cache_manager import cache
+
+LOGO_PATH = "Lhg-02.png"
+
+
+def reduced_logo(path=LOGO_PATH, width=600):
+    """PNG da logo reduzido para caber em ``width`` × ``width``, em cache por versão do arquivo"""
+    def reduce():
+        img = Image.open(path)
+        img.thumbnail((width, width))
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+    return cache.get_or_compute("figures", ("logo", path, width, shared_datasets.file_version(path)), reduce)
@@ -0,0 +1,63 @@
+"""
+Métricas de desempenho de renderização compartilhadas pelo processo.
+
+Guarda as últimas amostras (em ms) de cada métrica por página, como o tempo até
+o primeiro KPI, para exibição no painel administrativo.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+MAX_SAMPLES = 500
+
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_lock = threading.Lock()
+
+
+def record(page, metric, ms):
+    """Registra uma amostra em milissegundos"""
+    with _lock:
+        _samples[(page, metric)].append(float(ms))
+
+
+def since(page, metric, start):
+    """Registra o tempo decorrido desde ``start`` (time.perf_counter) e o devolve em ms"""
+    ms = (time.perf_counter() - start) * 1000
+    record(page, metric, ms)
+    return ms
+
+
+@contextmanager
+def timer(page, metric):
+    """Cronometra o bloco e registra a duração"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        since(page, metric, start)
+
+
+def summary():
+    """Tabela com contagem, última amostra e percentis por página e métrica"""
+    with _lock:
+        items = [(key, np.array(values)) for key, values in _samples.items() if values]
+    rows = [{
+        "Página": page,
+        "Métrica": metric,
+        "Amostras": len(values),
+        "Última (ms)": round(values[-1], 1),
+        "p50 (ms)": round(float(np.percentile(values, 50)), 1),
+        "p95 (ms)": round(float(np.percentile(values, 95)), 1),
+        "Máx (ms)": round(float(values.max()), 1),
+    } for (page, metric), values in sorted(items)]
+    return pd.DataFrame(rows)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
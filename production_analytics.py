@@ -0,0 +1,313 @@
+"""
+Estatísticas móveis de produção calculadas uma vez sobre todo o histórico.
+
+O ``RollingEngine`` guarda somas acumuladas por coluna de produto (e totais
+derivados) em duas bases: o calendário da planilha (todas as linhas) e só os
+dias produtivos (``total_dia > 0``). As somas e médias móveis de 7 e 14 dias
+saem da diferença entre duas posições das somas acumuladas; qualquer filtro de
+período é apenas um recorte, sem janelas truncadas no início.
+
+Quando uma nova versão da planilha só acrescenta dias ao final, o motor do
+processo é estendido calculando apenas as linhas novas.
+"""
+
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Registro de peneiras: código das colunas -> rótulo na planilha e paleta (cor principal primeiro).
+# Uma peneira nova só precisa de uma entrada aqui.
+PENEIRAS = {
+    'pm01': {'rotulo': 'PM 01', 'cores': ['#f47c20', '#ff9a51', '#ffb885']},
+    'pm04': {'rotulo': 'PM 04', 'cores': ['#5A99E2', '#87B5ED', '#B4D1F5']},
+}
+# Produtos: código -> (sufixo do cabeçalho na planilha, rótulo)
+TIPOS_PRODUTO = {'lump': ('Lump', 'Lump'), 'hematita': ('Hemat', 'Hematita'), 'sinter': ('Sinter Feed\nNP', 'Sinter Feed')}
+
+PRODUTOS = [f'{pen}_{prod}' for pen in PENEIRAS for prod in TIPOS_PRODUTO]
+TOTAIS = {
+    **{f'total_{pen}': [f'{pen}_{prod}' for prod in TIPOS_PRODUTO] for pen in PENEIRAS},
+    **{f'total_{prod}': [f'{pen}_{prod}' for pen in PENEIRAS] for prod in TIPOS_PRODUTO},
+}
+JANELAS = (7, 14)
+BASES = ('calendario', 'produtivo')
+
+# Metas diárias por peneira (t), estoque de referência e parâmetros da previsão de esgotamento
+META_DIA, META_LUMP_DIA = 5000, 3240
+INICIO_ANALISE = date(2025, 8, 26)
+ESTOQUE_INICIAL, DATA_ESTOQUE_INICIAL = 189544, date(2025, 9, 16)
+DIAS_BOOTSTRAP, CENARIOS_ESTOQUE = 90, 5000
+
+
+def add_totals(df):
+    """Acrescenta os totais por peneira e por produto (colunas ausentes contam como 0)"""
+    return df.assign(**{total: sum(df.get(col, 0) for col in cols) for total, cols in TOTAIS.items()})
+
+
+def column_map(prefixo):
+    """Cabeçalho achatado da planilha -> coluna interna, para todas as peneiras e produtos do registro"""
+    return {f"{prefixo} {cfg['rotulo']}_{sufixo}": f'{pen}_{prod}'
+            for pen, cfg in PENEIRAS.items() for prod, (sufixo, _) in TIPOS_PRODUTO.items()}
+
+
+# ========== CUBO DIA × PENEIRA × PRODUTO ==========
+class ProductionCube:
+    """
+    Produção diária como matriz densa (dia × peneira × produto). Totais,
+    atingimento de metas e mix são reduções em eixos sobre o recorte de datas,
+    com o mesmo custo para duas ou doze peneiras.
+    """
+
+    def __init__(self, df):
+        self.peneiras = list(PENEIRAS)
+        self.produtos = list(TIPOS_PRODUTO)
+        diario = df.groupby(df['data'].dt.normalize()).sum(numeric_only=True).sort_index()
+        diario = diario.reindex(columns=PRODUTOS, fill_value=0).fillna(0)
+        self.datas = diario.index.to_numpy(dtype='datetime64[ns]')
+        self.valores = diario.to_numpy(dtype=float).reshape(len(diario), len(self.peneiras), len(self.produtos))
+
+    def _recorte(self, inicio=None, fim=None):
+        i = 0 if inicio is None else int(np.searchsorted(self.datas, np.datetime64(pd.Timestamp(inicio).normalize(), 'ns'), 'left'))
+        j = len(self.datas) if fim is None else int(np.searchsorted(self.datas, np.datetime64(pd.Timestamp(fim).normalize() + pd.Timedelta(days=1), 'ns'), 'left'))
+        return self.datas[i:j], self.valores[i:j]
+
+    def summary(self, inicio, fim, meta_dia, meta_lump_dia):
+        """
+        Indicadores do período por peneira e combinados (última linha, índice
+        ``'comb'``), considerando só os dias produtivos (produção total > 0).
+        Colunas: rotulo, producao, dias, media, ultimo, meta, ating, ating_lump
+        e o mix (``mix_<produto>``, em toneladas).
+        """
+        datas, v = self._recorte(inicio, fim)
+        por_peneira = v.sum(axis=2)                       # (dia, peneira)
+        produtivo = por_peneira.sum(axis=1) > 0
+        v, por_peneira = v[produtivo], por_peneira[produtivo]
+        dias = (por_peneira > 0).sum(axis=0)
+        producao = por_peneira.sum(axis=0)
+        mix = v.sum(axis=0)                               # (peneira, produto)
+        ultimo = por_peneira[-1] if len(por_peneira) else np.zeros(len(self.peneiras))
+        lump = mix[:, self.produtos.index('lump')] if 'lump' in self.produtos else np.zeros(len(self.peneiras))
+
+        linhas = pd.DataFrame({
+            'rotulo': [PENEIRAS[p]['rotulo'] for p in self.peneiras] + ['Combinado'],
+            'producao': np.append(producao, producao.sum()),
+            'dias': np.append(dias, produtivo.sum()),
+            'ultimo': np.append(ultimo, ultimo.sum()),
+            'meta': np.append(meta_dia * dias, meta_dia * dias.sum()),
+            'meta_lump': np.append(meta_lump_dia * dias, meta_lump_dia * dias.sum()),
+            'lump': np.append(lump, lump.sum()),
+            **{f'mix_{prod}': np.append(mix[:, k], mix[:, k].sum()) for k, prod in enumerate(self.produtos)},
+        }, index=self.peneiras + ['comb'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            linhas['media'] = np.where(linhas['dias'] > 0, linhas['producao'] / linhas['dias'], 0.0)
+            linhas['ating'] = np.where(linhas['meta'] > 0, linhas['producao'] / linhas['meta'] * 100, 0.0)
+            linhas['ating_lump'] = np.where(linhas['meta_lump'] > 0, linhas['lump'] / linhas['meta_lump'] * 100, 0.0)
+        linhas.attrs['ultima_data'] = pd.Timestamp(datas[produtivo][-1]) if produtivo.any() else None
+        return linhas
+
+
+class _Base:
+    """Somas acumuladas e janelas móveis de uma sequência de dias"""
+
+    def __init__(self, datas, valores):
+        self.datas = datas
+        self.acumulado = np.vstack([np.zeros((1, valores.shape[1])), np.cumsum(valores, axis=0)])
+        self.soma, self.media = {}, {}
+        self._janelas(0)
+
+    def _janelas(self, inicio):
+        """Calcula as janelas das linhas a partir de ``inicio`` (min_periods=1)"""
+        fim = np.arange(inicio, len(self.datas)) + 1
+        for w in JANELAS:
+            comeco = np.maximum(fim - w, 0)
+            soma = self.acumulado[fim] - self.acumulado[comeco]
+            media = soma / (fim - comeco)[:, None]
+            self.soma[w] = np.vstack([self.soma[w][:inicio], soma]) if inicio else soma
+            self.media[w] = np.vstack([self.media[w][:inicio], media]) if inicio else media
+
+    def estendida(self, datas, novos):
+        """Nova base com ``novos`` acrescentados; só as linhas novas são calculadas"""
+        base = object.__new__(_Base)
+        base.datas = np.concatenate([self.datas, datas])
+        base.acumulado = np.vstack([self.acumulado, self.acumulado[-1] + np.cumsum(novos, axis=0)])
+        base.soma, base.media = dict(self.soma), dict(self.media)
+        base._janelas(len(self.datas))
+        return base
+
+    def posicao(self, data):
+        """Índice da última linha até o dia ``data``, inclusive (-1 se nenhuma)"""
+        limite = np.datetime64(pd.Timestamp(data).normalize() + pd.Timedelta(days=1), 'ns')
+        return int(np.searchsorted(self.datas, limite, 'left')) - 1
+
+    def intervalo(self, inicio=None, fim=None):
+        """Fatia [i, j) das linhas entre os dias ``inicio`` e ``fim``, inclusive"""
+        i = 0 if inicio is None else int(np.searchsorted(self.datas, np.datetime64(pd.Timestamp(inicio).normalize(), 'ns'), 'left'))
+        j = len(self.datas) if fim is None else self.posicao(fim) + 1
+        return i, max(i, j)
+
+
+class RollingEngine:
+    """Somas e médias móveis de 7/14 dias de todas as colunas de produção"""
+
+    def __init__(self, df):
+        self.colunas = [c for c in PRODUTOS if c in df.columns] + list(TOTAIS) + ['total_dia']
+        diario = self._diario(df)
+        self.valores = diario.to_numpy(dtype=float)
+        self.bases = {
+            'calendario': _Base(diario.index.to_numpy(dtype='datetime64[ns]'), self.valores),
+            'produtivo': self._base_produtiva(diario),
+        }
+
+    def _diario(self, df):
+        """Uma linha por data com as colunas do motor (datas repetidas são somadas)"""
+        diario = add_totals(df).groupby(df['data'].dt.normalize())[self.colunas].sum()
+        return diario.sort_index()
+
+    def _base_produtiva(self, diario):
+        prod = diario[diario['total_dia'] > 0]
+        return _Base(prod.index.to_numpy(dtype='datetime64[ns]'), prod.to_numpy(dtype=float))
+
+    def extends(self, df):
+        """Indica se ``df`` é este histórico com dias acrescentados apenas no final"""
+        if [c for c in PRODUTOS if c in df.columns] + list(TOTAIS) + ['total_dia'] != self.colunas:
+            return False
+        diario = self._diario(df)
+        n = len(self.valores)
+        datas = self.bases['calendario'].datas
+        return (len(diario) >= n and np.array_equal(diario.index[:n].to_numpy(dtype='datetime64[ns]'), datas)
+                and np.array_equal(diario.to_numpy(dtype=float)[:n], self.valores))
+
+    def appended(self, df):
+        """Novo motor com os dias finais de ``df``; pressupõe ``self.extends(df)``"""
+        diario = self._diario(df)
+        n = len(self.valores)
+        novos = diario.iloc[n:]
+        motor = object.__new__(RollingEngine)
+        motor.colunas = self.colunas
+        motor.valores = diario.to_numpy(dtype=float)
+        motor.bases = {'calendario': self.bases['calendario'].estendida(novos.index.to_numpy(dtype='datetime64[ns]'), novos.to_numpy(dtype=float))}
+        prod = novos[novos['total_dia'] > 0]
+        motor.bases['produtivo'] = self.bases['produtivo'].estendida(prod.index.to_numpy(dtype='datetime64[ns]'), prod.to_numpy(dtype=float))
+        return motor
+
+    def series(self, coluna, janela=7, stat='media', base='calendario', inicio=None, fim=None):
+        """Série móvel (indexada por data) recortada em [inicio, fim]"""
+        b = self.bases[base]
+        i, j = b.intervalo(inicio, fim)
+        valores = getattr(b, stat)[janela][i:j, self.colunas.index(coluna)]
+        return pd.Series(valores, index=pd.DatetimeIndex(b.datas[i:j]), name=f"{stat}_{janela}d_{coluna}")
+
+    def value(self, coluna, janela=7, stat='media', base='calendario', em=None):
+        """Valor móvel na última linha até ``em`` (0 se não houver)"""
+        b = self.bases[base]
+        j = len(b.datas) - 1 if em is None else b.posicao(em)
+        return float(getattr(b, stat)[janela][j, self.colunas.index(coluna)]) if j >= 0 else 0.0
+
+    def trend(self, coluna, em=None, base='produtivo'):
+        """Variação % entre os últimos 7 dias produtivos e os 7 anteriores (0 sem 14 dias)"""
+        b = self.bases[base]
+        j = len(b.datas) - 1 if em is None else b.posicao(em)
+        if j < 13:
+            return 0.0
+        k = self.colunas.index(coluna)
+        ult7, penult7 = b.media[7][j, k], b.media[7][j - 7, k]
+        return float((ult7 - penult7) / penult7 * 100) if penult7 > 0 else 0.0
+
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def rolling_engine(name, df):
+    """
+    Motor do processo para o dataset ``name``: reaproveita o anterior quando
+    ``df`` só acrescenta dias e reconstrói do zero caso contrário.
+    """
+    with _lock:
+        anterior = _engines.get(name)
+    if anterior is not None and anterior.extends(df):
+        motor = anterior if len(anterior.valores) == df['data'].dt.normalize().nunique() else anterior.appended(df)
+    else:
+        motor = RollingEngine(df)
+    with _lock:
+        _engines[name] = motor
+    return motor
+
+
+# ========== PREVISÃO DE ESGOTAMENTO ==========
+class DepletionModel:
+    """
+    Bootstrap de consumos diários históricos (incluindo dias sem produção) em
+    ``cenarios`` trajetórias de ``horizonte`` dias, montado uma vez por versão.
+
+    Como o consumo acumulado de cada cenário só cresce, "esgotou até o dia d"
+    equivale a "consumo acumulado em d >= estoque". Guardando, por dia, a
+    estatística de ordem de cada percentil, o dia de esgotamento de qualquer
+    estoque sai de uma busca binária: o simulador de metas consulta estoques
+    diferentes sem sortear novos cenários.
+    """
+
+    def __init__(self, consumos, cenarios=5000, horizonte=730, percentis=(10, 50, 90), seed=0):
+        consumos = np.asarray(consumos, dtype=float)
+        consumos = np.clip(consumos[~np.isnan(consumos)], 0, None)
+        self.percentis, self.horizonte = tuple(percentis), horizonte
+        self.cenarios = cenarios if consumos.size and consumos.mean() > 0 else 0
+        self.curvas, self.finais = {}, np.array([])
+        if not self.cenarios:
+            return
+        rng = np.random.default_rng(seed)
+        acumulado = np.cumsum(consumos[rng.integers(0, consumos.size, size=(cenarios, horizonte))], axis=1)
+        # Percentil p (método 'lower') do dia de esgotamento = 1º dia em que pelo menos k+1
+        # cenários já esgotaram, k = floor(p/100 · (N-1)): a (k+1)-ésima maior trajetória
+        ordem = {p: cenarios - 1 - int(np.floor(p / 100 * (cenarios - 1))) for p in self.percentis}
+        parcial = np.partition(acumulado, sorted(set(ordem.values())), axis=0)
+        self.curvas = {p: parcial[k] for p, k in ordem.items()}
+        self.finais = np.sort(acumulado[:, -1])
+
+    def forecast(self, estoque):
+        """Dias até o esgotamento por percentil (NaN além do horizonte) e fração que esgota"""
+        if estoque <= 0:
+            return {'dias': {p: 0.0 for p in self.percentis}, 'fracao_esgota': 1.0, 'horizonte': self.horizonte, 'cenarios': self.cenarios}
+        if not self.cenarios:
+            return {'dias': {p: np.nan for p in self.percentis}, 'fracao_esgota': np.nan, 'horizonte': self.horizonte, 'cenarios': 0}
+        dias = {}
+        for p, curva in self.curvas.items():
+            d = int(np.searchsorted(curva, estoque, 'left')) + 1
+            dias[p] = float(d) if d <= self.horizonte else np.nan
+        esgota = 1 - np.searchsorted(self.finais, estoque, 'left') / self.cenarios
+        return {'dias': dias, 'fracao_esgota': float(esgota), 'horizonte': self.horizonte, 'cenarios': self.cenarios}
+
+
+def depletion_forecast(consumos, estoque, cenarios=5000, horizonte=730, percentis=(10, 50, 90), seed=0):
+    """Previsão avulsa: monta o modelo e consulta um único estoque"""
+    return DepletionModel(consumos, cenarios, horizonte, percentis, seed).forecast(estoque)
+
+
+def last_productive_day(df):
+    """
+    Último dia com produção: a planilha pode trazer linhas futuras já
+    preenchidas (com zero), que não devem contar como dias parados nem mover
+    a data de referência.
+    """
+    return df.loc[df['total_dia'] > 0, 'data'].max().normalize()
+
+
+def recent_consumption(df, dias=DIAS_BOOTSTRAP):
+    """Consumos diários (``total_dia``) dos ``dias`` até o último dia produtivo, base do bootstrap de esgotamento"""
+    ultima_data = last_productive_day(df)
+    return df.loc[(df['data'] > ultima_data - pd.Timedelta(days=dias)) & (df['data'] <= ultima_data), 'total_dia']
+
+
+def stock_status(df, motor, em=None, estoque_inicial=ESTOQUE_INICIAL, data_inicial=DATA_ESTOQUE_INICIAL):
+    """Estoque aproximado (inicial menos a produção peneirada desde ``data_inicial``), ritmo MM7 e dias restantes"""
+    prod_consumida = df.loc[df['data'].dt.date > data_inicial, 'total_dia'].sum()
+    estoque = estoque_inicial - prod_consumida
+    ritmo = motor.value('total_dia', 7, em=em)
+    return {
+        'estoque_atual': estoque,
+        'prod_consumida': prod_consumida,
+        'ritmo_atual': ritmo,
+        'dias_restantes': estoque / ritmo if ritmo > 0 else 0,
+    }
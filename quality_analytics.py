@@ -0,0 +1,465 @@
+"""
+Agregações de qualidade pré-calculadas por versão dos dados.
+
+As funções recebem o ``boxplot_data`` do dashboard de Qualidade (uma linha por
+dia e peneira, coluna ``Peneira``) e devolvem tabelas pequenas, prontas para
+gráficos, de modo que trocar de indicador não exija reprocessar as linhas brutas.
+"""
+
+import numpy as np
+import pandas as pd
+
+INDICADORES = ['Fe', 'SiO2', 'Al2O3', 'TMP', '>31_5mm', '<0_15mm']
+
+
+def long_values(boxplot_data, indicadores=INDICADORES):
+    """Formato longo (Data, Peneira, Mes, Indicador, valor) sem nulos nem zeros"""
+    cols = [c for c in indicadores if c in boxplot_data.columns]
+    if not cols:
+        return pd.DataFrame(columns=['Data', 'Peneira', 'Mes', 'Indicador', 'valor'])
+    df = boxplot_data[['Data', 'Peneira'] + cols].dropna(subset=['Data'])
+    df = df.assign(**{c: pd.to_numeric(df[c], errors='coerce') for c in cols})
+    long = df.melt(id_vars=['Data', 'Peneira'], value_vars=cols, var_name='Indicador', value_name='valor')
+    long = long[long['valor'].notna() & (long['valor'] != 0)]
+    long['Mes'] = long['Data'].dt.to_period('M').dt.to_timestamp()
+    return long.reset_index(drop=True)
+
+
+def quantile_summary(boxplot_data, indicadores=INDICADORES):
+    """
+    Resumo por Indicador × Peneira × Mês: quartis, bigodes (1,5 × IQR, como o
+    Plotly), média, desvio padrão, mínimo, máximo e contagem.
+    """
+    long = long_values(boxplot_data, indicadores)
+    keys = ['Indicador', 'Peneira', 'Mes']
+    if long.empty:
+        return pd.DataFrame(columns=keys + ['q1', 'mediana', 'q3', 'lim_inf', 'lim_sup',
+                                            'media', 'desvio', 'minimo', 'maximo', 'n'])
+
+    grouped = long.groupby(keys)['valor']
+    quartis = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quartis.columns = ['q1', 'mediana', 'q3']
+    resumo = quartis.join(grouped.agg(media='mean', desvio='std', minimo='min', maximo='max', n='count'))
+
+    # Bigodes: valores extremos ainda dentro das cercas de Tukey
+    iqr = resumo['q3'] - resumo['q1']
+    cercas = pd.DataFrame({'cerca_inf': resumo['q1'] - 1.5 * iqr, 'cerca_sup': resumo['q3'] + 1.5 * iqr})
+    long = long.join(cercas, on=keys)
+    dentro = long[(long['valor'] >= long['cerca_inf']) & (long['valor'] <= long['cerca_sup'])]
+    bigodes = dentro.groupby(keys)['valor'].agg(lim_inf='min', lim_sup='max')
+    resumo = resumo.join(bigodes)
+    resumo['lim_inf'] = resumo['lim_inf'].fillna(resumo['minimo'])
+    resumo['lim_sup'] = resumo['lim_sup'].fillna(resumo['maximo'])
+    return resumo.reset_index()
+
+
+def pooled_stats(resumo):
+    """
+    Combina linhas de resumo (ex.: vários meses) em média, desvio, mínimo,
+    máximo e contagem exatos, sem voltar às linhas brutas.
+    """
+    n = resumo['n'].to_numpy(dtype=float)
+    total = n.sum()
+    if total == 0:
+        return {'media': np.nan, 'desvio': np.nan, 'minimo': np.nan, 'maximo': np.nan, 'n': 0}
+    medias = resumo['media'].to_numpy(dtype=float)
+    media = float((n * medias).sum() / total)
+    variancias = np.nan_to_num(resumo['desvio'].to_numpy(dtype=float) ** 2)
+    soma_quadrados = ((n - 1) * variancias + n * (medias - media) ** 2).sum()
+    return {
+        'media': media,
+        'desvio': float(np.sqrt(soma_quadrados / (total - 1))) if total > 1 else np.nan,
+        'minimo': float(resumo['minimo'].min()),
+        'maximo': float(resumo['maximo'].max()),
+        'n': int(total),
+    }
+
+
+def period_medians(boxplot_data, indicadores=INDICADORES):
+    """
+    Mediana exata por Indicador × Peneira sobre todas as linhas do período (a
+    mediana não se combina a partir das medianas mensais, ao contrário de
+    ``pooled_stats``).
+    """
+    return long_values(boxplot_data, indicadores).groupby(['Indicador', 'Peneira'])['valor'].median()
+
+
+# ========== CONTROLE ESTATÍSTICO DE PROCESSO ==========
+# Constantes de cartas de controle (Montgomery): d2 para amplitude móvel (n=2)
+# e A2/D3/D4 para subgrupos de tamanho 5
+D2_MR, D4_MR = 1.128, 3.267
+SUBGRUPO = 5
+A2, D3, D4 = 0.577, 0.0, 2.114
+
+REGRAS_WE = {
+    1: "1 ponto além de 3σ",
+    2: "2 de 3 além de 2σ (mesmo lado)",
+    3: "4 de 5 além de 1σ (mesmo lado)",
+    4: "8 consecutivos do mesmo lado",
+}
+
+
+def _window_count(mask, k):
+    """Quantidade de True nas janelas de tamanho k terminando em cada posição (eixo -1)"""
+    cs = np.cumsum(mask, axis=-1, dtype=np.int32)
+    out = cs.copy()
+    out[..., k:] = cs[..., k:] - cs[..., :-k]
+    out[..., :k - 1] = 0  # janelas incompletas não contam
+    return out
+
+
+def _western_electric(z, valid):
+    """Matriz (regra, ...) de violações, marcando o último ponto de cada janela"""
+    up = {s: (z > s) & valid for s in (1, 2, 3)}
+    down = {s: (z < -s) & valid for s in (1, 2, 3)}
+    r1 = up[3] | down[3]
+    r2 = ((_window_count(up[2], 3) >= 2) & up[2]) | ((_window_count(down[2], 3) >= 2) & down[2])
+    r3 = ((_window_count(up[1], 5) >= 4) & up[1]) | ((_window_count(down[1], 5) >= 4) & down[1])
+    r4 = (_window_count((z > 0) & valid, 8) == 8) | (_window_count((z < 0) & valid, 8) == 8)
+    return np.stack([r1, r2, r3, r4])
+
+
+def spc_analysis(boxplot_data, indicadores=INDICADORES):
+    """
+    Cartas I-MR e X̄/R (subgrupos de 5 dias consecutivos com dado) e regras de
+    Western Electric para todos os indicadores e peneiras em uma única passada
+    NumPy sobre o cubo (peneira × indicador × dia).
+
+    Devolve um dicionário com:
+    - ``limites``: DataFrame por Peneira × Indicador (média, sigma, LCL/UCL de
+      I, MR, X̄ e R, n);
+    - ``series``: DataFrame longo com valor, MR, z e regras violadas por ponto;
+    - ``subgrupos``: DataFrame com média e amplitude de cada subgrupo.
+    """
+    cols = [c for c in indicadores if c in boxplot_data.columns]
+    df = boxplot_data[boxplot_data['Data'].notna()]
+    peneiras = sorted(df['Peneira'].dropna().unique())
+    datas = np.array(sorted(df['Data'].unique()), dtype='datetime64[ns]')
+    vazio = {'limites': pd.DataFrame(), 'series': pd.DataFrame(), 'subgrupos': pd.DataFrame()}
+    if not cols or not peneiras or len(datas) == 0:
+        return vazio
+
+    # Cubo (P, I, T) com NaN para ausentes e zeros
+    cubo = np.full((len(peneiras), len(cols), len(datas)), np.nan)
+    pos_data = np.searchsorted(datas, df['Data'].to_numpy(dtype='datetime64[ns]'))
+    pos_pen = pd.Categorical(df['Peneira'], categories=peneiras).codes
+    valores = df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, copy=True)
+    valores[valores == 0] = np.nan
+    cubo[pos_pen[:, None], np.arange(len(cols))[None, :], pos_data[:, None]] = valores
+
+    # Compacta cada série à esquerda (pontos válidos em ordem cronológica)
+    ordem = np.argsort(np.isnan(cubo), axis=-1, kind='stable')
+    x = np.take_along_axis(cubo, ordem, axis=-1)
+    d = datas[ordem]
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Individuais e amplitude móvel
+        mr = np.full_like(x, np.nan)
+        mr[..., 1:] = np.abs(np.diff(x, axis=-1))
+        media = np.nanmean(np.where(valid, x, np.nan), axis=-1)
+        mr_bar = np.nanmean(mr, axis=-1)
+        sigma = mr_bar / D2_MR
+        z = (x - media[..., None]) / sigma[..., None]
+        regras = _western_electric(np.nan_to_num(z), valid)
+
+        # X̄/R com subgrupos completos de tamanho SUBGRUPO
+        g = x.shape[-1] // SUBGRUPO
+        sub = x[..., :g * SUBGRUPO].reshape(x.shape[:-1] + (g, SUBGRUPO))
+        completo = ~np.isnan(sub).any(axis=-1)
+        sub_media = np.where(completo, sub.mean(axis=-1), np.nan)
+        sub_amp = np.where(completo, np.ptp(sub, axis=-1), np.nan)
+        xbarbar = np.nanmean(sub_media, axis=-1) if g else np.full(media.shape, np.nan)
+        r_bar = np.nanmean(sub_amp, axis=-1) if g else np.full(media.shape, np.nan)
+
+    p_idx, i_idx = np.meshgrid(np.arange(len(peneiras)), np.arange(len(cols)), indexing='ij')
+    limites = pd.DataFrame({
+        'Peneira': np.array(peneiras)[p_idx.ravel()],
+        'Indicador': np.array(cols)[i_idx.ravel()],
+        'n': n.ravel(),
+        'media': media.ravel(),
+        'sigma': sigma.ravel(),
+        'i_lcl': (media - 3 * sigma).ravel(),
+        'i_ucl': (media + 3 * sigma).ravel(),
+        'mr_bar': mr_bar.ravel(),
+        'mr_ucl': (D4_MR * mr_bar).ravel(),
+        'xbarbar': xbarbar.ravel(),
+        'r_bar': r_bar.ravel(),
+        'xbar_lcl': (xbarbar - A2 * r_bar).ravel(),
+        'xbar_ucl': (xbarbar + A2 * r_bar).ravel(),
+        'r_lcl': (D3 * r_bar).ravel(),
+        'r_ucl': (D4 * r_bar).ravel(),
+    })
+
+    # Série longa só com pontos válidos
+    pp, ii, tt = np.nonzero(valid)
+    series = pd.DataFrame({
+        'Peneira': np.array(peneiras)[pp],
+        'Indicador': np.array(cols)[ii],
+        'Data': d[pp, ii, tt],
+        'valor': x[pp, ii, tt],
+        'mr': mr[pp, ii, tt],
+        'z': z[pp, ii, tt],
+    })
+    for k in REGRAS_WE:
+        series[f'regra_{k}'] = regras[k - 1][pp, ii, tt]
+
+    gp, gi, gg = np.nonzero(~np.isnan(sub_media)) if g else (np.array([], int),) * 3
+    subgrupos = pd.DataFrame({
+        'Peneira': np.array(peneiras)[gp],
+        'Indicador': np.array(cols)[gi],
+        'Subgrupo': gg + 1,
+        'Inicio': d[gp, gi, gg * SUBGRUPO] if g else np.array([], dtype='datetime64[ns]'),
+        'media': sub_media[gp, gi, gg] if g else np.array([]),
+        'amplitude': sub_amp[gp, gi, gg] if g else np.array([]),
+    })
+    return {'limites': limites, 'series': series, 'subgrupos': subgrupos}
+
+
+def capability(limites, especificacoes):
+    """
+    Cp/Cpk a partir da média e do sigma de curto prazo (MR/d2) de cada série.
+    ``especificacoes``: {indicador: (LIE, LSE)}, com None para limite ausente.
+    """
+    lie = limites['Indicador'].map(lambda i: (especificacoes.get(i) or (None, None))[0]).astype(float)
+    lse = limites['Indicador'].map(lambda i: (especificacoes.get(i) or (None, None))[1]).astype(float)
+    sigma = limites['sigma'].where(limites['sigma'] > 0)
+    media = limites['media']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cp = (lse - lie) / (6 * sigma)
+        cpk = pd.concat([(lse - media) / (3 * sigma), (media - lie) / (3 * sigma)], axis=1).min(axis=1, skipna=True)
+    return limites[['Peneira', 'Indicador']].assign(LIE=lie, LSE=lse, Cp=cp, Cpk=cpk)
+
+
+# ========== AGREGAÇÃO PONDERADA POR TONELAGEM ==========
+class WeightedAggregator:
+    """
+    Médias e variâncias ponderadas pela tonelagem (``Ton``) por peneira e para
+    o blend das peneiras, em qualquer janela de datas.
+
+    Guarda somas acumuladas de w, w·x e w·x² no eixo dos dias (com um zero à
+    frente), de modo que cada consulta de janela é só a diferença entre duas
+    posições. Dias sem tonelagem positiva ou com valor nulo/zero não pesam.
+    Sem coluna ``Ton``, cada dia com dado pesa 1.
+    """
+
+    BLEND = 'Blend'
+
+    def __init__(self, boxplot_data, indicadores=INDICADORES):
+        self.indicadores = [c for c in indicadores if c in boxplot_data.columns]
+        df = boxplot_data[boxplot_data['Data'].notna()]
+        self.peneiras = sorted(df['Peneira'].dropna().unique())
+        self.datas = np.array(sorted(df['Data'].dt.normalize().unique()), dtype='datetime64[ns]')
+        shape = (len(self.peneiras), len(self.indicadores), len(self.datas))
+        w, wx, wx2 = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+        if all(shape):
+            pos_dia = np.searchsorted(self.datas, df['Data'].dt.normalize().to_numpy(dtype='datetime64[ns]'))
+            pos_pen = pd.Categorical(df['Peneira'], categories=self.peneiras).codes
+            x = df[self.indicadores].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, copy=True)
+            if 'Ton' in df.columns:
+                ton = pd.to_numeric(df['Ton'], errors='coerce').fillna(0).to_numpy(dtype=float)
+                ton = np.where(ton > 0, ton, 0.0)
+            else: ton = np.ones(len(df))
+            peso = np.where(np.isnan(x) | (x == 0), 0.0, ton[:, None])
+            x = np.nan_to_num(x)
+            # Linhas repetidas no mesmo dia/peneira se acumulam
+            idx = (pos_pen[:, None], np.arange(len(self.indicadores))[None, :], pos_dia[:, None])
+            np.add.at(w, idx, peso)
+            np.add.at(wx, idx, peso * x)
+            np.add.at(wx2, idx, peso * x * x)
+
+        # Blend = soma das peneiras; acumulado com zero inicial: janela [i, j) = c[j] - c[i]
+        def acumular(a):
+            a = np.concatenate([a, a.sum(axis=0, keepdims=True)], axis=0)
+            return np.concatenate([np.zeros(a.shape[:-1] + (1,)), np.cumsum(a, axis=-1)], axis=-1)
+        self._w, self._wx, self._wx2 = acumular(w), acumular(wx), acumular(wx2)
+        self.grupos = self.peneiras + [self.BLEND]
+
+    @property
+    def vazio(self):
+        return len(self.datas) == 0
+
+    def _posicoes(self, inicio=None, fim=None):
+        """Índices [i, j) dos dias dentro de [inicio, fim] (datas inclusivas)"""
+        i = 0 if inicio is None else int(np.searchsorted(self.datas, np.datetime64(pd.Timestamp(inicio).normalize(), 'ns'), 'left'))
+        j = len(self.datas) if fim is None else int(np.searchsorted(self.datas, np.datetime64(pd.Timestamp(fim).normalize(), 'ns'), 'right'))
+        return i, max(i, j)
+
+    def window(self, inicio=None, fim=None):
+        """
+        Estatísticas da janela: dicionário de DataFrames (indicadores × grupos)
+        com ``media``, ``desvio`` (ponderado, populacional) e ``peso`` (toneladas).
+        """
+        i, j = self._posicoes(inicio, fim)
+        w = self._w[..., j] - self._w[..., i]
+        sx = self._wx[..., j] - self._wx[..., i]
+        sx2 = self._wx2[..., j] - self._wx2[..., i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = np.where(w > 0, sx / w, np.nan)
+            var = np.clip(np.where(w > 0, sx2 / w - media ** 2, np.nan), 0, None)
+        quadro = lambda a: pd.DataFrame(a.T, index=self.indicadores, columns=self.grupos)
+        return {'media': quadro(media), 'desvio': quadro(np.sqrt(var)), 'peso': quadro(w)}
+
+    def means(self, inicio=None, fim=None):
+        """Médias ponderadas da janela (indicadores × grupos), no formato dos cards"""
+        return self.window(inicio, fim)['media']
+
+
+# ========== RESUMO DO RELATÓRIO ==========
+def summarize_report(blocos):
+    """
+    Resultados do último dia (indicadores × peneira, mais ``PRODUTO_DIA``),
+    médias do mês ponderadas pela tonelagem, dados de boxplot e mês de
+    referência por extenso, a partir dos blocos PMT 01/PMT 02 empilhados.
+    """
+    # Separa os blocos novamente (colunas ausentes em um bloco ficam só NaN após o concat)
+    pmt01, pmt02 = [blocos[blocos['Peneira'] == p].drop(columns='Peneira').dropna(axis=1, how='all').reset_index(drop=True)
+                    for p in ['PMT 01', 'PMT 02']]
+    for df in (pmt01, pmt02):
+        if 'Data' not in df.columns:
+            df['Data'] = pd.NaT
+
+    # Find last valid date
+    def last_valid_date(df):
+        if 'Ton' in df.columns:
+            mask = pd.to_numeric(df['Ton'], errors='coerce').fillna(0) > 0
+            if mask.any():
+                return df.loc[mask, 'Data'].max()
+        numeric_cols = [c for c in df.columns if c != 'Data']
+        if numeric_cols:
+            mask = df[numeric_cols].notna().any(axis=1)
+            if mask.any():
+                return df.loc[mask, 'Data'].max()
+        return df['Data'].dropna().max() if df['Data'].notna().any() else pd.NaT
+
+    ultimo_dia = max([d for d in [last_valid_date(pmt01), last_valid_date(pmt02)] if not pd.isna(d)])
+
+    # Get data for last day
+    def get_day_data(df, date):
+        try:
+            mask = df['Data'] == date
+            if mask.any():
+                return df.loc[mask].iloc[0].drop(labels='Data')
+        except Exception:
+            pass
+        if 'Ton' in df.columns:
+            try:
+                mask = pd.to_numeric(df['Ton'], errors='coerce').fillna(0) > 0
+                if mask.any():
+                    return df.loc[mask].iloc[-1].drop(labels='Data')
+            except Exception:
+                pass
+        numeric_cols = [c for c in df.columns if c != 'Data']
+        mask = df[numeric_cols].notna().any(axis=1)
+        if mask.any():
+            return df.loc[mask].iloc[-1].drop(labels='Data')
+        return pd.Series([pd.NA] * len(numeric_cols), index=numeric_cols)
+
+    row1, row2 = get_day_data(pmt01, ultimo_dia), get_day_data(pmt02, ultimo_dia)
+
+    # Create day DataFrame
+    dia_data = {ind: [row1.get(ind, pd.NA), row2.get(ind, pd.NA)] for ind in INDICADORES}
+    dia = pd.DataFrame(dia_data, index=['PMT 01', 'PMT 02']).T
+    dia.loc['PRODUTO_DIA'] = [ultimo_dia, ultimo_dia]
+
+    # Monthly means weighted by tonnage (excluding zeros)
+    media = WeightedAggregator(blocos, INDICADORES).means().reindex(index=INDICADORES, columns=['PMT 01', 'PMT 02'])
+
+    # Boxplot data
+    boxplot_data = blocos[blocos['Data'].notna()].reset_index(drop=True)
+
+    # Format month
+    meses = {'01': 'Janeiro', '02': 'Fevereiro', '03': 'Março', '04': 'Abril', '05': 'Maio', '06': 'Junho',
+             '07': 'Julho', '08': 'Agosto', '09': 'Setembro', '10': 'Outubro', '11': 'Novembro', '12': 'Dezembro'}
+    mm, yy = ultimo_dia.strftime('%m'), ultimo_dia.strftime('%Y')
+    mes_pt = f"{meses.get(mm, mm)}/{yy}"
+
+    return dia, media, boxplot_data, mes_pt
+
+
+# ========== CORRELAÇÕES ==========
+EXTRAS_CORRELACAO = ['Ton', 'P', 'Mn', 'LOI']
+MAX_DEFASAGEM = 7
+
+
+def _pairwise_corr(a, b):
+    """
+    Pearson entre todas as colunas de ``a`` e de ``b`` (mesmas linhas) usando só
+    as linhas em que o par tem dado, via produtos matriciais das máscaras.
+    Devolve (r, n).
+    """
+    ma, mb = ~np.isnan(a), ~np.isnan(b)
+    a0, b0 = np.where(ma, a, 0.0), np.where(mb, b, 0.0)
+    fa, fb = ma.astype(float), mb.astype(float)
+    n = fa.T @ fb
+    sa, sb = a0.T @ fb, fa.T @ b0
+    saa, sbb = (a0 * a0).T @ fb, fa.T @ (b0 * b0)
+    sab = a0.T @ b0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sab - sa * sb
+        var = (n * saa - sa ** 2) * (n * sbb - sb ** 2)
+        r = np.where((n > 2) & (var > 0), cov / np.sqrt(np.clip(var, 0, None)), np.nan)
+    return np.clip(r, -1, 1), n
+
+
+def _ranks(x):
+    """Postos médios por coluna, ignorando NaN"""
+    return pd.DataFrame(x).rank(method='average').to_numpy()
+
+
+def _spearman(x):
+    """
+    Spearman par a par, como ``DataFrame.corr(method='spearman')``: os postos
+    de cada coluna inteira servem aos pares com o mesmo padrão de ausentes; os
+    demais pares têm os postos refeitos só nas linhas em que os dois têm dado.
+    """
+    postos = _ranks(x)
+    r = _pairwise_corr(postos, postos)[0]
+    validos = ~np.isnan(x)
+    for i, j in zip(*np.triu_indices(x.shape[1], k=1)):
+        if (validos[:, i] == validos[:, j]).all():
+            continue
+        par = _ranks(x[validos[:, i] & validos[:, j]][:, [i, j]])
+        r[i, j] = r[j, i] = _pairwise_corr(par, par)[0][0, 1]
+    return r
+
+
+def correlation_analysis(boxplot_data, indicadores=INDICADORES, extras=EXTRAS_CORRELACAO, max_lag=MAX_DEFASAGEM):
+    """
+    Matrizes de correlação de Pearson e Spearman (por peneira e com as duas
+    juntas) e correlações defasadas de 0 a ``max_lag`` dias por peneira.
+
+    Zeros são tratados como ausência de dado. Na defasagem, ``r`` de
+    (Variavel, Alvo, lag) mede a relação entre Variavel no dia t e Alvo no dia
+    t + lag, no calendário contínuo de cada peneira.
+    """
+    cols = [c for c in list(indicadores) + list(extras) if c in boxplot_data.columns]
+    df = boxplot_data[boxplot_data['Data'].notna()]
+    resultado = {'colunas': cols, 'pearson': {}, 'spearman': {}, 'defasagem': pd.DataFrame(columns=['Peneira', 'Variavel', 'Alvo', 'lag', 'r', 'n'])}
+    if len(cols) < 2 or df.empty:
+        return resultado
+
+    valores = df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, copy=True)
+    valores[valores == 0] = np.nan
+    grupos = {p: valores[(df['Peneira'] == p).to_numpy()] for p in sorted(df['Peneira'].dropna().unique())}
+    grupos['Ambas'] = valores
+    for nome, x in grupos.items():
+        resultado['pearson'][nome] = pd.DataFrame(_pairwise_corr(x, x)[0], index=cols, columns=cols)
+        resultado['spearman'][nome] = pd.DataFrame(_spearman(x), index=cols, columns=cols)
+
+    # Defasagens no calendário contínuo de cada peneira (média se houver linhas repetidas no dia)
+    linhas = []
+    for pmt, part in df.assign(**dict(zip(cols, valores.T))).groupby('Peneira'):
+        diario = part.groupby(part['Data'].dt.normalize())[cols].mean()
+        diario = diario.reindex(pd.date_range(diario.index.min(), diario.index.max(), freq='D'))
+        x = diario.to_numpy(dtype=float)
+        for lag in range(0, min(max_lag, len(x) - 1) + 1):
+            r, n = _pairwise_corr(x[:len(x) - lag], x[lag:])
+            vi, ai = np.meshgrid(np.arange(len(cols)), np.arange(len(cols)), indexing='ij')
+            linhas.append(pd.DataFrame({'Peneira': pmt, 'Variavel': np.array(cols)[vi.ravel()], 'Alvo': np.array(cols)[ai.ravel()],
+                                        'lag': lag, 'r': r.ravel(), 'n': n.ravel().astype(int)}))
+    if linhas:
+        resultado['defasagem'] = pd.concat(linhas, ignore_index=True)
+    return resultado
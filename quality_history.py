@@ -0,0 +1,86 @@
+"""
+Histórico de qualidade particionado por mês.
+
+Cada relatório mensal substitui o anterior no repositório; para permitir
+comparações entre meses, as linhas diárias processadas de PMT 01/PMT 02
+(``boxplot_data``) são gravadas em partições mensais Parquet, criptografadas
+com a mesma chave Fernet dos demais arquivos:
+
+    historico_qualidade/2025-09.parquet.encrypted
+
+O histórico é somente de acréscimo: uma partição só é regravada enquanto o
+mês dela ainda aparece no relatório corrente. A leitura abre apenas as
+partições do intervalo pedido.
+"""
+
+import io
+import os
+import re
+
+import pandas as pd
+
+HISTORY_DIR = "historico_qualidade"
+_PARTITION_RE = re.compile(r"^(\d{4})-(\d{2})\.parquet\.encrypted$")
+
+
+def partition_path(month, history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, f"{month.year:04d}-{month.month:02d}.parquet.encrypted")
+
+
+def available_months(history_dir=HISTORY_DIR):
+    """Meses com partição gravada, em ordem crescente"""
+    if not os.path.isdir(history_dir):
+        return []
+    months = []
+    for name in os.listdir(history_dir):
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append(pd.Timestamp(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def append(boxplot_data, fernet, history_dir=HISTORY_DIR):
+    """
+    Grava (ou atualiza) as partições dos meses presentes em ``boxplot_data``.
+    Meses que não estão no relatório corrente nunca são tocados.
+    Devolve a lista de meses gravados.
+    """
+    df = boxplot_data[boxplot_data['Data'].notna()]
+    if df.empty:
+        return []
+    os.makedirs(history_dir, exist_ok=True)
+    written = []
+    for month, part in df.groupby(df['Data'].dt.to_period('M').dt.to_timestamp()):
+        buffer = io.BytesIO()
+        part.sort_values(['Data', 'Peneira']).reset_index(drop=True).to_parquet(buffer, index=False, compression='zstd')
+        path = partition_path(month, history_dir)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(fernet.encrypt(buffer.getvalue()))
+        os.replace(tmp_path, path)
+        written.append(month)
+    return written
+
+
+def load_months(months, fernet, history_dir=HISTORY_DIR):
+    """Lê e concatena apenas as partições dos meses informados"""
+    frames = []
+    for month in months:
+        path = partition_path(month, history_dir)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            frames.append(pd.read_parquet(io.BytesIO(fernet.decrypt(f.read()))))
+    if not frames:
+        return pd.DataFrame(columns=['Data', 'Peneira'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def signature(history_dir=HISTORY_DIR):
+    """Assinatura das partições (nome, tamanho, mtime) para chavear caches do histórico"""
+    items = []
+    for month in available_months(history_dir):
+        path = partition_path(month, history_dir)
+        stat = os.stat(path)
+        items.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(items)
@@ -0,0 +1,364 @@
+"""
+Relatórios estáticos (HTML/PNG) dos dashboards nos períodos padrão.
+
+Cada página (diesel, produção, qualidade e eficiência) é executada sem
+navegador pelo ``AppTest`` do Streamlit, exatamente como o servidor a
+executaria, com a renderização progressiva desligada para incluir as seções
+recolhidas. A árvore de elementos resultante vira um HTML autossuficiente:
+métricas, textos, tabelas e os gráficos Plotly com o plotly.js embutido.
+Com ``--png`` (requer o pacote ``kaleido``), cada gráfico também é gravado
+em PNG e é gerada uma versão ``_email.html`` com as imagens embutidas, sem
+JavaScript, para envio por e-mail.
+
+Os relatórios só são refeitos quando muda a versão de alguma planilha ou o
+dia (os períodos "atuais" dependem da data); o ``index.json`` do diretório de
+saída guarda as versões usadas. As planilhas vêm dos datasets compartilhados,
+então rodar o renderizador ao lado do app não repete o parsing.
+
+Uso:
+    python report_renderer.py --out relatorios
+    python report_renderer.py --out relatorios --watch 300 --png
+"""
+
+import argparse
+import base64
+import html
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+from streamlit.proto.Block_pb2 import Block as BlockProto
+
+import data_sources
+import diesel_partitions
+import shared_datasets
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_FILE = "index.json"
+PLOTLY_JS_FILE = "plotly.min.js"
+MAX_LINHAS_TABELA = 500
+MESES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+         "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+FONTES = (data_sources.DIESEL_FILE, data_sources.PRODUCTION_FILE, data_sources.QUALITY_FILE)
+TOGGLE_PROGRESSIVO = "⚡ Renderização progressiva"
+
+CSS = """
+body { font-family: -apple-system, "Segoe UI", Roboto, sans-serif; margin: 0 auto; max-width: 1400px; padding: 24px; color: #31333f; }
+header.relatorio { border-bottom: 3px solid #FF6600; margin-bottom: 16px; }
+header.relatorio p { color: #808495; margin: 4px 0 12px; }
+.linha { display: flex; flex-wrap: wrap; gap: 16px; }
+.coluna { min-width: 0; }
+.metrica { background: #f0f2f6; border-radius: 10px; padding: 12px 15px; margin: 6px 0; }
+.metrica .rotulo { font-size: 0.85rem; color: #555; }
+.metrica .valor { font-size: 1.8rem; font-weight: 600; }
+.metrica .delta { font-size: 0.85rem; }
+.delta.GREEN { color: #09ab3b; } .delta.RED { color: #ff2b2b; } .delta.GRAY { color: #808495; }
+.legenda { color: #808495; font-size: 0.85rem; }
+.alerta { border-radius: 8px; padding: 10px 14px; margin: 8px 0; }
+.alerta.info { background: #e8f1fb; } .alerta.success { background: #e6f6ec; }
+.alerta.warning { background: #fff8e1; } .alerta.error { background: #fdecea; }
+table.tabela { border-collapse: collapse; font-size: 0.85rem; margin: 8px 0; }
+table.tabela th, table.tabela td { border-bottom: 1px solid #e6e6e6; padding: 4px 8px; text-align: right; }
+details { margin: 12px 0; } summary { cursor: pointer; font-weight: 600; }
+section.aba > h4 { border-bottom: 1px solid #e6e6e6; padding-bottom: 4px; }
+img.grafico { max-width: 100%; }
+"""
+
+
+# ========== VISÕES ==========
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def _sem_progressivo(at):
+    """Desliga a renderização progressiva para que as seções recolhidas entrem no relatório"""
+    toggles = [t for t in at.sidebar.toggle if t.label == TOGGLE_PROGRESSIVO]
+    for t in toggles:
+        t.set_value(False)
+    return at.run() if toggles else at
+
+
+def _mes_anterior(at):
+    anterior = date.today().replace(day=1) - timedelta(days=1)
+    _widget(at.sidebar.selectbox, "Tipo de Filtro").select("Mês Específico").run()
+    _widget(at.sidebar.selectbox, "Selecione o Mês").select(MESES[anterior.month - 1])
+    return _widget(at.sidebar.selectbox, "Selecione o Ano").select(anterior.year).run()
+
+
+def _ultimos_dias(dias):
+    def passo(at):
+        periodo = _widget(at.sidebar.date_input, "Período")
+        fim = periodo.value[-1]
+        return periodo.set_value((max(periodo.min, fim - timedelta(days=dias - 1)), fim)).run()
+    return passo
+
+
+@dataclass
+class View:
+    """Uma página num período padrão; ``passos`` ajustam os filtros após a primeira execução"""
+    nome: str
+    titulo: str
+    script: str
+    passos: list[Callable] = field(default_factory=list)
+
+
+VIEWS = [
+    View("diesel_mes_atual", "Diesel — Mês Atual", "dashboard_fixed.py"),
+    View("diesel_mes_anterior", "Diesel — Mês Anterior", "dashboard_fixed.py", [_mes_anterior]),
+    View("producao_acumulado", "Produção — Acumulado", "1_Produção.py"),
+    View("producao_30_dias", "Produção — Últimos 30 dias", "1_Produção.py", [_ultimos_dias(30)]),
+    View("qualidade_mes_atual", "Qualidade — Mês Atual", "2_Qualidade.py"),
+    View("eficiencia_padrao", "Eficiência — Período padrão", "3_Eficiência.py"),
+]
+
+
+def run_view(view, hex_key, timeout=300):
+    """Executa a página sem navegador e devolve o ``AppTest`` já com os filtros da visão"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, view.script), default_timeout=timeout)
+    at.secrets["HEX_KEY_STRING"] = hex_key
+    # Sessão já autenticada (sem privilégios de administrador)
+    at.session_state["authenticated"] = True
+    at.session_state["username"] = "relatorios"
+    at.session_state["is_admin"] = False
+    at.run()
+    for passo in [_sem_progressivo] + view.passos:
+        if at.exception:
+            break
+        at = passo(at)
+    if at.exception:
+        raise RuntimeError("; ".join(e.value for e in at.exception))
+    return at
+
+
+# ========== HTML ==========
+def _markdown(texto, permite_html=False):
+    """Subconjunto de Markdown usado pelas páginas (títulos, negrito, itálico, listas, ``---``)"""
+    if permite_html and texto.lstrip().startswith("<"):
+        return texto  # bloco HTML das próprias páginas (cartões, estilos)
+    if not permite_html:
+        texto = html.escape(texto, quote=False)
+    texto = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", texto)
+    texto = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"<em>\1</em>", texto)
+    partes, lista = [], []
+    for linha in texto.split("\n"):
+        item = re.match(r"\s*[-*•]\s+(.*)", linha)
+        if item and linha.strip() not in ("---", "***"):
+            lista.append(f"<li>{item.group(1)}</li>")
+            continue
+        if lista:
+            partes.append(f"<ul>{''.join(lista)}</ul>")
+            lista = []
+        titulo = re.match(r"(#{1,6})\s+(.*)", linha)
+        if titulo:
+            n = len(titulo.group(1))
+            partes.append(f"<h{n}>{titulo.group(2)}</h{n}>")
+        elif linha.strip() in ("---", "***"):
+            partes.append("<hr>")
+        elif linha.strip():
+            partes.append(f"<p>{linha}</p>")
+    if lista:
+        partes.append(f"<ul>{''.join(lista)}</ul>")
+    return "\n".join(partes)
+
+
+class HtmlBuilder:
+    """Converte a árvore de elementos do ``AppTest`` em HTML; widgets interativos são omitidos"""
+
+    def __init__(self, prefixo, png=False):
+        self.prefixo = prefixo
+        self.png = png
+        self.figuras = []  # (id, figura, PNG ou None) na ordem da página
+
+    def _figura(self, proto):
+        fig = pio.from_json(proto.spec, skip_invalid=True)
+        div_id = f"{self.prefixo}-fig{len(self.figuras) + 1:02d}"
+        imagem = fig.to_image(format="png", scale=2) if self.png else None
+        self.figuras.append((div_id, fig, imagem))
+        if imagem:
+            return f'<img class="grafico" alt="{div_id}" src="data:image/png;base64,{base64.b64encode(imagem).decode("ascii")}">'
+        return pio.to_html(fig, full_html=False, include_plotlyjs=False, div_id=div_id,
+                           config={"displaylogo": False, "responsive": True})
+
+    def _metrica(self, proto):
+        delta = f'<div class="delta {proto.MetricColor.Name(proto.color)}">{html.escape(proto.delta)}</div>' if proto.delta else ""
+        dica = f' title="{html.escape(proto.help)}"' if proto.help else ""
+        return (f'<div class="metrica"{dica}><div class="rotulo">{html.escape(proto.label)}</div>'
+                f'<div class="valor">{html.escape(proto.body)}</div>{delta}</div>')
+
+    def element(self, el):
+        tipo = el.type
+        if tipo in ("title", "header", "subheader"):
+            return f"<{el.proto.tag}>{html.escape(el.value)}</{el.proto.tag}>"
+        if tipo == "markdown":
+            return _markdown(el.value, el.proto.allow_html)
+        if tipo == "caption":
+            return f'<div class="legenda">{_markdown(el.value, el.proto.allow_html)}</div>'
+        if tipo in ("info", "success", "warning", "error"):
+            return f'<div class="alerta {tipo}">{_markdown(el.value)}</div>'
+        if tipo == "metric":
+            return self._metrica(el.proto)
+        if tipo == "dataframe":
+            return el.value.to_html(max_rows=MAX_LINHAS_TABELA, na_rep="", border=0, classes="tabela")
+        if tipo == "plotly_chart":
+            return self._figura(el.proto)
+        if tipo == "expander":
+            return f"<details open><summary>{html.escape(el.label)}</summary>{self.block(el)}</details>"
+        if tipo == "tab":
+            return f'<section class="aba"><h4>{html.escape(el.label)}</h4>{self.block(el)}</section>'
+        if tipo == "column":
+            return f'<div class="coluna" style="flex: {el.weight or 1} 1 0">{self.block(el)}</div>'
+        if tipo == "flex_container" and el.proto.flex_container.direction == BlockProto.FlexContainer.HORIZONTAL:
+            return f'<div class="linha">{self.block(el)}</div>'
+        if hasattr(el, "children"):
+            return self.block(el)
+        return ""
+
+    def block(self, bloco):
+        return "\n".join(filter(None, (self.element(filho) for _, filho in sorted(bloco.children.items()))))
+
+
+def render_html(view, at, versoes, plotlyjs="inline", png=False):
+    """(HTML do relatório, figuras); ``plotlyjs``: 'inline' (autossuficiente) ou 'directory' (arquivo ao lado)"""
+    construtor = HtmlBuilder(view.nome, png=png)
+    corpo = construtor.block(at.main)
+    if png:
+        script = ""
+    elif plotlyjs == "inline":
+        script = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    else:
+        script = f'<script src="{PLOTLY_JS_FILE}"></script>'
+    fontes = ", ".join(f"{html.escape(k)}: {html.escape(str(v))}" for k, v in versoes.items())
+    documento = f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(view.titulo)}</title><style>{CSS}</style>{script}</head>
+<body>
+<header class="relatorio"><h1>{html.escape(view.titulo)}</h1>
+<p>Gerado em {datetime.now():%d/%m/%Y %H:%M} · versões dos dados: {fontes}</p></header>
+{corpo}
+</body></html>
+"""
+    return documento, construtor.figuras
+
+
+def render_index(entradas, gerado_em):
+    itens = "\n".join(
+        f'<li><a href="{e["arquivo"]}">{html.escape(e["titulo"])}</a></li>' if "arquivo" in e
+        else f'<li>{html.escape(e["titulo"])}: <em>{html.escape(e["erro"])}</em></li>'
+        for e in entradas)
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>Relatórios</title><style>{CSS}</style></head>
+<body><header class="relatorio"><h1>Relatórios dos dashboards</h1><p>Gerados em {gerado_em:%d/%m/%Y %H:%M}</p></header>
+<ul>{itens}</ul></body></html>
+"""
+
+
+# ========== GERAÇÃO ==========
+def _gravar(caminho, conteudo):
+    """Escrita atômica: quem serve o diretório nunca vê um arquivo pela metade"""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "wb" if isinstance(conteudo, bytes) else "w", **({} if isinstance(conteudo, bytes) else {"encoding": "utf-8"})) as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def data_versions():
+    versoes = {arquivo: shared_datasets.file_version(arquivo) if os.path.exists(arquivo) else None for arquivo in FONTES}
+    versoes[data_sources.DIESEL_FILE] = diesel_partitions.history_version()  # planilha ou partições mensais
+    return versoes
+
+
+def _indice(saida):
+    try:
+        with open(os.path.join(saida, INDEX_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_all(saida, hex_key, views=VIEWS, plotlyjs="inline", png=False, force=False, timeout=300):
+    """
+    Gera os relatórios das visões em ``saida`` se as versões dos dados ou o dia
+    mudaram desde a última geração (ou com ``force``). Devolve o índice gravado,
+    ou None quando nada precisou ser refeito.
+    """
+    os.makedirs(saida, exist_ok=True)
+    versoes = data_versions()
+    chave = {"versoes": versoes, "dia": date.today().isoformat(), "visoes": [v.nome for v in views], "plotlyjs": plotlyjs, "png": png}
+    anterior = _indice(saida)
+    if not force and anterior.get("chave") == chave:
+        return None
+
+    if plotlyjs == "directory" and not os.path.exists(os.path.join(saida, PLOTLY_JS_FILE)):
+        _gravar(os.path.join(saida, PLOTLY_JS_FILE), get_plotlyjs())
+
+    entradas = []
+    for view in views:
+        inicio = time.perf_counter()
+        try:
+            at = run_view(view, hex_key, timeout)
+            documento, figuras = render_html(view, at, versoes, plotlyjs)
+            _gravar(os.path.join(saida, f"{view.nome}.html"), documento)
+            entrada = {"nome": view.nome, "titulo": view.titulo, "arquivo": f"{view.nome}.html", "figuras": len(figuras)}
+            if png:
+                email, figuras_png = render_html(view, at, versoes, png=True)
+                for div_id, _, imagem in figuras_png:
+                    _gravar(os.path.join(saida, f"{div_id}.png"), imagem)
+                _gravar(os.path.join(saida, f"{view.nome}_email.html"), email)
+                entrada["email"] = f"{view.nome}_email.html"
+        except Exception as e:
+            entrada = {"nome": view.nome, "titulo": view.titulo, "erro": f"{type(e).__name__}: {e}"}
+        entrada["segundos"] = round(time.perf_counter() - inicio, 2)
+        entradas.append(entrada)
+        print(f"  {view.titulo}: {entrada.get('erro') or entrada['arquivo']} ({entrada['segundos']} s)")
+
+    gerado_em = datetime.now()
+    indice = {"chave": chave, "gerado_em": gerado_em.isoformat(), "relatorios": entradas}
+    _gravar(os.path.join(saida, "index.html"), render_index(entradas, gerado_em))
+    _gravar(os.path.join(saida, INDEX_FILE), json.dumps(indice, ensure_ascii=False, indent=1))
+    return indice
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="relatorios", help="diretório de saída")
+    parser.add_argument("--views", nargs="+", choices=[v.nome for v in VIEWS], help="apenas estas visões")
+    parser.add_argument("--plotlyjs", choices=["inline", "directory"], default="inline",
+                        help="plotly.js embutido em cada HTML ou num arquivo único ao lado (para servir estático)")
+    parser.add_argument("--png", action="store_true", help="grava cada gráfico em PNG e a versão para e-mail (requer kaleido)")
+    parser.add_argument("--force", action="store_true", help="gera mesmo sem mudança nas versões dos dados")
+    parser.add_argument("--watch", type=float, help="verifica as versões a cada N segundos e regera quando mudarem")
+    parser.add_argument("--timeout", type=float, default=300, help="timeout de cada execução de página (s)")
+    args = parser.parse_args()
+
+    hex_key = data_sources.read_hex_key()
+    if not hex_key:
+        raise SystemExit("HEX_KEY_STRING ausente (variável de ambiente ou .streamlit/secrets.toml)")
+    if args.png:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            raise SystemExit("--png requer o pacote kaleido (pip install kaleido)")
+    sys.path.insert(0, REPO_DIR)
+    views = [v for v in VIEWS if not args.views or v.nome in args.views]
+
+    while True:
+        indice = render_all(args.out, hex_key, views, args.plotlyjs, args.png, args.force, timeout=args.timeout)
+        print(f"📄 {len(indice['relatorios'])} relatório(s) em {args.out}" if indice else "Sem mudanças nos dados")
+        if not args.watch:
+            break
+        args.force = False
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Profiler sob demanda de uma única execução (rerun) de página.
+
+O administrador marca uma página no painel; a próxima execução dessa página,
+em qualquer sessão, roda sob ``cProfile`` e ``tracemalloc`` e grava o
+resultado: estatísticas por função com o grafo de chamadores (arquivo
+``.pstats``, compatível com ``pstats``/snakeviz) e os principais pontos de
+alocação de memória ainda vivos ao fim da execução (JSON).
+
+Marcações e resultados ficam em arquivos num diretório comum, porque cada
+página pode rodar num processo diferente do painel. A marcação vale uma vez:
+quem consegue removê-la é quem perfila. Apenas uma execução por processo é
+perfilada por vez (``tracemalloc`` é global), e alocações de outras sessões
+no mesmo intervalo também entram na amostra.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import sysconfig
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+PROFILE_DIR = os.environ.get("DIESELDASH_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "dieseldash_profiles"))
+PAGES = {'diesel': 'Diesel', 'produção': 'Produção', 'qualidade': 'Qualidade', 'eficiência': 'Eficiência'}
+MAX_PROFILES = 20
+ARM_TTL = 3600  # segundos até uma marcação não usada expirar
+TRACE_FRAMES = 10
+TOP_ALLOCATIONS = 50
+
+_ativo = threading.Lock()
+_ignorar = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"))
+
+
+def _safe(text):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(text))
+
+
+def _arm_file(page):
+    return os.path.join(PROFILE_DIR, f"{_safe(page)}.armed")
+
+
+# ========== MARCAÇÃO ==========
+def arm(page, requested_by=None):
+    """Marca a próxima execução de ``page`` para ser perfilada"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_arm_file(page), "w", encoding="utf-8") as f:
+        json.dump({'pagina': page, 'solicitado_por': requested_by, 'em': time.time()}, f)
+
+
+def disarm(page):
+    try:
+        os.remove(_arm_file(page))
+    except FileNotFoundError:
+        pass
+
+
+def armed():
+    """{página: marcação} das marcações pendentes"""
+    pendentes = {}
+    for page in PAGES:
+        try:
+            with open(_arm_file(page), encoding="utf-8") as f:
+                pendentes[page] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return pendentes
+
+
+def claim(page):
+    """
+    Consome a marcação de ``page`` e a devolve (no máximo um chamador a
+    recebe; os demais recebem False). Custa um ``stat`` por execução quando
+    nada está marcado.
+    """
+    caminho = _arm_file(page)
+    if not os.path.exists(caminho) or not _ativo.acquire(blocking=False):
+        return False
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            marcacao = json.load(f)
+        os.remove(caminho)
+    except (OSError, ValueError):
+        _ativo.release()
+        return False
+    if time.time() - marcacao.get('em', 0) > ARM_TTL:
+        _ativo.release()
+        return False
+    return marcacao
+
+
+# ========== EXECUÇÃO ==========
+def _allocations(antes, depois):
+    """Pontos de alocação (arquivo:linha) com mais memória viva ganha durante a execução"""
+    diff = depois.filter_traces(_ignorar).compare_to(antes.filter_traces(_ignorar), "lineno")
+    return [{'arquivo': d.traceback[0].filename, 'linha': d.traceback[0].lineno,
+             'kb': d.size_diff / 1024, 'blocos': d.count_diff}
+            for d in sorted(diff, key=lambda d: d.size_diff, reverse=True)[:TOP_ALLOCATIONS] if d.size_diff > 0]
+
+
+def profile(page, fn, marcacao=None):
+    """
+    Executa ``fn`` sob cProfile e tracemalloc e grava o resultado. Deve ser
+    chamado só após ``claim`` devolver a marcação; libera o profiler do processo
+    ao terminar, mesmo em caso de erro. Exceções de ``fn`` (inclusive o
+    ``st.stop``/``st.rerun`` do Streamlit) são registradas e repassadas.
+    """
+    try:
+        return _profile(page, fn, marcacao)
+    finally:
+        _ativo.release()
+
+
+def _profile(page, fn, marcacao):
+    ja_rastreava = tracemalloc.is_tracing()
+    if not ja_rastreava:
+        tracemalloc.start(TRACE_FRAMES)
+    tracemalloc.reset_peak()
+    antes = tracemalloc.take_snapshot()
+    perfil, status = cProfile.Profile(), "ok"
+    inicio, t0 = datetime.now(), time.perf_counter()
+    try:
+        perfil.enable()
+        return fn()
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        perfil.disable()
+        duracao = time.perf_counter() - t0
+        depois = tracemalloc.take_snapshot()
+        pico = tracemalloc.get_traced_memory()[1]
+        if not ja_rastreava:
+            tracemalloc.stop()
+        _save(page, perfil, inicio, duracao, pico, status, _allocations(antes, depois), marcacao or {})
+
+
+def run_script(page, path, namespace, marcacao=None):
+    """Reexecuta o script da página (já em execução em ``namespace``) sob o profiler"""
+    def executar():
+        with open(path, encoding="utf-8") as f:
+            codigo = compile(f.read(), path, "exec")
+        exec(codigo, namespace)
+    return profile(page, executar, marcacao)
+
+
+def _save(page, perfil, inicio, duracao, pico, status, alocacoes, marcacao):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{_safe(page)}-{inicio:%Y%m%d-%H%M%S}-{os.getpid()}"
+    pstats.Stats(perfil).dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.pstats"))
+    meta = {'id': profile_id, 'pagina': page, 'inicio': inicio.isoformat(timespec='seconds'),
+            'duracao_s': duracao, 'pico_mb': pico / 1024 / 1024, 'status': status,
+            'solicitado_por': marcacao.get('solicitado_por'), 'alocacoes': alocacoes}
+    temporario = os.path.join(PROFILE_DIR, f"{profile_id}.json.tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temporario, os.path.join(PROFILE_DIR, f"{profile_id}.json"))
+
+    # Mantém só os perfis mais recentes
+    for antigo in list_profiles()[MAX_PROFILES:]:
+        for ext in (".json", ".pstats"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, antigo['id'] + ext))
+            except FileNotFoundError:
+                pass
+
+
+# ========== CONSULTA ==========
+def _ids():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return [nome[:-5] for nome in os.listdir(PROFILE_DIR) if nome.endswith(".json")]
+
+
+def load_meta(profile_id):
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_profiles():
+    """Perfis gravados, do mais recente ao mais antigo"""
+    metas = []
+    for profile_id in _ids():
+        try:
+            meta = load_meta(profile_id)
+        except (OSError, ValueError):
+            continue
+        metas.append({k: v for k, v in meta.items() if k != 'alocacoes'})
+    return sorted(metas, key=lambda m: m['inicio'], reverse=True)
+
+
+def pstats_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.pstats")
+
+
+def _short(filename):
+    """Caminho curto: relativo ao repositório, à biblioteca padrão ou a partir do pacote instalado"""
+    partes = re.split(r"[\\/](?:site|dist)-packages[\\/]", filename)
+    if len(partes) > 1:
+        return partes[-1]
+    for base in (os.getcwd(), sysconfig.get_paths()["stdlib"]):
+        if filename.startswith(base + os.sep):
+            return os.path.relpath(filename, base)
+    return filename
+
+
+def _label(func):
+    arquivo, linha, nome = func
+    return nome if arquivo == "~" else f"{nome} ({_short(arquivo)}:{linha})"
+
+
+def function_stats(profile_id):
+    """Uma linha por função: chamadas, tempo próprio, acumulado e por chamada (ms)"""
+    stats = pstats.Stats(pstats_path(profile_id)).stats
+    linhas = [{
+        'Função': _label(func), 'Chamadas': nc, 'Chamadas primitivas': cc,
+        'Tempo próprio (ms)': tt * 1000, 'Tempo acumulado (ms)': ct * 1000,
+        'Acumulado por chamada (ms)': ct * 1000 / nc if nc else 0.0,
+    } for func, (cc, nc, tt, ct, _) in stats.items()]
+    return pd.DataFrame(linhas).sort_values('Tempo acumulado (ms)', ascending=False, ignore_index=True)
+
+
+def call_tree(profile_id, funcao):
+    """(chamadores, chamadas) da função com rótulo ``funcao``, com tempos da aresta (ms)"""
+    stats = pstats.Stats(pstats_path(profile_id)).stats
+    rotulos = {_label(f): f for f in stats}
+    alvo = rotulos.get(funcao)
+    colunas = ['Função', 'Chamadas', 'Tempo próprio (ms)', 'Tempo acumulado (ms)']
+    if alvo is None:
+        return pd.DataFrame(columns=colunas), pd.DataFrame(columns=colunas)
+    aresta = lambda func, valores: {'Função': _label(func), 'Chamadas': valores[1],
+                                    'Tempo próprio (ms)': valores[2] * 1000, 'Tempo acumulado (ms)': valores[3] * 1000}
+    chamadores = [aresta(f, v) for f, v in stats[alvo][4].items()]
+    chamadas = [aresta(f, dados[4][alvo]) for f, dados in stats.items() if alvo in dados[4]]
+    ordenar = lambda linhas: pd.DataFrame(linhas, columns=colunas).sort_values('Tempo acumulado (ms)', ascending=False, ignore_index=True)
+    return ordenar(chamadores), ordenar(chamadas)
+
+
+def allocations(profile_id):
+    """Principais pontos de alocação (KB vivos ao fim da execução)"""
+    alocacoes = load_meta(profile_id)['alocacoes']
+    return pd.DataFrame([{'Local': f"{_short(a['arquivo'])}:{a['linha']}", 'KB': a['kb'], 'Blocos': a['blocos']} for a in alocacoes],
+                        columns=['Local', 'KB', 'Blocos'])
@@ -0,0 +1,231 @@
+"""
+Datasets compartilhados entre processos do Streamlit.
+
+Cada conjunto de dados processado (diesel, produção, qualidade) é publicado uma
+única vez em um arquivo Arrow IPC em tmpfs (/dev/shm quando disponível). Todos os
+processos do servidor anexam o mesmo arquivo via memory-map, sem cópia, de modo
+que a memória cresce com o número de datasets e não com processos × datasets.
+Colunas de texto (Tag, Setor) também voltam sem cópia porque o ``str`` padrão do
+pandas 3 é apoiado em Arrow; no pandas 2 viram arrays de objetos Python por
+processo, por isso o requirements exige ``pandas>=3``.
+
+Protocolo de versões:
+- ``manifest.json`` lista, para cada dataset, a versão ativa e o arquivo dela;
+- leitores consultam o manifesto sob o lock compartilhado do dataset;
+- quem publica segura o lock exclusivo do dataset, grava ``<nome>-<versão>.arrow`` em um
+  arquivo temporário, renomeia atomicamente e só então troca a versão no
+  manifesto. Arquivos de versões antigas são removidos após a troca; processos
+  que ainda os tenham mapeados continuam lendo normalmente (semântica POSIX).
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, publicação fica restrita ao processo
+    fcntl = None
+
+STORE_DIR = os.environ.get(
+    "DIESELDASH_SHARED_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "dieseldash"),
+)
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+# Datasets já anexados neste processo: {(nome, versão): DataFrame}
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def file_version(path):
+    """Versão de um arquivo de origem derivada de tamanho e mtime (sem ler o conteúdo)"""
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _safe(text):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(text))
+
+
+@contextmanager
+def _locked(name=None, exclusive=False):
+    """
+    Lock de arquivo entre processos: por dataset (``.<nome>.lock``) para anexar
+    ou publicar, e global (``.lock``) para regravar o manifesto.
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    lock_name = f".{_safe(name)}.lock" if name else LOCK_FILE
+    with open(os.path.join(STORE_DIR, lock_name), "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_manifest():
+    """Lê o manifesto de versões (vazio se ainda não existir)"""
+    try:
+        with open(os.path.join(STORE_DIR, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"datasets": {}}
+
+
+def _write_manifest(manifest):
+    path = os.path.join(STORE_DIR, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def to_table(df):
+    """
+    Converte o DataFrame para Arrow mantendo colunas float sem máscara de nulos
+    (NaN como valor), o que permite a volta para pandas sem cópia.
+    """
+    arrays, names = [], []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_float_dtype(series.dtype):
+            array = pa.array(series.to_numpy(dtype=np.float64), from_pandas=False)
+        else:
+            try:
+                array = pa.array(series, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Colunas object com tipos misturados (ex.: Tag numérica e texto)
+                array = pa.array(series.astype("string"), from_pandas=True)
+        arrays.append(array)
+        names.append(str(col))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _attach(file_name):
+    source = pa.memory_map(os.path.join(STORE_DIR, file_name), "r")
+    table = ipc.open_file(source).read_all()
+    # Números viram arrays numpy sobre o mapeamento e texto fica em ``str`` (Arrow)
+    return table.to_pandas(split_blocks=True)
+
+
+def _publish(name, version, df):
+    file_name = f"{_safe(name)}-{_safe(version)}.arrow"
+    path = os.path.join(STORE_DIR, file_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = to_table(df)
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    with _locked(exclusive=True):
+        manifest = read_manifest()
+        previous = manifest["datasets"].get(name)
+        manifest["datasets"][name] = {
+            "version": str(version),
+            "file": file_name,
+            "rows": len(df),
+            "bytes": os.path.getsize(path),
+            "published_at": datetime.now().isoformat(),
+        }
+        _write_manifest(manifest)
+
+    if previous and previous.get("file") != file_name:
+        try:
+            os.remove(os.path.join(STORE_DIR, previous["file"]))
+        except FileNotFoundError:
+            pass
+    return file_name
+
+
+def publish(name, version, df):
+    """Publica uma nova versão do dataset e a torna ativa no manifesto"""
+    with _locked(name, exclusive=True):
+        return _publish(name, str(version), df)
+
+
+def _active_file(name, version):
+    entry = read_manifest()["datasets"].get(name)
+    return entry["file"] if entry and entry["version"] == version else None
+
+
+def load_or_publish(name, version, builder):
+    """
+    Retorna o dataset ``name`` na versão ``version``, anexando o arquivo
+    compartilhado. Se a versão ainda não foi publicada, apenas um processo
+    executa ``builder()`` (sob o lock exclusivo do dataset) e publica o
+    resultado; os demais aguardam e anexam a versão publicada.
+    ``builder`` deve retornar um DataFrame ou None em caso de falha.
+    """
+    version = str(version)
+    with _attached_lock:
+        if (name, version) in _attached:
+            return _attached[(name, version)]
+
+    with _locked(name, exclusive=False):
+        file_name = _active_file(name, version)
+        df = _attach(file_name) if file_name else None
+
+    if df is None:
+        with _locked(name, exclusive=True):
+            # Outro processo pode ter publicado enquanto esperávamos o lock
+            file_name = _active_file(name, version)
+            if not file_name:
+                built = builder()
+                if built is None:
+                    return None
+                file_name = _publish(name, version, built)
+            df = _attach(file_name)
+
+    with _attached_lock:
+        # Mantém apenas a versão mais recente de cada dataset neste processo
+        for key in [k for k in _attached if k[0] == name]:
+            del _attached[key]
+        _attached[(name, version)] = df
+    return df
+
+
+def discard(name):
+    """Remove o dataset ``name`` do manifesto e apaga o arquivo (processos que o mapearam seguem lendo)"""
+    with _locked(name, exclusive=True):
+        with _locked(exclusive=True):
+            manifest = read_manifest()
+            entry = manifest["datasets"].pop(name, None)
+            if entry:
+                _write_manifest(manifest)
+        if entry:
+            try:
+                os.remove(os.path.join(STORE_DIR, entry["file"]))
+            except FileNotFoundError:
+                pass
+    # Sem o lock do dataset, no pior caso uma publicação concorrente repete o processamento
+    try:
+        os.remove(os.path.join(STORE_DIR, f".{_safe(name)}.lock"))
+    except FileNotFoundError:
+        pass
+    with _attached_lock:
+        for key in [k for k in _attached if k[0] == name]:
+            del _attached[key]
+
+
+def detach_stale(match=""):
+    """Solta os datasets anexados neste processo (com ``match`` no nome) que saíram do manifesto"""
+    datasets = read_manifest()["datasets"]
+    with _attached_lock:
+        for name, version in [k for k in _attached if match in k[0]]:
+            entry = datasets.get(name)
+            if not entry or entry["version"] != version:
+                del _attached[(name, version)]
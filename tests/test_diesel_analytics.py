@@ -0,0 +1,81 @@
+"""Decomposição de custo comparada com somas diretas em pandas."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import diesel_analytics
+import equipment_matrix
+
+BASE = ("2025-01-01", "2025-01-31")
+ATUAL = ("2025-02-01", "2025-02-28")
+
+
+def abastecimentos(seed=0, tags=12):
+    rng = np.random.default_rng(seed)
+    linhas = []
+    for dia in pd.date_range("2025-01-01", "2025-02-28"):
+        for t in range(tags):
+            if rng.random() < 0.6:
+                linhas.append({
+                    'DataConsumo': dia, 'Tag': f"T{t:02d}",
+                    'Setor': 'Expedição' if t % 3 else 'Peneiramento',
+                    'ConsumoDiesel': rng.gamma(4, 25),
+                    'CustoUnitario': 5.5 + 0.02 * (dia.day % 7) + 0.1 * (t % 4),
+                })
+    df = pd.DataFrame(linhas)
+    # Equipamento só no período atual e outro só no período base
+    df = df[~((df['Tag'] == 'T01') & (df['DataConsumo'] < ATUAL[0]))]
+    df = df[~((df['Tag'] == 'T02') & (df['DataConsumo'] >= ATUAL[0]))]
+    df['CustoTotalAbastecimento'] = df['ConsumoDiesel'] * df['CustoUnitario']
+    return df.reset_index(drop=True)
+
+
+def custo_por_tag(df, inicio, fim):
+    recorte = df[(df['DataConsumo'] >= inicio) & (df['DataConsumo'] <= fim)]
+    return recorte.assign(custo=recorte['ConsumoDiesel'] * recorte['CustoUnitario']).groupby(['Setor', 'Tag'])[['ConsumoDiesel', 'custo']].sum()
+
+
+def test_efeitos_somam_a_variacao_de_cada_equipamento():
+    df = abastecimentos()
+    por_setor, por_tag = diesel_analytics.cost_variance(equipment_matrix.TagDayMatrix(df), BASE, ATUAL)
+    efeitos = por_tag[['volume', 'preco', 'mix']].sum(axis=1)
+    np.testing.assert_allclose(efeitos, por_tag['variacao'], rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(por_setor[['volume', 'preco', 'mix']].sum(axis=1), por_setor['variacao'], rtol=1e-9, atol=1e-6)
+
+
+def test_totais_conferem_com_groupby():
+    df = abastecimentos(seed=1)
+    por_setor, por_tag = diesel_analytics.cost_variance(equipment_matrix.TagDayMatrix(df), BASE, ATUAL)
+    base, atual = custo_por_tag(df, *BASE), custo_por_tag(df, *ATUAL)
+    esperado = base.join(atual, how='outer', lsuffix='_base', rsuffix='_atual').fillna(0)
+    obtido = por_tag.set_index(['Setor', 'Tag']).loc[esperado.index]
+    np.testing.assert_allclose(obtido['litros_base'], esperado['ConsumoDiesel_base'])
+    np.testing.assert_allclose(obtido['custo_base'], esperado['custo_base'])
+    np.testing.assert_allclose(obtido['custo_atual'], esperado['custo_atual'])
+    total = por_setor.loc['Total']
+    assert total['variacao'] == pytest.approx(esperado['custo_atual'].sum() - esperado['custo_base'].sum())
+
+
+def test_setor_sem_base_vira_efeito_volume():
+    df = abastecimentos(seed=2)
+    df = df[~((df['Setor'] == 'Peneiramento') & (df['DataConsumo'] < ATUAL[0]))]
+    por_setor, _ = diesel_analytics.cost_variance(equipment_matrix.TagDayMatrix(df), BASE, ATUAL)
+    linha = por_setor.loc['Peneiramento']
+    assert linha['volume'] == pytest.approx(linha['custo_atual'])
+    assert linha['preco'] == 0 and linha['mix'] == 0
+
+
+def test_projecao_do_mes_usa_so_o_realizado_do_mes():
+    df = abastecimentos(seed=3)
+    hoje = pd.Timestamp("2025-02-17")
+    motor = diesel_analytics.ProjectionEngine(df[df['DataConsumo'] <= hoje])
+    historico, _ = diesel_analytics.daily_consumption(df)
+    mes, _ = diesel_analytics.daily_consumption(df, *diesel_analytics.current_month(hoje))
+    kpis = diesel_analytics.calculate_kpis(historico, "month", motor, today=hoje)
+    assert kpis == diesel_analytics.calculate_kpis(mes, "month", motor, today=hoje)
+
+    realizado = df[(df['DataConsumo'] >= "2025-02-01") & (df['DataConsumo'] <= hoje)]
+    assert kpis['total_consumed_period'] == pytest.approx(realizado['ConsumoDiesel'].sum())
+    restante = motor.project(hoje)['consumo']['esperado']
+    assert kpis['projected_consumption'] == pytest.approx(realizado['ConsumoDiesel'].sum() + restante)
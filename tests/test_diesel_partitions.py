@@ -0,0 +1,65 @@
+"""Partições mensais: ida e volta pelo disco e regravação de um mês alterado."""
+
+import base64
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from cryptography.fernet import Fernet
+from pandas.testing import assert_frame_equal
+
+import diesel_partitions
+
+
+@pytest.fixture
+def fernet():
+    return Fernet(base64.urlsafe_b64encode(os.urandom(32)))
+
+
+def abastecimentos(seed=0):
+    rng = np.random.default_rng(seed)
+    n = 600
+    datas = pd.Series(pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D"))
+    datas[rng.random(n) < 0.02] = pd.NaT
+    litros = rng.gamma(4, 60, n)
+    preco = 5.9 + rng.normal(0, 0.15, n)
+    return pd.DataFrame({
+        'DataConsumo': datas, 'ConsumoDiesel': litros, 'CustoUnitario': preco,
+        'CustoTotalAbastecimento': litros * preco, 'Setor': rng.choice(['Expedição', 'Peneiramento'], n),
+        'Tag': [f"EQ-{i:03d}" for i in rng.integers(1, 40, n)],
+    })
+
+
+def gravar(df, fernet, tmp_path, conteudo=b"planilha"):
+    origem = tmp_path / "Diesel-area.encrypted"
+    origem.write_bytes(conteudo)
+    return diesel_partitions._write_partitions(df, str(origem), fernet, str(tmp_path / "particoes"))
+
+
+def test_ida_e_volta(fernet, tmp_path):
+    df = abastecimentos()
+    manifest = gravar(df, fernet, tmp_path)
+    diretorio = str(tmp_path / "particoes")
+    assert_frame_equal(diesel_partitions.load_range(fernet, manifest=manifest, directory=diretorio), df)
+
+    inicio, fim = pd.Timestamp("2025-02-10"), pd.Timestamp("2025-03-20")
+    periodo = diesel_partitions.load_range(fernet, inicio, fim, manifest=manifest, directory=diretorio)
+    esperado = df[(df['DataConsumo'] >= inicio) & (df['DataConsumo'] <= fim)]
+    assert_frame_equal(periodo.reset_index(drop=True), esperado.reset_index(drop=True))
+
+
+def test_mes_alterado_vira_arquivo_novo(fernet, tmp_path):
+    df = abastecimentos(seed=1)
+    anterior = gravar(df, fernet, tmp_path)
+    diretorio = str(tmp_path / "particoes")
+
+    alterado = df.copy()
+    alterado.loc[alterado['DataConsumo'] >= "2025-04-01", 'ConsumoDiesel'] += 1
+    atual = gravar(alterado, fernet, tmp_path, conteudo=b"planilha nova")
+
+    arquivos = lambda m: {p['mes']: p['arquivo'] for p in m['particoes']}
+    antes, depois = arquivos(anterior), arquivos(atual)
+    assert {mes for mes in antes if antes[mes] != depois[mes]} == {"2025-04"}
+    assert sorted(os.listdir(diretorio)) == sorted([*depois.values(), diesel_partitions.MANIFEST_FILE])
+    assert_frame_equal(diesel_partitions.load_range(fernet, manifest=atual, directory=diretorio), alterado)
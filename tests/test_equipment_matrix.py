@@ -0,0 +1,67 @@
+"""Matriz Tag × dia e z-scores robustos comparados com groupby e com um laço direto."""
+
+import numpy as np
+import pandas as pd
+
+import equipment_matrix as em
+
+
+def abastecimentos(seed=0, tags=8, dias=90):
+    rng = np.random.default_rng(seed)
+    linhas = [(dia, f"T{t}", 'Expedição' if t % 2 else 'Peneiramento', rng.gamma(5, 20))
+              for dia in pd.date_range("2025-01-01", periods=dias) for t in range(tags) if rng.random() < 0.6]
+    df = pd.DataFrame(linhas, columns=['DataConsumo', 'Tag', 'Setor', 'ConsumoDiesel'])
+    df.loc[df.sample(frac=0.02, random_state=seed).index, 'ConsumoDiesel'] *= 8  # picos
+    df['CustoUnitario'] = 6.0
+    df['CustoTotalAbastecimento'] = df['ConsumoDiesel'] * 6.0
+    return df
+
+
+def z_direto(df, janela=em.JANELA_ANOMALIA, minimo=em.HISTORICO_MINIMO):
+    """Laço por equipamento: mediana/MAD dos ``janela`` abastecimentos diários anteriores"""
+    diario = df.groupby(['Setor', 'Tag', df['DataConsumo'].dt.normalize()])['ConsumoDiesel'].sum()
+    resultado = {}
+    for (setor, tag), serie in diario.groupby(level=[0, 1]):
+        valores = serie.to_numpy()
+        for i, data in enumerate(serie.index.get_level_values(2)):
+            hist = valores[max(0, i - janela):i]
+            if len(hist) < minimo:
+                resultado[(setor, tag, data)] = np.nan
+                continue
+            mediana = np.median(hist)
+            mad = max(np.median(np.abs(hist - mediana)), 0.01 * abs(mediana))
+            resultado[(setor, tag, data)] = 0.6745 * (valores[i] - mediana) / mad
+    return pd.Series(resultado)
+
+
+def test_totais_conferem_com_groupby():
+    df = abastecimentos()
+    matriz = em.TagDayMatrix(df)
+    recorte = df[(df['DataConsumo'] >= "2025-02-01") & (df['DataConsumo'] <= "2025-02-20")]
+    esperado = recorte.groupby(['Setor', 'Tag'])['ConsumoDiesel'].sum()
+    obtido = matriz.totals("2025-02-01", "2025-02-20").set_index(['Setor', 'Tag'])['ConsumoDiesel']
+    np.testing.assert_allclose(obtido.loc[esperado.index], esperado, rtol=1e-9)
+
+
+def test_z_robusto_igual_ao_laco():
+    df = abastecimentos(seed=1)
+    pontos = em.AnomalyDetector(em.TagDayMatrix(df)).pontos.set_index(['Setor', 'Tag', 'Data'])['z']
+    esperado = z_direto(df)
+    np.testing.assert_allclose(pontos.loc[esperado.index].to_numpy(), esperado.to_numpy(), rtol=1e-9, equal_nan=True)
+    assert pontos.abs().gt(em.LIMIAR_Z).any()
+
+
+def test_detector_incremental_igual_ao_completo():
+    df = abastecimentos(seed=2)
+    em._detectors.clear()
+    anterior = em.anomaly_detector("teste", em.TagDayMatrix(df[df['DataConsumo'] < "2025-03-20"]))
+    matriz = em.TagDayMatrix(df)
+    assert anterior.extends(matriz)
+    incremental = em.anomaly_detector("teste", matriz)
+    completo = em.AnomalyDetector(matriz)
+    chave = ['Setor', 'Tag', 'Data']
+    pd.testing.assert_frame_equal(incremental.pontos.sort_values(chave).reset_index(drop=True),
+                                  completo.pontos.sort_values(chave).reset_index(drop=True))
+    alterado = df.copy()
+    alterado.loc[0, 'ConsumoDiesel'] += 1
+    assert not incremental.extends(em.TagDayMatrix(alterado))
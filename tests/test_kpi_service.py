@@ -0,0 +1,107 @@
+"""Serviço de KPIs: mesmos números do dashboard e respostas 304/400/404."""
+
+import http.client
+import json
+import threading
+import uuid
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import diesel_analytics
+import kpi_service
+
+
+def abastecimentos(seed=0, dias=120):
+    rng = np.random.default_rng(seed)
+    linhas = []
+    for dia in pd.date_range(date.today() - timedelta(days=dias), date.today()):
+        for _ in range(int(rng.integers(5, 15))):
+            litros, preco = rng.gamma(4, 60), 5.9 + rng.normal(0, 0.15)
+            linhas.append({'DataConsumo': dia, 'Tag': f"EQ-{int(rng.integers(1, 41)):03d}",
+                           'Setor': rng.choice(diesel_analytics.SETORES), 'ConsumoDiesel': litros,
+                           'CustoUnitario': preco, 'CustoTotalAbastecimento': litros * preco})
+    return pd.DataFrame(linhas)
+
+
+class ServicoSintetico(kpi_service.KPIService):
+    """Serviço com o dataset de diesel em memória e versão única (o cache é global)"""
+
+    def __init__(self, df):
+        super().__init__(fernet=None)
+        self.df, self.versao = df, f"teste-{uuid.uuid4().hex}"
+
+    def versions(self):
+        return {fonte: self.versao for fonte in kpi_service.FONTES}
+
+    def dataset(self, fonte, versao):
+        return self.df
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    handler = type("Handler", (kpi_service.KPIHandler,), {'service': ServicoSintetico(abastecimentos())})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(endereco, caminho, headers=None):
+    conexao = http.client.HTTPConnection(*endereco, timeout=10)
+    conexao.request("GET", caminho, headers=headers or {})
+    resposta = conexao.getresponse()
+    corpo = resposta.read()
+    conexao.close()
+    return resposta, corpo
+
+
+def test_mes_atual_igual_ao_dashboard():
+    df = abastecimentos(seed=1)
+    servico = ServicoSintetico(df)
+    obtido = servico.diesel(servico.versao)['kpis']
+
+    # Mesmo caminho do dashboard_main em "Mês Atual"
+    inicio, fim = diesel_analytics.current_month()
+    diario, _ = diesel_analytics.daily_consumption(df, inicio, fim)
+    esperado = diesel_analytics.calculate_kpis(diario, "month", diesel_analytics.ProjectionEngine(df))
+    assert obtido.keys() == esperado.keys()
+    for chave, valor in esperado.items():
+        assert obtido[chave] == (pytest.approx(valor) if isinstance(valor, float) else valor), chave
+
+    mes = df[df['DataConsumo'] >= pd.Timestamp(inicio)]
+    assert obtido['total_consumed_period'] == pytest.approx(mes['ConsumoDiesel'].sum())
+    assert obtido['projected_consumption'] >= obtido['total_consumed_period']
+
+
+def test_if_none_match_recebe_304(servidor):
+    resposta, corpo = get(servidor, "/kpis/diesel")
+    assert resposta.status == 200 and json.loads(corpo)['periodo']['tipo'] == "mês atual"
+    etag = resposta.getheader("ETag")
+
+    resposta, corpo = get(servidor, "/kpis/diesel", {"If-None-Match": etag})
+    assert resposta.status == 304 and corpo == b""
+    resposta, _ = get(servidor, "/kpis/diesel", {"If-None-Match": '"outro"'})
+    assert resposta.status == 200 and resposta.getheader("ETag") == etag
+
+
+@pytest.mark.parametrize("consulta", ["inicio=2025-01-01", "inicio=2025-13-01&fim=2025-12-31",
+                                      "inicio=01/01/2025&fim=2025-01-31", "inicio=2025-02-01&fim=2025-01-01"])
+def test_periodo_invalido_recebe_400(servidor, consulta):
+    resposta, corpo = get(servidor, f"/kpis/diesel?{consulta}")
+    assert resposta.status == 400 and 'erro' in json.loads(corpo)
+
+
+def test_periodo_personalizado(servidor):
+    resposta, corpo = get(servidor, "/kpis/diesel?inicio=2025-01-01&fim=2025-01-31")
+    assert resposta.status == 200
+    assert json.loads(corpo)['periodo'] == {'tipo': "personalizado", 'inicio': "2025-01-01", 'fim': "2025-01-31"}
+
+
+def test_rota_desconhecida_recebe_404(servidor):
+    resposta, corpo = get(servidor, "/kpis/estoque")
+    assert resposta.status == 404 and json.loads(corpo)['erro'].endswith("/kpis/estoque")
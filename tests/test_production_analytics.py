@@ -0,0 +1,86 @@
+"""Motores de produção comparados com pandas ``rolling`` e com a simulação direta."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import production_analytics as pa
+
+
+def producao(seed=0, dias=120):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'data': pd.date_range("2025-08-01", periods=dias)})
+    parado = rng.random(dias) < 0.2
+    for col in pa.PRODUTOS:
+        df[col] = np.where(parado, 0.0, rng.uniform(200, 1800, dias))
+    df['total_dia'] = df[pa.PRODUTOS].sum(axis=1)
+    return df
+
+
+def rolling_direto(df, coluna, janela, stat, base):
+    diario = pa.add_totals(df).set_index('data')
+    if base == 'produtivo':
+        diario = diario[diario['total_dia'] > 0]
+    janela_movel = diario[coluna].rolling(janela, min_periods=1)
+    return janela_movel.sum() if stat == 'soma' else janela_movel.mean()
+
+
+@pytest.mark.parametrize("base", pa.BASES)
+@pytest.mark.parametrize("janela", pa.JANELAS)
+def test_series_conferem_com_rolling(base, janela):
+    df = producao()
+    motor = pa.RollingEngine(df)
+    for coluna in ['pm01_lump', 'total_pm04', 'total_sinter', 'total_dia']:
+        for stat in ('soma', 'media'):
+            esperado = rolling_direto(df, coluna, janela, stat, base)
+            obtido = motor.series(coluna, janela, stat, base)
+            np.testing.assert_allclose(obtido.to_numpy(), esperado.to_numpy(), rtol=1e-9)
+            assert (obtido.index == esperado.index).all()
+
+
+def test_recorte_nao_trunca_a_janela():
+    df = producao(seed=1)
+    serie = pa.RollingEngine(df).series('total_dia', 7, inicio="2025-09-15", fim="2025-09-30")
+    esperado = rolling_direto(df, 'total_dia', 7, 'media', 'calendario').loc["2025-09-15":"2025-09-30"]
+    np.testing.assert_allclose(serie.to_numpy(), esperado.to_numpy(), rtol=1e-9)
+
+
+def test_motor_estendido_igual_ao_reconstruido():
+    df = producao(seed=2)
+    anterior = pa.RollingEngine(df.iloc[:100])
+    assert anterior.extends(df)
+    estendido, completo = anterior.appended(df), pa.RollingEngine(df)
+    for base in pa.BASES:
+        for janela in pa.JANELAS:
+            np.testing.assert_allclose(estendido.bases[base].media[janela], completo.bases[base].media[janela], rtol=1e-9)
+            np.testing.assert_allclose(estendido.bases[base].soma[janela], completo.bases[base].soma[janela], rtol=1e-9)
+    alterado = df.copy()
+    alterado.loc[10, 'pm01_lump'] += 1
+    assert not anterior.extends(alterado)
+
+
+def esgotamento_direto(consumos, estoque, cenarios, horizonte, percentis, seed):
+    """Mesmos cenários do modelo, com o dia de esgotamento de cada trajetória e percentis 'lower'"""
+    rng = np.random.default_rng(seed)
+    trajetorias = np.cumsum(consumos[rng.integers(0, consumos.size, size=(cenarios, horizonte))], axis=1)
+    esgotou = trajetorias >= estoque
+    dia = np.where(esgotou.any(axis=1), esgotou.argmax(axis=1) + 1, np.inf)
+    dias = {p: np.percentile(dia, p, method='lower') for p in percentis}
+    return {p: d if np.isfinite(d) else np.nan for p, d in dias.items()}, esgotou[:, -1].mean()
+
+
+@pytest.mark.parametrize("estoque", [1.0, 5_000.0, 60_000.0, 250_000.0, 10_000_000.0])
+def test_previsao_igual_a_simulacao_direta(estoque):
+    rng = np.random.default_rng(3)
+    consumos = np.where(rng.random(90) < 0.25, 0.0, rng.uniform(1000, 6000, 90))
+    modelo = pa.DepletionModel(consumos, cenarios=400, horizonte=200, percentis=(10, 50, 90), seed=7)
+    previsao = modelo.forecast(estoque)
+    dias, fracao = esgotamento_direto(consumos, estoque, 400, 200, (10, 50, 90), 7)
+    for p in (10, 50, 90):
+        np.testing.assert_equal(previsao['dias'][p], dias[p])
+    assert previsao['fracao_esgota'] == pytest.approx(fracao)
+
+
+def test_previsao_sem_consumo_ou_sem_estoque():
+    assert np.isnan(pa.DepletionModel(np.zeros(30)).forecast(1000)['dias'][50])
+    assert pa.DepletionModel(np.ones(30)).forecast(0)['dias'][50] == 0.0
@@ -0,0 +1,68 @@
+"""Médias ponderadas por tonelagem comparadas com o cálculo direto por linhas."""
+
+import numpy as np
+import pandas as pd
+
+import quality_analytics
+
+
+def relatorio(seed=0, dias=60):
+    rng = np.random.default_rng(seed)
+    linhas = []
+    for dia in pd.date_range("2025-03-01", periods=dias):
+        for peneira in ('PMT 01', 'PMT 02'):
+            linha = {'Data': dia, 'Peneira': peneira, 'Ton': rng.choice([0.0, rng.uniform(500, 3000)], p=[0.1, 0.9])}
+            for ind in quality_analytics.INDICADORES:
+                valor = rng.normal(60 if ind == 'Fe' else 5, 2)
+                linha[ind] = rng.choice([valor, np.nan, 0.0], p=[0.85, 0.1, 0.05])
+            linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+def ponderado(df, ind):
+    """Média e desvio (populacional) ponderados, ignorando nulos, zeros e dias sem tonelagem"""
+    x = df[ind]
+    w = df['Ton'].where((df['Ton'] > 0) & x.notna() & (x != 0), 0.0)
+    if w.sum() == 0:
+        return np.nan, np.nan, 0.0
+    media = (w * x.fillna(0)).sum() / w.sum()
+    var = (w * (x.fillna(0) - media) ** 2).sum() / w.sum()
+    return media, np.sqrt(var), w.sum()
+
+
+def test_janelas_conferem_com_calculo_direto():
+    df = relatorio()
+    motor = quality_analytics.WeightedAggregator(df)
+    for inicio, fim in [(None, None), ("2025-03-10", "2025-03-24"), ("2025-04-01", "2025-04-01"), ("2025-06-01", "2025-06-30")]:
+        janela = motor.window(inicio, fim)
+        recorte = df[(df['Data'] >= (inicio or df['Data'].min())) & (df['Data'] <= (fim or df['Data'].max()))]
+        for grupo in motor.grupos:
+            linhas = recorte if grupo == motor.BLEND else recorte[recorte['Peneira'] == grupo]
+            for ind in quality_analytics.INDICADORES:
+                media, desvio, peso = ponderado(linhas, ind)
+                np.testing.assert_allclose(janela['peso'].at[ind, grupo], peso)
+                np.testing.assert_allclose(janela['media'].at[ind, grupo], media, rtol=1e-9, equal_nan=True)
+                # Variância por E[x²] − média²: perto de zero o cancelamento deixa ~1e-6 no desvio (após a raiz)
+                np.testing.assert_allclose(janela['desvio'].at[ind, grupo], desvio, rtol=1e-6, atol=1e-4, equal_nan=True)
+
+
+def test_sem_tonelagem_cada_dia_pesa_um():
+    df = relatorio(seed=1).drop(columns='Ton')
+    medias = quality_analytics.WeightedAggregator(df).means()
+    for ind in quality_analytics.INDICADORES:
+        valores = df.loc[df['Peneira'] == 'PMT 01', ind]
+        assert np.isclose(medias.at[ind, 'PMT 01'], valores[valores.notna() & (valores != 0)].mean())
+
+
+def test_spearman_confere_com_pandas_par_a_par():
+    rng = np.random.default_rng(4)
+    df = relatorio(seed=4, dias=120)
+    # Extras esparsos, como P/Mn/LOI na planilha
+    for col, presenca in (('P', 0.3), ('Mn', 0.6), ('LOI', 0.9)):
+        df[col] = np.where(rng.random(len(df)) < presenca, df['Fe'] * 0.01 + rng.normal(0, 0.05, len(df)), np.nan)
+    resultado = quality_analytics.correlation_analysis(df)
+    cols = resultado['colunas']
+    valores = df[cols].replace(0, np.nan)
+    for nome, linhas in [('PMT 01', valores[df['Peneira'] == 'PMT 01']), ('Ambas', valores)]:
+        esperado = linhas.corr(method='spearman')
+        np.testing.assert_allclose(resultado['spearman'][nome].to_numpy(), esperado.to_numpy(), rtol=1e-9, atol=1e-12)
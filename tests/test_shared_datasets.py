@@ -0,0 +1,33 @@
+"""Datasets compartilhados: anexar não copia colunas numéricas nem de texto."""
+
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import shared_datasets
+
+
+def test_anexar_nao_copia(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_datasets, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(shared_datasets, "_attached", {})
+    rng = np.random.default_rng(0)
+    n = 200_000
+    df = pd.DataFrame({
+        'DataConsumo': pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        'ConsumoDiesel': rng.gamma(4, 60, n),
+        'Setor': rng.choice(['Expedição', 'Peneiramento'], n),
+        'Tag': [f"EQ-{i:03d}" for i in rng.integers(1, 400, n)],
+    })
+    shared_datasets.publish("teste", "v1", df)
+
+    tracemalloc.start()
+    anexado = shared_datasets.load_or_publish("teste", "v1", lambda: None)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert isinstance(anexado['Tag'].array, pd.arrays.ArrowStringArray)
+    assert isinstance(anexado['Setor'].array, pd.arrays.ArrowStringArray)
+    assert pico < 1024 * 1024  # objetos Python por linha passariam de 10 MB
+    assert_frame_equal(anexado, df)
@@ -0,0 +1,150 @@
+"""
+Ingestão dos uploads de planilha (fallback do ``st.file_uploader``).
+
+O upload é copiado em blocos para um arquivo em disco enquanto o digest
+BLAKE2b é calculado, sem montar cópias extras dos bytes na memória. O digest
+identifica o conteúdo: uploads idênticos, de qualquer sessão ou processo,
+caem no mesmo arquivo e no mesmo dataset compartilhado
+(``shared_datasets``), então cada arquivo distinto é descriptografado e
+processado uma única vez. Nos reruns, o ``file_id`` do upload já conhecido
+evita até a releitura.
+
+Os uploads ficam retidos por ``RETENCAO_SEGUNDOS`` desde o último uso e no
+máximo ``MAX_UPLOADS`` por vez; os excedentes saem do disco e do manifesto
+dos datasets compartilhados.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+from cryptography.fernet import InvalidToken
+
+import shared_datasets
+
+UPLOAD_DIR = os.environ.get("DIESELDASH_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "dieseldash_uploads"))
+BLOCO_BYTES = 1024 * 1024
+RETENCAO_SEGUNDOS = 24 * 3600
+MAX_UPLOADS = 10
+SUFIXO = ".upload"
+
+# file_id do upload (por processo) -> caminho do arquivo já gravado
+_conhecidos = {}
+_lock = threading.Lock()
+
+
+def _caminho(kind, digest):
+    return os.path.join(UPLOAD_DIR, f"{kind}-{digest}{SUFIXO}")
+
+
+def dataset_name(kind, digest):
+    """Nome do dataset compartilhado de um upload (``-upload-`` identifica os uploads no manifesto)"""
+    return f"{kind}-upload-{digest}"
+
+
+def spool(kind, fileobj, file_id=None):
+    """
+    Grava o upload em ``UPLOAD_DIR`` lendo em blocos e devolve ``(digest, caminho)``.
+    Conteúdos iguais resultam no mesmo arquivo (o temporário é descartado).
+    """
+    with _lock:
+        caminho = _conhecidos.get((kind, file_id)) if file_id else None
+    if caminho and os.path.exists(caminho):
+        os.utime(caminho)  # marca o uso para a retenção
+        return os.path.basename(caminho)[len(kind) + 1:-len(SUFIXO)], caminho
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    hasher = hashlib.blake2b(digest_size=16)
+    fileobj.seek(0)
+    fd, temporario = tempfile.mkstemp(prefix=f"{kind}-", suffix=".tmp", dir=UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            while bloco := fileobj.read(BLOCO_BYTES):
+                hasher.update(bloco)
+                destino.write(bloco)
+        digest = hasher.hexdigest()
+        caminho = _caminho(kind, digest)
+        if os.path.exists(caminho):
+            os.remove(temporario)
+            os.utime(caminho)
+        else:
+            os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    finally:
+        fileobj.seek(0)
+
+    if file_id:
+        with _lock:
+            _conhecidos[(kind, file_id)] = caminho
+    return digest, caminho
+
+
+def read_upload(path, fernet):
+    """
+    Conteúdo da planilha enviada: ``(bytes, True)`` se era um token Fernet,
+    ``(bytes, False)`` se já era um XLSX sem criptografia, ``(None, False)`` se
+    não é nenhum dos dois.
+    """
+    with open(path, "rb") as f:
+        dados = f.read()
+    try:
+        return fernet.decrypt(dados), True
+    except InvalidToken:
+        pass
+    return (dados, False) if zipfile.is_zipfile(path) else (None, False)
+
+
+def ingest(kind, fileobj, builder, file_id=None):
+    """
+    Dataset do upload, processado uma única vez por conteúdo. ``builder(caminho)``
+    recebe o arquivo gravado e devolve o DataFrame (ou None em caso de falha).
+    Devolve ``(df, versão, reaproveitado)``, em que ``reaproveitado`` indica
+    que o conteúdo já tinha sido processado antes.
+    """
+    digest, caminho = spool(kind, fileobj, file_id)
+    processado = []
+
+    def construir():
+        processado.append(True)
+        return builder(caminho)
+
+    df = shared_datasets.load_or_publish(dataset_name(kind, digest), digest, construir)
+    prune()
+    return df, f"upload-{digest}", not processado
+
+
+def prune(retencao=RETENCAO_SEGUNDOS, maximo=MAX_UPLOADS):
+    """Remove os uploads sem uso há mais de ``retencao`` segundos e os mais antigos além de ``maximo``"""
+    try:
+        nomes = [n for n in os.listdir(UPLOAD_DIR) if n.endswith(SUFIXO)]
+    except FileNotFoundError:
+        return 0
+    arquivos = []
+    for nome in nomes:
+        try:
+            arquivos.append((os.path.getmtime(os.path.join(UPLOAD_DIR, nome)), nome))
+        except FileNotFoundError:
+            continue
+    arquivos.sort(reverse=True)
+    limite = time.time() - retencao
+    removidos = [nome for i, (mtime, nome) in enumerate(arquivos) if i >= maximo or mtime < limite]
+    for nome in removidos:
+        kind, digest = nome[:-len(SUFIXO)].rsplit("-", 1)
+        try:
+            os.remove(os.path.join(UPLOAD_DIR, nome))
+        except FileNotFoundError:
+            pass
+        shared_datasets.discard(dataset_name(kind, digest))
+    if removidos:
+        with _lock:
+            for chave in [k for k, caminho in _conhecidos.items() if os.path.basename(caminho) in removidos]:
+                del _conhecidos[chave]
+    # Uploads removidos por outros processos
+    shared_datasets.detach_stale("-upload-")
+    return len(removidos)